@@ -0,0 +1,37 @@
+#!/bin/sh
+# Compares the WSGI and ASGI servers under concurrent load, on the database
+# of the current settings, e.g. after python manage.py seed_social_graph.
+#
+#   ./benchmark.sh [concurrency] [requests]
+#
+# Results are written to benchmark-wsgi.json and benchmark-asgi.json.
+
+CONCURRENCY=${1:-16}
+REQUESTS=${2:-2000}
+WORKERS=${WORKERS:-2}
+THREADS=${THREADS:-8}
+
+# Cached responses would hide the difference between the two.
+export GRAPHQL_RESPONSE_CACHE_TIMEOUT=0
+
+gunicorn twitter.wsgi:application --bind 127.0.0.1:8101 \
+    --workers $WORKERS --threads $THREADS --log-level warning &
+WSGI_PID=$!
+gunicorn twitter.asgi:application -k uvicorn.workers.UvicornWorker --bind 127.0.0.1:8102 \
+    --workers $WORKERS --log-level warning &
+ASGI_PID=$!
+trap 'kill $WSGI_PID $ASGI_PID' EXIT
+
+for port in 8101 8102; do
+    until python -c "import socket; socket.create_connection(('127.0.0.1', $port))" 2>/dev/null; do
+      sleep 0.1
+    done
+done
+
+echo "WSGI, $WORKERS workers of $THREADS threads"
+python manage.py replay_graphql --url http://localhost:8101/graphql/ \
+    --concurrency $CONCURRENCY --requests $REQUESTS --output benchmark-wsgi.json
+echo "ASGI, $WORKERS workers"
+python manage.py replay_graphql --url http://localhost:8102/graphql/ \
+    --concurrency $CONCURRENCY --requests $REQUESTS --output benchmark-asgi.json \
+    --compare benchmark-wsgi.json
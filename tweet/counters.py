@@ -0,0 +1,40 @@
+from django.db import transaction
+from twitter.loaders import count_by
+
+
+def reconcile_counters(tweet_model, batch_size=1000):
+    """
+    Recount likes, retweets and replies of every tweet and fix the
+    denormalized counter columns that drifted. Returns the number of
+    tweets that were corrected.
+    """
+    fixed = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                tweet_model.objects.select_for_update()
+                .filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", "likes_count", "retweets_count", "replies_count")[
+                    :batch_size
+                ]
+            )
+            if not batch:
+                return fixed
+            ids = [row[0] for row in batch]
+            actual = zip(
+                count_by(tweet_model.likes.through.objects, "tweet_id", ids),
+                count_by(tweet_model.retweets.through.objects, "tweet_id", ids),
+                count_by(tweet_model.objects, "comment_to_id", ids),
+            )
+            for row, counts in zip(batch, actual):
+                if tuple(row[1:]) != counts:
+                    likes_count, retweets_count, replies_count = counts
+                    tweet_model.objects.filter(pk=row[0]).update(
+                        likes_count=likes_count,
+                        retweets_count=retweets_count,
+                        replies_count=replies_count,
+                    )
+                    fixed += 1
+        last_id = ids[-1]
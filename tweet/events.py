@@ -0,0 +1,47 @@
+from twitter.pubsub import broker, receiver, send_on_commit
+from users.models import User
+
+from .models import Tweet
+
+
+def publish_tweet(tweet):
+    """
+    Once the transaction commits, send a new tweet to the subscribed
+    timelines it belongs in: its author's and their followers'.
+    """
+    send_on_commit("tweet_posted", tweet.id, tweet.user_id)
+
+
+@receiver("tweet_posted")
+def receive_tweet(tweet_id, author_id):
+    listening = broker.listening("timeline")
+    if not listening:
+        return
+    owners = set(
+        User.following.through.objects.filter(
+            to_user_id=author_id, from_user_id__in=listening
+        ).values_list("from_user_id", flat=True)
+    )
+    if author_id in listening:
+        owners.add(author_id)
+    if not owners:
+        return
+    tweet = Tweet.objects.filter(id=tweet_id).first()
+    if tweet is None:
+        return
+    for owner_id in owners:
+        broker.publish("timeline", owner_id, tweet)
+
+
+def publish_counts(tweet_id):
+    """Once the transaction commits, send the new counts of a tweet."""
+    send_on_commit("tweet_counts", tweet_id)
+
+
+@receiver("tweet_counts")
+def receive_counts(tweet_id):
+    if tweet_id not in broker.listening("tweet_counts"):
+        return
+    tweet = Tweet.objects.filter(id=tweet_id).first()
+    if tweet is not None:
+        broker.publish("tweet_counts", tweet_id, tweet)
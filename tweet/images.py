@@ -0,0 +1,150 @@
+import logging
+from datetime import timedelta
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+from twitter.response_cache import invalidate_responses
+
+from .models import Tweet, TweetImageVariant
+
+FORMAT, EXTENSION = ("WEBP", "webp") if features.check("webp") else ("JPEG", "jpg")
+# How long a worker owns the images it picked before another worker may
+# pick them again.
+LEASE = timedelta(minutes=10)
+# Errors of files Pillow can't decode, which no retry will fix.
+DECODE_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError)
+
+logger = logging.getLogger(__name__)
+
+
+def encode(image, quality):
+    output = BytesIO()
+    image.save(output, FORMAT, quality=quality)
+    return output.getvalue()
+
+
+def make_variants(data, widths, quality):
+    """
+    Re-encode an image at full size, and at each width narrower than the
+    original. Orientation from the EXIF data is applied to the pixels and
+    the metadata itself, camera details and GPS position included, is
+    dropped. Returns the full size image and the [(width, data)] variants.
+    The variants are the image itself when it is narrower than all widths.
+    Runs in a worker process, so it only deals with bytes.
+    """
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    image = image.convert("RGBA" if FORMAT == "WEBP" and "A" in image.getbands() else "RGB")
+    original = encode(image, quality)
+    sizes = [width for width in sorted(widths) if width < image.width]
+    if not sizes:
+        return original, [(image.width, original)]
+    variants = []
+    for width in sizes:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        variants.append((width, encode(resized, quality)))
+    return original, variants
+
+
+def claim_batch(batch_size):
+    """
+    Pending images no other worker is processing, leased to this one. The
+    lease runs out if it dies, and on failures that may pass.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        tweets = list(
+            Tweet.objects.select_for_update(skip_locked=True)
+            .filter(image_pending=True)
+            .filter(Q(image_leased_until=None) | Q(image_leased_until__lte=now))
+            .order_by("id")[:batch_size]
+        )
+        Tweet.objects.filter(id__in=[tweet.id for tweet in tweets]).update(
+            image_leased_until=now + LEASE
+        )
+    return tweets
+
+
+def store_images(tweet, original, variants):
+    """
+    Replace the upload of tweet by original, or drop it when None, and add
+    its variants. The upload is deleted once this commits.
+    """
+    upload = tweet.image.name
+    stem = upload.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    with transaction.atomic():
+        if original is None:
+            tweet.image = None
+        else:
+            tweet.image.save(f"{stem}.{EXTENSION}", ContentFile(original), save=False)
+        for width, data in variants:
+            variant = TweetImageVariant(tweet=tweet, width=width)
+            variant.image.save(
+                f"{stem}_{width}.{EXTENSION}", ContentFile(data), save=False
+            )
+            variant.save()
+        Tweet.objects.filter(id=tweet.id).update(
+            image=tweet.image.name or "", image_pending=False
+        )
+        transaction.on_commit(partial(tweet.image.storage.delete, upload))
+
+
+def process_images(executor, batch_size):
+    """
+    Make the variants of one batch of pending tweet images in the executor's
+    worker processes. The uploaded file is replaced by its re-encoded copy,
+    so the metadata never stays in storage; images Pillow can't decode are
+    dropped. Images that failed for any other reason are retried once their
+    lease runs out. Returns the number of images processed and failed.
+    """
+    tweets = claim_batch(batch_size)
+    jobs = []
+    for tweet in tweets:
+        try:
+            with tweet.image.open("rb") as image:
+                data = image.read()
+        except OSError:
+            logger.exception("Couldn't read the image of tweet %s", tweet.id)
+            jobs.append(None)
+            continue
+        jobs.append(
+            executor.submit(
+                make_variants,
+                data,
+                settings.TWEET_IMAGE_WIDTHS,
+                settings.TWEET_IMAGE_QUALITY,
+            )
+        )
+    processed = failed = 0
+    for tweet, job in zip(tweets, jobs):
+        if job is None:
+            failed += 1
+            continue
+        try:
+            original, variants = job.result()
+        except DECODE_ERRORS:
+            # Not an image, it may still hold metadata so drop it.
+            original, variants = None, []
+        except Exception:
+            logger.exception("Couldn't process the image of tweet %s", tweet.id)
+            failed += 1
+            continue
+        try:
+            store_images(tweet, original, variants)
+        except Exception:
+            logger.exception("Couldn't store the images of tweet %s", tweet.id)
+            failed += 1
+            continue
+        if original is None:
+            failed += 1
+        else:
+            processed += 1
+    if processed or failed:
+        invalidate_responses()
+    return processed, failed
@@ -0,0 +1,35 @@
+from collections import defaultdict
+
+from twitter.loaders import RequestLoader
+
+from .models import Tweet, TweetImageVariant
+
+
+class ImageVariantsLoader(RequestLoader):
+    def load_batch(self, keys):
+        variants = defaultdict(list)
+        for variant in TweetImageVariant.objects.filter(tweet_id__in=keys):
+            variants[variant.tweet_id].append(variant)
+        return [variants[key] for key in keys]
+
+
+class TweetLoader(RequestLoader):
+    def load_batch(self, keys):
+        tweets = Tweet.objects.in_bulk(keys)
+        return [tweets.get(key) for key in keys]
+
+
+class LikedLoader(RequestLoader):
+    """Loads whether the current user likes each tweet."""
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.viewer = request.user
+
+    def load_batch(self, keys):
+        liked = set(
+            Tweet.likes.through.objects.filter(
+                user_id=self.viewer.id, tweet_id__in=keys
+            ).values_list("tweet_id", flat=True)
+        )
+        return [key in liked for key in keys]
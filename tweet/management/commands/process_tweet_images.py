@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from tweet.images import process_images
+
+
+class Command(BaseCommand):
+    help = "Makes the resized variants of newly uploaded tweet images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="Number of images read from the queue at once",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of processes resizing images, defaults to the CPU count",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the queue instead of exiting once it is drained",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait when the queue is empty, with --loop",
+        )
+
+    def handle(self, batch_size, workers, loop, interval, *args, **options):
+        total_processed = total_failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                processed, failed = process_images(executor, batch_size)
+                total_processed += processed
+                total_failed += failed
+                if processed or failed:
+                    self.stdout.write(f"Processed {processed}, failed {failed}")
+                    continue
+                if not loop:
+                    break
+                time.sleep(interval)
+        msg = f"Successfully processed {total_processed} images, {total_failed} failed"
+        self.stdout.write(self.style.SUCCESS(msg))
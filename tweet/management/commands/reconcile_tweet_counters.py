@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import pluralize
+from tweet.counters import reconcile_counters
+from tweet.models import Tweet
+
+
+class Command(BaseCommand):
+    help = "Recounts likes, retweets and replies of every tweet and fixes drifted counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of tweets checked per transaction",
+        )
+
+    def handle(self, batch_size, *args, **options):
+        fixed = reconcile_counters(Tweet, batch_size=batch_size)
+        msg = f"Successfully reconciled {fixed} tweet{pluralize(fixed)}"
+        self.stdout.write(self.style.SUCCESS(msg))
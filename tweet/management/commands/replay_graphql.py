@@ -0,0 +1,409 @@
+import json
+import random
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from graphql import parse
+from graphql.language.ast import OperationDefinition
+from graphql_jwt.shortcuts import get_token
+from users.models import User
+
+TWEET_FIELDS = """
+fragment TweetFields on TweetNode {
+  pk text image imageVariants { width url } createdAt
+  likesCount retweetCount commentsCount isLiked
+  commentTo { pk user { username } }
+  user { pk username displayName photo isSelf isFollowed isFollowing isRequested }
+}
+"""
+
+USER_FIELDS = """
+fragment UserFields on UserWithFollowNode {
+  pk username displayName photo bio isSelf isFollowed isFollowing isRequested
+  followersCount followingCount
+}
+"""
+
+# Operations of the frontend against a database filled by seed_social_graph.
+# "user" is who sends the operation, null for anonymous visitors, and one
+# of "variables" is picked at random for every request. Mutations are only
+# sent with --mutations.
+DEFAULT_MIX = [
+    {
+        "name": "PublicFeed",
+        "weight": 20,
+        "user": None,
+        "query": TWEET_FIELDS
+        + "query PublicFeed($first: Int) { tweets(first: $first, excludeComment: true)"
+        " { pageInfo { endCursor hasNextPage } edges { node { ...TweetFields } } } }",
+        "variables": [{"first": 20}],
+    },
+    {
+        "name": "Timeline",
+        "weight": 30,
+        "user": "seed1",
+        "query": TWEET_FIELDS
+        + "query Timeline($first: Int) { tweets(first: $first, timeline: true)"
+        " { pageInfo { endCursor hasNextPage } edges { node { ...TweetFields } } } }",
+        "variables": [{"first": 20}],
+    },
+    {
+        "name": "ProfileTweets",
+        "weight": 15,
+        "user": "seed1",
+        "query": TWEET_FIELDS
+        + "query ProfileTweets($username: String, $first: Int)"
+        " { tweets(first: $first, username: $username)"
+        " { pageInfo { endCursor hasNextPage } edges { node { ...TweetFields } } } }",
+        "variables": [{"username": f"seed{i}", "first": 20} for i in range(10)],
+    },
+    {
+        "name": "SearchTweets",
+        "weight": 5,
+        "user": "seed1",
+        "query": TWEET_FIELDS
+        + "query SearchTweets($query: String!, $first: Int)"
+        " { searchTweets(query: $query, first: $first)"
+        " { pageInfo { endCursor hasNextPage } edges { node { ...TweetFields } } } }",
+        "variables": [
+            {"query": query, "first": 20}
+            for query in ("coffee", "python graphql", "monday weather", "the")
+        ],
+    },
+    {
+        "name": "SearchUsers",
+        "weight": 5,
+        "user": "seed1",
+        "query": USER_FIELDS
+        + "query SearchUsers($prefix: String!)"
+        " { searchUsers(prefix: $prefix) { ...UserFields } }",
+        "variables": [{"prefix": prefix} for prefix in ("s", "seed1", "seed12", "seed123")],
+    },
+    {
+        "name": "Profile",
+        "weight": 10,
+        "user": "seed1",
+        "query": USER_FIELDS
+        + "query Profile($username: String!) { user(username: $username) { ...UserFields } }",
+        "variables": [{"username": f"seed{i}"} for i in range(10)],
+    },
+    {
+        "name": "Followers",
+        "weight": 5,
+        "user": "seed1",
+        "query": USER_FIELDS
+        + "query Followers($uname: String!) { followers(first: 20, uname: $uname)"
+        " { pageInfo { endCursor hasNextPage } edges { node { ...UserFields } } } }",
+        "variables": [{"uname": f"seed{i}"} for i in range(10)],
+    },
+    {
+        "name": "Following",
+        "weight": 5,
+        "user": "seed1",
+        "query": USER_FIELDS
+        + "query Following($uname: String!) { following(first: 20, uname: $uname)"
+        " { pageInfo { endCursor hasNextPage } edges { node { ...UserFields } } } }",
+        "variables": [{"uname": f"seed{i}"} for i in range(10)],
+    },
+    {
+        "name": "Unfollowed",
+        "weight": 5,
+        "user": "seed1",
+        "query": USER_FIELDS
+        + "query Unfollowed { unfollowed(first: 5) { edges { node { ...UserFields } } } }",
+        "variables": [{}],
+    },
+    {
+        "name": "PendingFollowRequests",
+        "weight": 2,
+        "user": "seed1",
+        "query": USER_FIELDS
+        + "query PendingFollowRequests { pendingFollowRequests(first: 20)"
+        " { pageInfo { endCursor hasNextPage } edges { node { ...UserFields } } } }",
+        "variables": [{}],
+    },
+    {
+        "name": "Me",
+        "weight": 5,
+        "user": "seed1",
+        "query": USER_FIELDS + "query Me { me { ...UserFields } }",
+        "variables": [{}],
+    },
+    {
+        "name": "LikeTweet",
+        "weight": 3,
+        "user": "seed2",
+        "query": "mutation LikeTweet($id: Int!) { likeTweet(tweetId: $id) { success isLiked } }",
+        "variables": [{"id": i} for i in range(1, 50)],
+    },
+    {
+        "name": "PostTweet",
+        "weight": 2,
+        "user": "seed2",
+        "query": "mutation PostTweet($text: String!) { postTweet(text: $text) { success } }",
+        "variables": [{"text": "benchmark tweet"}],
+    },
+]
+
+
+class ClientTarget:
+    """Sends requests through the Django test client, in this process."""
+
+    def __init__(self):
+        setup_test_environment()
+        self.client = Client()
+
+    def post(self, body, token):
+        stats = {"queries": 0}
+
+        def count_queries(execute, sql, params, many, context):
+            stats["queries"] += 1
+            return execute(sql, params, many, context)
+
+        headers = {"HTTP_AUTHORIZATION": f"JWT {token}"} if token else {}
+        with connection.execute_wrapper(count_queries):
+            start = time.perf_counter()
+            response = self.client.post(
+                "/graphql/", body, content_type="application/json", **headers
+            )
+            elapsed = time.perf_counter() - start
+        return response.status_code, response.content, elapsed, stats["queries"]
+
+
+class UrlTarget:
+    """Sends requests to a running server, SQL statements can't be counted."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def post(self, body, token):
+        request = urllib.request.Request(
+            self.url, data=body.encode(), headers={"Content-Type": "application/json"}
+        )
+        if token:
+            request.add_header("Authorization", f"JWT {token}")
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, content = error.code, error.read()
+        return status, content, time.perf_counter() - start, None
+
+
+def is_mutation(operation):
+    return any(
+        isinstance(definition, OperationDefinition) and definition.operation == "mutation"
+        for definition in parse(operation["query"]).definitions
+    )
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def summarize(samples, duration):
+    latencies = sorted(sample["latency"] for sample in samples)
+    queries = [sample["queries"] for sample in samples if sample["queries"] is not None]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample["error"]),
+        "throughput": len(samples) / duration if duration else None,
+        "mean": sum(latencies) / len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1],
+        "sql_queries": {
+            "mean": sum(queries) / len(queries),
+            "max": max(queries),
+        }
+        if queries
+        else None,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Replays a weighted mix of GraphQL operations and reports their latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mix",
+            help="JSON file of the operations to replay, a list of objects with "
+            "name, weight, user, query and variables. Defaults to the frontend "
+            "operations against seed_social_graph data",
+        )
+        parser.add_argument(
+            "--url",
+            help="GraphQL URL of a running server, e.g. http://localhost:8000/graphql/. "
+            "Requests go through the test client when not given",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=1000, help="Number of measured requests"
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=50,
+            help="Number of requests sent before measuring",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of requests in flight at once, with --url",
+        )
+        parser.add_argument(
+            "--mutations",
+            action="store_true",
+            help="Also send the mutations of the mix, which write to the database",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument("--output", help="File to write the JSON results to")
+        parser.add_argument(
+            "--compare", help="JSON results of an earlier run to compare against"
+        )
+
+    def handle(self, *args, **options):
+        if options["mix"]:
+            with open(options["mix"]) as f:
+                mix = json.load(f)
+        else:
+            mix = DEFAULT_MIX
+        if not options["mutations"]:
+            mix = [operation for operation in mix if not is_mutation(operation)]
+        if not mix:
+            raise CommandError("No operations to replay, mutations need --mutations")
+        if options["url"]:
+            target = UrlTarget(options["url"])
+        else:
+            if options["concurrency"] != 1:
+                raise CommandError("--concurrency needs --url")
+            target = ClientTarget()
+
+        tokens = {}
+        for operation in mix:
+            username = operation.get("user")
+            if username and username not in tokens:
+                user = User.objects.filter(username=username).first()
+                if user is None:
+                    raise CommandError(f"User {username} of {operation['name']} doesn't exist")
+                tokens[username] = get_token(user)
+
+        rng = random.Random(options["seed"])
+        plan = [
+            (operation, rng.choice(operation.get("variables") or [{}]))
+            for operation in rng.choices(
+                mix,
+                weights=[operation.get("weight", 1) for operation in mix],
+                k=options["warmup"] + options["requests"],
+            )
+        ]
+
+        def send(step):
+            operation, variables = step
+            body = json.dumps(
+                {
+                    "query": operation["query"],
+                    "variables": variables,
+                    "operationName": operation.get("operationName"),
+                }
+            )
+            status, content, latency, queries = target.post(
+                body, tokens.get(operation.get("user"))
+            )
+            try:
+                error = status != 200 or "errors" in json.loads(content)
+            except ValueError:
+                error = True
+            return {
+                "operation": operation["name"],
+                "latency": latency,
+                "queries": queries,
+                "error": error,
+            }
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            list(executor.map(send, plan[: options["warmup"]]))
+            start = time.perf_counter()
+            samples = list(executor.map(send, plan[options["warmup"] :]))
+            duration = time.perf_counter() - start
+
+        results = {
+            "commit": get_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "target": options["url"] or "test client",
+            "concurrency": options["concurrency"],
+            "seed": options["seed"],
+            "total": summarize(samples, duration),
+            "operations": {
+                operation["name"]: summarize(
+                    [s for s in samples if s["operation"] == operation["name"]], duration
+                )
+                for operation in mix
+                if any(s["operation"] == operation["name"] for s in samples)
+            },
+        }
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+        self.print_results(results, baseline)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+        msg = (
+            f"Successfully replayed {results['total']['requests']} requests, "
+            f"{results['total']['throughput']:.1f} per second"
+        )
+        self.stdout.write(self.style.SUCCESS(msg))
+
+    def print_results(self, results, baseline=None):
+        self.stdout.write(
+            f"{'operation':<16}{'requests':>9}{'errors':>7}{'p50 ms':>9}"
+            f"{'p95 ms':>9}{'p99 ms':>9}{'sql':>7}"
+            + (f"{'p95 change':>12}" if baseline else "")
+        )
+        rows = [*results["operations"].items(), ("total", results["total"])]
+        for name, summary in rows:
+            sql = summary["sql_queries"]
+            line = (
+                f"{name:<16}{summary['requests']:>9}{summary['errors']:>7}"
+                f"{summary['p50'] * 1000:>9.1f}{summary['p95'] * 1000:>9.1f}"
+                f"{summary['p99'] * 1000:>9.1f}"
+                + (f"{sql['mean']:>7.1f}" if sql else f"{'-':>7}")
+            )
+            if baseline:
+                before = (
+                    baseline["total"]
+                    if name == "total"
+                    else baseline["operations"].get(name)
+                )
+                if before:
+                    change = (summary["p95"] - before["p95"]) / before["p95"] * 100
+                    line += f"{change:>+11.1f}%"
+            self.stdout.write(line)
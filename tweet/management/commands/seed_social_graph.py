@@ -0,0 +1,337 @@
+import math
+import random
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from graphql_auth.models import UserStatus
+from tweet.counters import reconcile_counters
+from tweet.models import TimelineEntry, Tweet
+from users.counters import reconcile_follow_counters
+from users.models import User, get_search_key
+from users.suggestions import rebuild_suggestions
+
+WORDS = (
+    "the a of to and in is it you that was for on are with as I his they be at "
+    "one have this from or had by hot word but what some we can out other were "
+    "all there when up use your how said an each she which do their time if will "
+    "way about many then them write would like so these her long make thing see "
+    "him two has look more day could go come did number sound no most people my "
+    "over know water than call first who may down side been now find django "
+    "python graphql tweet follow timeline coffee music football weather monday"
+).split()
+
+
+class PowerLaw:
+    """
+    Draws indexes in range(n) where the k-th most popular one is picked with
+    probability proportional to k ** -exponent. Popularity ranks are spread
+    over the indexes by a fixed permutation, so the popular rows are not all
+    the oldest ones.
+    """
+
+    def __init__(self, rng, n, exponent):
+        self.rng = rng
+        self.n = n
+        self.exponent = exponent
+        self.step = next(p for p in (1000003, 999983, 1000033) if math.gcd(p, n) == 1)
+
+    def draw(self):
+        u = self.rng.random()
+        if self.exponent == 1:
+            rank = self.n ** u
+        else:
+            power = 1 - self.exponent
+            rank = ((self.n ** power - 1) * u + 1) ** (1 / power)
+        rank = min(int(rank) - 1, self.n - 1)
+        return rank * self.step % self.n
+
+
+class Command(BaseCommand):
+    help = "Fills the database with a synthetic social graph for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000, help="Number of users")
+        parser.add_argument(
+            "--follows",
+            type=float,
+            default=50,
+            help="Mean number of accounts each user follows",
+        )
+        parser.add_argument(
+            "--follow-shape",
+            type=float,
+            default=2,
+            help="Pareto shape of how many accounts users follow, lower is more skewed",
+        )
+        parser.add_argument(
+            "--popularity",
+            type=float,
+            default=1,
+            help="Power-law exponent of who gets followed",
+        )
+        parser.add_argument("--tweets", type=int, default=100000, help="Number of tweets")
+        parser.add_argument(
+            "--activity",
+            type=float,
+            default=1,
+            help="Power-law exponent of who tweets",
+        )
+        parser.add_argument(
+            "--reply-ratio",
+            type=float,
+            default=0.3,
+            help="Share of tweets that reply to an earlier tweet",
+        )
+        parser.add_argument("--likes", type=int, default=500000, help="Number of likes")
+        parser.add_argument(
+            "--retweets", type=int, default=100000, help="Number of retweets"
+        )
+        parser.add_argument(
+            "--engagement",
+            type=float,
+            default=1.1,
+            help="Power-law exponent of which tweets get likes, retweets and replies",
+        )
+        parser.add_argument(
+            "--private-ratio",
+            type=float,
+            default=0.1,
+            help="Share of private accounts",
+        )
+        parser.add_argument(
+            "--request-ratio",
+            type=float,
+            default=0.2,
+            help="Share of follows of private accounts left as pending requests",
+        )
+        parser.add_argument(
+            "--prefix", default="seed", help="Prefix of the generated usernames"
+        )
+        parser.add_argument(
+            "--password", default="password", help="Password of every generated user"
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Number of rows inserted per statement",
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        if options["users"] < 2:
+            raise CommandError("At least two users are needed")
+        if User.objects.filter(username=f"{options['prefix']}0").exists():
+            raise CommandError(
+                f"Users prefixed {options['prefix']} already exist, use another --prefix"
+            )
+
+        user_ids, private = self.create_users()
+        follows, requests = self.create_follows(user_ids, private)
+        self.log("Counting followers and following")
+        reconcile_follow_counters(User, batch_size=self.batch_size)
+        tweet_ids = self.create_tweets(user_ids)
+        if tweet_ids:
+            likes = self.create_engagement(
+                "likes", Tweet.likes.through, options["likes"], user_ids, tweet_ids
+            )
+            retweets = self.create_engagement(
+                "retweets", Tweet.retweets.through, options["retweets"], user_ids, tweet_ids
+            )
+            self.log("Counting likes, retweets and replies")
+            reconcile_counters(Tweet, batch_size=self.batch_size)
+            self.fill_timelines(tweet_ids)
+        else:
+            likes = retweets = 0
+        self.log("Building follow suggestions")
+        rebuild_suggestions(batch_size=self.batch_size)
+        msg = (
+            f"Successfully seeded {len(user_ids)} users, {follows} follows, "
+            f"{requests} follow requests, {len(tweet_ids)} tweets, {likes} likes "
+            f"and {retweets} retweets"
+        )
+        self.stdout.write(self.style.SUCCESS(msg))
+
+    def log(self, message):
+        if self.options["verbosity"] > 0:
+            self.stdout.write(message)
+
+    def insert(self, rows, ignore_conflicts=False):
+        """
+        Insert rows, usually a generator, a batch per model at a time so only
+        one batch of each is in memory. Returns the number of rows per model.
+        """
+        batches = defaultdict(list)
+        counts = defaultdict(int)
+        for row in rows:
+            batch = batches[type(row)]
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                type(row).objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+                counts[type(row)] += len(batch)
+                batch.clear()
+        for model, batch in batches.items():
+            model.objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+            counts[model] += len(batch)
+        return counts
+
+    def create_users(self):
+        prefix = self.options["prefix"]
+        password = make_password(self.options["password"])
+        private = bytearray(
+            self.rng.random() < self.options["private_ratio"]
+            for _ in range(self.options["users"])
+        )
+        self.log(f"Creating {len(private)} users")
+        # bulk_create doesn't call save, which sets the search keys.
+        self.insert(
+            User(
+                username=f"{prefix}{i}",
+                email=f"{prefix}{i}@example.com",
+                display_name=f"{prefix.title()} {i}",
+                password=password,
+                private=bool(private[i]),
+                username_key=get_search_key(f"{prefix}{i}"),
+                display_name_key=get_search_key(f"{prefix.title()} {i}"),
+            )
+            for i in range(len(private))
+        )
+        # bulk_create doesn't return ids on every database, read them back in
+        # creation order.
+        first_id = User.objects.get(username=f"{prefix}0").id
+        user_ids = array(
+            "q",
+            User.objects.filter(id__gte=first_id, username__startswith=prefix)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .iterator(chunk_size=self.batch_size),
+        )
+        self.insert(UserStatus(user_id=user_id, verified=True) for user_id in user_ids)
+        return user_ids, private
+
+    def create_follows(self, user_ids, private):
+        n = len(user_ids)
+        shape = self.options["follow_shape"]
+        scale = self.options["follows"] * (shape - 1) / shape if shape > 1 else 1
+        popularity = PowerLaw(self.rng, n, self.options["popularity"])
+
+        def rows():
+            for i, follower_id in enumerate(user_ids):
+                count = min(int(scale * self.rng.paretovariate(shape)), n - 1)
+                followed = set()
+                # Distinct accounts are drawn until count is reached, or
+                # until it is clear the rare ones won't come up.
+                for _ in range(count * 4):
+                    if len(followed) == count:
+                        break
+                    j = popularity.draw()
+                    if j != i:
+                        followed.add(j)
+                for j in followed:
+                    if private[j] and self.rng.random() < self.options["request_ratio"]:
+                        # Rows of follow_requests go from the private account
+                        # to the user asking to follow it.
+                        yield User.follow_requests.through(
+                            from_user_id=user_ids[j], to_user_id=follower_id
+                        )
+                    else:
+                        yield User.following.through(
+                            from_user_id=follower_id, to_user_id=user_ids[j]
+                        )
+
+        self.log("Creating follows")
+        counts = self.insert(rows())
+        return counts[User.following.through], counts[User.follow_requests.through]
+
+    def create_tweets(self, user_ids):
+        total = self.options["tweets"]
+        activity = PowerLaw(self.rng, len(user_ids), self.options["activity"])
+        last_id = Tweet.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        tweet_ids = array("q")
+        self.log(f"Creating {total} tweets")
+        created = 0
+        while created < total:
+            size = min(self.batch_size, total - created)
+            if tweet_ids:
+                engagement = PowerLaw(self.rng, len(tweet_ids), self.options["engagement"])
+            batch = []
+            for _ in range(size):
+                comment_to_id = None
+                if tweet_ids and self.rng.random() < self.options["reply_ratio"]:
+                    comment_to_id = tweet_ids[engagement.draw()]
+                batch.append(
+                    Tweet(
+                        user_id=user_ids[activity.draw()],
+                        text=" ".join(self.rng.choices(WORDS, k=self.rng.randint(3, 30))),
+                        comment_to_id=comment_to_id,
+                    )
+                )
+            Tweet.objects.bulk_create(batch)
+            new_ids = list(
+                Tweet.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+            tweet_ids.extend(new_ids)
+            last_id = new_ids[-1]
+            created += size
+        return tweet_ids
+
+    def create_engagement(self, name, through, total, user_ids, tweet_ids):
+        """Likes or retweets of popular tweets by random users."""
+        engagement = PowerLaw(self.rng, len(tweet_ids), self.options["engagement"])
+        self.log(f"Creating {total} {name}")
+        self.insert(
+            (
+                through(
+                    tweet_id=tweet_ids[engagement.draw()],
+                    user_id=user_ids[self.rng.randrange(len(user_ids))],
+                )
+                for _ in range(total)
+            ),
+            ignore_conflicts=True,
+        )
+        # Drawing the same pair twice makes one row, count what was kept.
+        return through.objects.filter(tweet_id__gte=tweet_ids[0]).count()
+
+    def fill_timelines(self, tweet_ids):
+        """
+        Copy the tweets into the timelines of their author and followers, as
+        fan_out does when a tweet is posted.
+        """
+        self.log("Filling timelines")
+        high_fanout = User.objects.filter(
+            followers_count__gt=settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+        ).values("id")
+        Tweet.objects.filter(id__gte=tweet_ids[0], user_id__in=high_fanout).update(
+            fanned_out=False
+        )
+
+        quote_name = connection.ops.quote_name
+        timeline = quote_name(TimelineEntry._meta.db_table)
+        tweet = quote_name(Tweet._meta.db_table)
+        following = quote_name(User.following.through._meta.db_table)
+        for start in range(0, len(tweet_ids), self.batch_size):
+            first_id = tweet_ids[start]
+            last_id = tweet_ids[min(start + self.batch_size, len(tweet_ids)) - 1]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {timeline} (owner_id, tweet_id, created_at) "
+                    f"SELECT user_id, id, created_at FROM {tweet} "
+                    f"WHERE id BETWEEN %s AND %s",
+                    [first_id, last_id],
+                )
+                cursor.execute(
+                    f"INSERT INTO {timeline} (owner_id, tweet_id, created_at) "
+                    f"SELECT f.from_user_id, t.id, t.created_at FROM {tweet} t "
+                    f"INNER JOIN {following} f ON f.to_user_id = t.user_id "
+                    f"WHERE t.id BETWEEN %s AND %s AND t.fanned_out = %s",
+                    [first_id, last_id, True],
+                )
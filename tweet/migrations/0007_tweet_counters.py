@@ -0,0 +1,65 @@
+# Generated by Django 3.2.5 on 2026-10-18 09:59
+
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def count_by(queryset, field, keys):
+    counts = dict(
+        queryset.filter(**{f"{field}__in": keys})
+        .order_by()
+        .values_list(field)
+        .annotate(count=Count("pk"))
+    )
+    return [counts.get(key, 0) for key in keys]
+
+
+def fill_counters(apps, schema_editor):
+    Tweet = apps.get_model("tweet", "Tweet")
+    tweet_ids = Tweet.objects.order_by("pk").values_list("pk", flat=True)
+    last_id = 0
+    while True:
+        ids = list(tweet_ids.filter(pk__gt=last_id)[:BATCH_SIZE])
+        if not ids:
+            return
+        counts = zip(
+            count_by(Tweet.likes.through.objects, "tweet_id", ids),
+            count_by(Tweet.retweets.through.objects, "tweet_id", ids),
+            count_by(Tweet.objects, "comment_to_id", ids),
+        )
+        for tweet_id, (likes_count, retweets_count, replies_count) in zip(ids, counts):
+            if likes_count or retweets_count or replies_count:
+                Tweet.objects.filter(pk=tweet_id).update(
+                    likes_count=likes_count,
+                    retweets_count=retweets_count,
+                    replies_count=replies_count,
+                )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet', '0006_alter_tweet_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='likes_count',
+            field=models.IntegerField(default=0, verbose_name='Likes count'),
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='replies_count',
+            field=models.IntegerField(default=0, verbose_name='Replies count'),
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='retweets_count',
+            field=models.IntegerField(default=0, verbose_name='Retweets count'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 3.2.5 on 2026-10-18 10:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The TIMELINE_BACKFILL_LIMIT default when this migration was written.
+BACKFILL_LIMIT = 200
+
+
+def fill_timelines(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    Tweet = apps.get_model("tweet", "Tweet")
+    TimelineEntry = apps.get_model("tweet", "TimelineEntry")
+    for owner in User.objects.iterator():
+        author_ids = [owner.id, *owner.following.values_list("id", flat=True)]
+        tweets = (
+            Tweet.objects.filter(user_id__in=author_ids)
+            .order_by("-created_at")
+            .values_list("id", "created_at")[:BACKFILL_LIMIT]
+        )
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(owner=owner, tweet_id=tweet_id, created_at=created_at)
+                for tweet_id, created_at in tweets
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tweet', '0007_tweet_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='Created at')),
+            ],
+            options={
+                'verbose_name': 'Timeline entry',
+                'verbose_name_plural': 'Timeline entries',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='fanned_out',
+            field=models.BooleanField(default=True, verbose_name='Copied to follower timelines'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['fanned_out', 'user', '-created_at'], name='tweet_fanned_out_user_idx'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', related_query_name='timeline_entries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='tweet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', related_query_name='timeline_entries', to='tweet.tweet'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['owner', '-created_at'], name='timeline_owner_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('owner', 'tweet'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.5 on 2026-10-18 10:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+import tweet.models
+
+
+def queue_existing_images(apps, schema_editor):
+    Tweet = apps.get_model("tweet", "Tweet")
+    Tweet.objects.exclude(image="").exclude(image=None).update(image_pending=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet', '0009_tweet_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TweetImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField(verbose_name='Width')),
+                ('image', models.ImageField(max_length=500, upload_to=tweet.models.get_variant_directory)),
+            ],
+            options={
+                'verbose_name': 'Tweet image variant',
+                'verbose_name_plural': 'Tweet image variants',
+                'ordering': ['width'],
+            },
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='image_pending',
+            field=models.BooleanField(default=False, verbose_name='Image waiting for processing'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['image_pending', 'id'], name='tweet_image_pending_idx'),
+        ),
+        migrations.AddField(
+            model_name='tweetimagevariant',
+            name='tweet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_variants', related_query_name='image_variants', to='tweet.tweet'),
+        ),
+        migrations.RunPython(queue_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import tweet.models
+
+# Kept in sync with the tweet table by triggers, as FTS5 tables with
+# external content are not updated on their own.
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE tweet_tweet_search USING fts5("
+    "text, content='tweet_tweet', content_rowid='id', tokenize='unicode61')",
+    "CREATE TRIGGER tweet_tweet_search_insert AFTER INSERT ON tweet_tweet BEGIN "
+    "INSERT INTO tweet_tweet_search (rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER tweet_tweet_search_delete AFTER DELETE ON tweet_tweet BEGIN "
+    "INSERT INTO tweet_tweet_search (tweet_tweet_search, rowid, text) "
+    "VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER tweet_tweet_search_update AFTER UPDATE OF text ON tweet_tweet BEGIN "
+    "INSERT INTO tweet_tweet_search (tweet_tweet_search, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "INSERT INTO tweet_tweet_search (rowid, text) VALUES (new.id, new.text); END",
+    "INSERT INTO tweet_tweet_search (tweet_tweet_search) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER tweet_tweet_search_update",
+    "DROP TRIGGER tweet_tweet_search_delete",
+    "DROP TRIGGER tweet_tweet_search_insert",
+    "DROP TABLE tweet_tweet_search",
+]
+
+MYSQL_CREATE = ["CREATE FULLTEXT INDEX tweet_text_search_idx ON tweet_tweet (text)"]
+
+MYSQL_DROP = ["DROP INDEX tweet_text_search_idx ON tweet_tweet"]
+
+
+# Other databases have no search index, tweet.search filters the text instead.
+def run(statements):
+    def run_statements(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement)
+
+    return run_statements
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet', '0010_tweet_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TweetSearchEntry',
+            fields=[
+                ('tweet', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='tweet.tweet')),
+                ('text', tweet.models.SearchTextField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'tweet_tweet_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(
+            run({"sqlite": SQLITE_CREATE, "mysql": MYSQL_CREATE}),
+            run({"sqlite": SQLITE_DROP, "mysql": MYSQL_DROP}),
+        ),
+    ]
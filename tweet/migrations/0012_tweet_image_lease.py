@@ -0,0 +1,43 @@
+# Generated by Django 3.2.5 on 2026-10-18 12:06
+
+from django.db import migrations, models
+
+# SQLite adds a column by remaking the tweet table, which drops the triggers
+# keeping the search index of 0011_tweet_search in sync. They are created
+# again on the new table, whose rows and ids are the same.
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS tweet_tweet_search_insert AFTER INSERT ON tweet_tweet "
+    "BEGIN INSERT INTO tweet_tweet_search (rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS tweet_tweet_search_delete AFTER DELETE ON tweet_tweet "
+    "BEGIN INSERT INTO tweet_tweet_search (tweet_tweet_search, rowid, text) "
+    "VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS tweet_tweet_search_update AFTER UPDATE OF text "
+    "ON tweet_tweet BEGIN "
+    "INSERT INTO tweet_tweet_search (tweet_tweet_search, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "INSERT INTO tweet_tweet_search (rowid, text) VALUES (new.id, new.text); END",
+]
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in SQLITE_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet', '0011_tweet_search'),
+    ]
+
+    operations = [
+        # Removing the column on the way back remakes the table too.
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='tweet',
+            name='image_leased_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Image processing leased until'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -7,6 +7,10 @@ def get_image_directory(instance, filename: str):
     return f"tweet/{instance.user.id}/{filename}"
 
 
+def get_variant_directory(instance, filename: str):
+    return f"tweet/{instance.tweet.user_id}/variants/{filename}"
+
+
 class Tweet(models.Model):
     user = models.ForeignKey(
         User,
@@ -25,12 +29,20 @@ class Tweet(models.Model):
         null=True,
     )
     image = models.ImageField(upload_to=get_image_directory, null=True, blank=True, max_length=500)
+    image_pending = models.BooleanField(_("Image waiting for processing"), default=False)
+    image_leased_until = models.DateTimeField(
+        _("Image processing leased until"), blank=True, null=True
+    )
     likes = models.ManyToManyField(
         User, related_name="likes", related_query_name="likes", blank=True
     )
     retweets = models.ManyToManyField(
         User, related_name="retweets", related_query_name="retweets", blank=True
     )
+    likes_count = models.IntegerField(_("Likes count"), default=0)
+    retweets_count = models.IntegerField(_("Retweets count"), default=0)
+    replies_count = models.IntegerField(_("Replies count"), default=0)
+    fanned_out = models.BooleanField(_("Copied to follower timelines"), default=True)
 
     def have_access(self, user: User):
         return not self.user.private or self.user == user or (user.is_authenticated and self.user.followers.filter(id=user.id).exists())
@@ -39,3 +51,104 @@ class Tweet(models.Model):
         verbose_name = "Tweet"
         verbose_name_plural = "Tweets"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at"], name="tweet_created_idx"),
+            models.Index(fields=["user", "created_at"], name="tweet_user_created_idx"),
+            models.Index(
+                fields=["comment_to", "created_at"], name="tweet_comment_to_created_idx"
+            ),
+            models.Index(
+                fields=["fanned_out", "user", "-created_at"],
+                name="tweet_fanned_out_user_idx",
+            ),
+            models.Index(fields=["image_pending", "id"], name="tweet_image_pending_idx"),
+        ]
+
+
+class Match(models.Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class SearchTextField(models.TextField):
+    """Column of an FTS5 table, filtered with the match lookup."""
+
+
+SearchTextField.register_lookup(Match)
+
+
+class TweetSearchEntry(models.Model):
+    """
+    Row of the FTS5 table indexing the tweet text on SQLite, created with
+    the triggers filling it by migration 0011. MySQL uses a FULLTEXT index
+    on the tweet table instead, this table doesn't exist there.
+    """
+
+    tweet = models.OneToOneField(
+        Tweet,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="search_entry",
+    )
+    text = SearchTextField()
+    # The bm25 score of the row when filtered by text__match, lower for
+    # better matches.
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "tweet_tweet_search"
+
+
+class TweetImageVariant(models.Model):
+    tweet = models.ForeignKey(
+        Tweet,
+        on_delete=models.CASCADE,
+        related_name="image_variants",
+        related_query_name="image_variants",
+    )
+    width = models.PositiveIntegerField(_("Width"))
+    image = models.ImageField(upload_to=get_variant_directory, max_length=500)
+
+    class Meta:
+        verbose_name = "Tweet image variant"
+        verbose_name_plural = "Tweet image variants"
+        ordering = ["width"]
+
+
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        related_query_name="timeline_entries",
+        db_index=False,
+    )
+    tweet = models.ForeignKey(
+        Tweet,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        related_query_name="timeline_entries",
+    )
+    created_at = models.DateTimeField(_("Created at"))
+
+    class Meta:
+        verbose_name = "Timeline entry"
+        verbose_name_plural = "Timeline entries"
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "tweet"], name="unique_timeline_entry"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["owner", "created_at", "tweet"],
+                name="timeline_owner_created_idx",
+            ),
+        ]
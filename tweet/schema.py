@@ -1,22 +1,54 @@
 import graphene
 from django.conf import settings
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.db import transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 from graphene_django.filter.fields import DjangoFilterConnectionField
 from graphene_django.types import DjangoObjectType
 from graphene_file_upload.scalars import Upload
 from graphql_jwt.decorators import login_required
+from promise import Promise
+from twitter.loaders import get_loader
+from twitter.pagination import KeysetConnectionField
+from twitter.pubsub import subscribe
+from twitter.response_cache import invalidate_responses
+from users.loaders import UserLoader, VisibilityLoader
 from users.models import User
 from users.schema import UserWithFollowNode
 
+from .events import publish_counts, publish_tweet
+from .loaders import ImageVariantsLoader, LikedLoader, TweetLoader
 from .models import Tweet
+from .search import search_tweets
+from .timeline import fan_out, home_timeline
+
+
+# How many tweets a tweetCounts subscription can watch, about a screen.
+MAX_WATCHED_TWEETS = 100
+
+
+def get_media_url(info, name):
+    return f"{info.context.scheme}://{info.context.get_host()}{settings.MEDIA_URL}{name}"
+
+
+class ImageVariantType(graphene.ObjectType):
+    width = graphene.Int()
+    url = graphene.String()
 
 
 class TweetNode(DjangoObjectType):
     class Meta:
         model = Tweet
         fields = "__all__"
-        filter_fields = ("text", "user", "comment_to")
+        filter_fields = {
+            "text": ["exact"],
+            "user": ["exact"],
+            "comment_to": ["exact"],
+            "likes_count": ["gte"],
+            "retweets_count": ["gte"],
+            "replies_count": ["gte"],
+        }
         interfaces = (graphene.relay.Node,)
 
     pk = graphene.Int()
@@ -27,45 +59,89 @@ class TweetNode(DjangoObjectType):
     is_liked = graphene.Boolean()
     likes = DjangoFilterConnectionField(UserWithFollowNode)
     text = graphene.String()
+    image_variants = graphene.List(ImageVariantType)
 
     def resolve_pk(self, info):
         return self.pk
 
     def resolve_likes_count(self, info):
-        return self.likes.count()
+        return self.likes_count
 
     def resolve_retweet_count(self, info):
-        return self.retweets.count()
+        return self.retweets_count
 
     def resolve_comments_count(self, info):
-        return Tweet.objects.filter(comment_to__id=self.pk).count()
+        return self.replies_count
 
     def resolve_user(self, info):
-        return self.user
+        return get_loader(info, UserLoader).load(self.user_id)
+
+    def resolve_comment_to(self, info):
+        if self.comment_to_id is None:
+            return None
+        return get_loader(info, TweetLoader).load(self.comment_to_id)
 
     def resolve_likes(self, info):
         return self.likes
 
     def resolve_is_liked(self, info):
-        return (
-            info.context.user.is_authenticated
-            and Tweet.objects.filter(id=self.pk)
-            .filter(likes__id=info.context.user.id)
-            .first()
-            != None
-        )
+        if not info.context.user.is_authenticated:
+            return False
+        return get_loader(info, LikedLoader).load(self.pk)
 
     def resolve_text(self, info):
-        return self.text if self.have_access(info.context.user) else ""
+        return (
+            get_loader(info, VisibilityLoader)
+            .load(self.user_id)
+            .then(lambda visible: self.text if visible else "")
+        )
 
     def resolve_image(self, info):
-        if self.image and self.have_access(info.context.user):
-            return f"{info.context.scheme}://{info.context.get_host()}{settings.MEDIA_URL}{self.image}"
+        # The upload still holds its metadata until it is processed.
+        if not self.image or self.image_pending:
+            return None
+        url = get_media_url(info, self.image)
+        return (
+            get_loader(info, VisibilityLoader)
+            .load(self.user_id)
+            .then(lambda visible: url if visible else None)
+        )
+
+    def resolve_image_variants(self, info):
+        if not self.image:
+            return []
+        variants = get_loader(info, ImageVariantsLoader).load(self.pk)
+        return Promise.all(
+            [get_loader(info, VisibilityLoader).load(self.user_id), variants]
+        ).then(
+            lambda results: [
+                ImageVariantType(width=variant.width, url=get_media_url(info, variant.image))
+                for variant in results[1]
+            ]
+            if results[0]
+            else []
+        )
+
+
+class TweetSort(graphene.Enum):
+    LATEST = "latest"
+    MOST_LIKED = "most_liked"
+    MOST_RETWEETED = "most_retweeted"
+    MOST_REPLIED = "most_replied"
+
+
+TWEET_ORDERING = {
+    TweetSort.LATEST.value: ("-created_at",),
+    TweetSort.MOST_LIKED.value: ("-likes_count", "-created_at"),
+    TweetSort.MOST_RETWEETED.value: ("-retweets_count", "-created_at"),
+    TweetSort.MOST_REPLIED.value: ("-replies_count", "-created_at"),
+}
 
 
 class TweetQuery(graphene.ObjectType):
-    tweets = DjangoFilterConnectionField(TweetNode, comment_to_pk=graphene.Int(), username=graphene.String(), exclude_comment=graphene.Boolean(), timeline=graphene.Boolean())
+    tweets = KeysetConnectionField(TweetNode, comment_to_pk=graphene.Int(), username=graphene.String(), exclude_comment=graphene.Boolean(), timeline=graphene.Boolean(), sort=TweetSort())
     tweet = graphene.Field(TweetNode, id=graphene.Int(required=True))
+    search_tweets = KeysetConnectionField(TweetNode, query=graphene.String(required=True))
 
     def resolve_tweet(self, info, id=None):
         return get_object_or_404(Tweet, id=id)
@@ -81,46 +157,43 @@ class TweetQuery(graphene.ObjectType):
         exclude_comment=None,
         comment_to_pk=None,
         timeline=None,
+        sort=None,
         **kwargs
     ):
         if exclude_comment:
             queryset = Tweet.objects.filter(comment_to=None)
         else:
             queryset = Tweet.objects
+        if sort:
+            queryset = queryset.order_by(*TWEET_ORDERING[sort])
         # return Tweet.objects.all()
         if username is not None:
             requested_user = User.objects.filter(username=username).first()
             if not requested_user:
                 return queryset.none()
-            if requested_user.private and requested_user.id != info.context.user.id:
-                if (
-                    not info.context.user.is_authenticated
-                    or not requested_user.followers.filter(
-                        id=info.context.user.id
-                    ).exists()
-                ):
-                    return queryset.none()
-            return queryset.filter(user__username=username).all()
+            visible = get_loader(info, VisibilityLoader).load_now(requested_user.id)
+            if not visible:
+                return queryset.none()
+            return queryset.filter(user=requested_user).all()
 
         if timeline:
             if not info.context.user.is_authenticated:
                 return queryset.none()
-            result = queryset.filter(
-                user__in=info.context.user.following.all()
-            ) | queryset.filter(user=info.context.user)
-            return result.all()
+            return home_timeline(queryset, info.context.user)
 
         
         if comment_to_pk:
             if queryset.filter(id=comment_to_pk).exists():
                 queryset = queryset.filter(comment_to__id=comment_to_pk)
-                print(queryset.count())
                 return queryset.all()
             else:
                 return queryset.none()
         
         return queryset.filter(user__private=False).all()
 
+    def resolve_search_tweets(self, info, query, **kwargs):
+        return search_tweets(query, info.context.user)
+
 
 class RefetchMutation(graphene.Mutation):
     success = graphene.Boolean()
@@ -147,7 +220,13 @@ class DeleteTweet(graphene.Mutation):
         tweet = Tweet.objects.filter(user=info.context.user, id=id).first()
         if not tweet:
             return DeleteTweet(success=False)
-        tweet.delete()
+        with transaction.atomic():
+            if tweet.comment_to_id:
+                Tweet.objects.filter(id=tweet.comment_to_id).update(
+                    replies_count=F("replies_count") - 1
+                )
+            tweet.delete()
+            invalidate_responses()
         return DeleteTweet(success=True)
 
 
@@ -166,12 +245,20 @@ class PostTweet(graphene.Mutation):
         if not info.context.user.is_authenticated:
             return None
         tweet_to_comment = Tweet.objects.filter(id=comment_to).first()
-        new_tweet = Tweet(text=text, user=info.context.user, image=file, comment_to=tweet_to_comment)
+        new_tweet = Tweet(text=text, user=info.context.user, image=file, image_pending=bool(file), comment_to=tweet_to_comment)
         new_tweet.full_clean()
-        new_tweet.save()
-        if tweet_to_comment and tweet_to_comment.user != info.context.user:
-            user: User = tweet_to_comment.user
-            user.email_user(f"New reply from {info.context.user.username}", f"Click link to read more. https://arsaiz.xyz/tweets/{tweet_to_comment.id}")
+        with transaction.atomic():
+            new_tweet.save()
+            fan_out(new_tweet)
+            publish_tweet(new_tweet)
+            invalidate_responses()
+            if tweet_to_comment:
+                Tweet.objects.filter(id=tweet_to_comment.id).update(
+                    replies_count=F("replies_count") + 1
+                )
+            if tweet_to_comment and tweet_to_comment.user != info.context.user:
+                user: User = tweet_to_comment.user
+                user.queue_email(f"New reply from {info.context.user.username}", f"Click link to read more. https://arsaiz.xyz/tweets/{tweet_to_comment.id}")
         return PostTweet(tweet=new_tweet, success=True)
 
 
@@ -187,15 +274,20 @@ class LikeMutation(graphene.Mutation):
     def mutate(root, info, tweet_id):
         if not info.context.user.is_authenticated:
             return None
-        tweet_query = Tweet.objects.filter(id=tweet_id)
-        if not tweet_query.first():
-            return None
-        liked = tweet_query.filter(likes__id=info.context.user.id).first()
-        tweet = tweet_query.first()
-        if liked:
-            tweet.likes.remove(info.context.user)
-        else:
-            tweet.likes.add(info.context.user)
+        with transaction.atomic():
+            tweet = Tweet.objects.select_for_update().filter(id=tweet_id).first()
+            if not tweet:
+                return None
+            liked = tweet.likes.filter(id=info.context.user.id).exists()
+            if liked:
+                tweet.likes.remove(info.context.user)
+            else:
+                tweet.likes.add(info.context.user)
+            Tweet.objects.filter(id=tweet.id).update(
+                likes_count=F("likes_count") + (-1 if liked else 1)
+            )
+            publish_counts(tweet.id)
+            invalidate_responses()
         return LikeMutation(success=True, is_liked=not liked)
 
 
@@ -211,15 +303,20 @@ class RetweetMutation(graphene.Mutation):
     def mutate(root, info, tweet_id):
         if not info.context.user.is_authenticated:
             return None
-        tweet_query = Tweet.objects.filter(id=tweet_id)
-        if not tweet_query.first():
-            return None
-        retweeted = tweet_query.filter(retweets__id=info.context.user.id).first()
-        tweet = tweet_query.first()
-        if retweeted:
-            tweet.retweets.remove(info.context.user)
-        else:
-            tweet.retweets.add(info.context.user)
+        with transaction.atomic():
+            tweet = Tweet.objects.select_for_update().filter(id=tweet_id).first()
+            if not tweet:
+                return None
+            retweeted = tweet.retweets.filter(id=info.context.user.id).exists()
+            if retweeted:
+                tweet.retweets.remove(info.context.user)
+            else:
+                tweet.retweets.add(info.context.user)
+            Tweet.objects.filter(id=tweet.id).update(
+                retweets_count=F("retweets_count") + (-1 if retweeted else 1)
+            )
+            publish_counts(tweet.id)
+            invalidate_responses()
         return RetweetMutation(success=True, is_retweeted=not retweeted)
 
 
@@ -229,3 +326,30 @@ class TweetMutation(graphene.ObjectType):
     retweet = RetweetMutation.Field()
     delete_tweet = DeleteTweet.Field()
     refetch = RefetchMutation.Field()
+
+
+class TweetSubscription(graphene.ObjectType):
+    timeline_tweet = graphene.Field(TweetNode)
+    tweet_counts = graphene.Field(
+        TweetNode,
+        tweet_ids=graphene.List(graphene.NonNull(graphene.Int), required=True),
+    )
+
+    @login_required
+    def resolve_timeline_tweet(self, info):
+        return subscribe(info, "timeline", [info.context.user.id])
+
+    def resolve_tweet_counts(self, info, tweet_ids):
+        """
+        The tweets, with their new counts, when they are liked or retweeted.
+        Tweets the user can't see are left out.
+        """
+        tweets = Tweet.objects.filter(
+            id__in=tweet_ids[:MAX_WATCHED_TWEETS]
+        ).values_list("id", "user_id")
+        authors = list({user_id for _, user_id in tweets})
+        visibility = get_loader(info, VisibilityLoader).load_batch(authors)
+        visible = dict(zip(authors, visibility))
+        return subscribe(
+            info, "tweet_counts", [id for id, user_id in tweets if visible[user_id]]
+        )
@@ -0,0 +1,69 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import ExpressionWrapper, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Tweet, TweetSearchEntry
+
+
+def get_terms(text):
+    return re.findall(r"\w+", text)
+
+
+def rank_matches(queryset, text):
+    """
+    Tweets of queryset matching the words of text, annotated with
+    search_rank, higher for better matches.
+    """
+    terms = get_terms(text)
+    if not terms:
+        return queryset.none()
+    if connection.vendor == "mysql":
+        quote_name = connection.ops.quote_name
+        column = f"{quote_name(Tweet._meta.db_table)}.{quote_name('text')}"
+        # Natural language mode ranks tweets with any of the words, as
+        # required words would find nothing when one is a stopword.
+        rank = RawSQL(
+            f"MATCH ({column}) AGAINST (%s IN NATURAL LANGUAGE MODE)", [" ".join(terms)]
+        )
+        return queryset.annotate(search_rank=rank).filter(search_rank__gt=0)
+    if connection.vendor != "sqlite":
+        # No full-text index on other databases: tweets with all the words,
+        # unranked, so the most recent come first.
+        matches = Q()
+        for term in terms:
+            matches &= Q(text__icontains=term)
+        return queryset.filter(matches).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+    # Terms are quoted so FTS5 doesn't read them as operators or columns.
+    query = " ".join('"%s"' % term for term in terms)
+    # Every match has to be scored to rank them, so only the most recent
+    # ones are, which the index reads in order without scoring.
+    cutoff = list(
+        TweetSearchEntry.objects.filter(text__match=query)
+        .order_by("-tweet_id")
+        .values_list("tweet_id", flat=True)[
+            settings.TWEET_SEARCH_MAX_MATCHES - 1 : settings.TWEET_SEARCH_MAX_MATCHES
+        ]
+    )
+    if cutoff:
+        queryset = queryset.filter(search_entry__pk__gte=cutoff[0])
+    return queryset.filter(search_entry__text__match=query).annotate(
+        search_rank=ExpressionWrapper(-F("search_entry__rank"), output_field=FloatField())
+    )
+
+
+def search_tweets(text, viewer):
+    """
+    Tweets matching text that the viewer can see, best matches first: those
+    of public accounts, of the viewer and of private accounts they follow.
+    """
+    visible = Q(user__private=False)
+    if viewer.is_authenticated:
+        visible |= Q(user=viewer) | Q(user__in=viewer.following.values("id"))
+    tweets = rank_matches(Tweet.objects.filter(visible), text)
+    return tweets.order_by("-search_rank", "-id")
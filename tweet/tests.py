@@ -1,3 +1,659 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from graphql_jwt.shortcuts import get_token
+from PIL import Image
+from twitter.testing import GraphQLTestCase, GraphQLTestMixin
+from users.counters import reconcile_follow_counters
+from users.models import User
+
+from .images import claim_batch, make_variants, process_images
+from .models import TimelineEntry, Tweet, TweetImageVariant
+from .timeline import fan_out
+
+TWEET_FIELDS = """
+fragment TweetFields on TweetNode {
+  pk
+  text
+  image
+  imageVariants { width url }
+  createdAt
+  likesCount
+  retweetCount
+  commentsCount
+  isLiked
+  commentTo { pk user { username } }
+  user { pk username displayName photo isSelf isFollowed isFollowing isRequested }
+}
+"""
+
+TWEETS_QUERY = """
+query($after: String) {
+  tweets(first: 5, after: $after, %s) {
+    pageInfo { endCursor }
+    edges { node { pk } }
+  }
+}
+"""
+
+
+class TweetQueryPlanTest(GraphQLTestCase):
+    """
+    Every branch of TweetQuery.resolve_tweets must read tweets through an
+    index in the order they are returned, on the first page and on pages
+    reached with a cursor.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = cls.create_user("viewer")
+        cls.author = cls.create_user("author")
+        cls.viewer.following.add(cls.author)
+        for i in range(12):
+            tweet = Tweet.objects.create(user=cls.author, text=f"tweet {i}")
+            TimelineEntry.objects.create(
+                owner=cls.viewer, tweet=tweet, created_at=tweet.created_at
+            )
+        cls.tweet = Tweet.objects.filter(user=cls.author).first()
+        for i in range(8):
+            Tweet.objects.create(user=cls.viewer, text=f"reply {i}", comment_to=cls.tweet)
+
+    def query_tweets(self, arguments, after=None):
+        data = self.execute(TWEETS_QUERY % arguments, {"after": after}, user=self.viewer)
+        statements = [
+            query["sql"]
+            for query in self.queries
+            if '"tweet_tweet"' in query["sql"].replace("`", '"')
+            and "ORDER BY" in query["sql"]
+        ]
+        self.assertTrue(statements)
+        return data["tweets"]["pageInfo"]["endCursor"], statements
+
+    def assertIndexedPlan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "mysql":
+                cursor.execute("EXPLAIN " + sql)
+                columns = [column[0].lower() for column in cursor.description]
+                for row in cursor.fetchall():
+                    step = dict(zip(columns, row))
+                    self.assertNotEqual(step["type"], "ALL", sql)
+                    self.assertNotIn("Using filesort", step["extra"] or "", sql)
+            else:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    self.assertNotIn("TEMP B-TREE", detail, sql)
+                    if detail.startswith("SCAN"):
+                        self.assertIn("INDEX", detail, sql)
+
+    def assertBranchIndexed(self, arguments):
+        cursor, statements = self.query_tweets(arguments)
+        _, next_statements = self.query_tweets(arguments, after=cursor)
+        for sql in statements + next_statements:
+            self.assertIndexedPlan(sql)
+
+    def test_public_feed(self):
+        self.assertBranchIndexed("")
+
+    def test_public_feed_without_comments(self):
+        self.assertBranchIndexed("excludeComment: true")
+
+    def test_profile(self):
+        self.assertBranchIndexed('username: "author"')
+
+    def test_profile_without_comments(self):
+        self.assertBranchIndexed('username: "author", excludeComment: true')
+
+    def test_replies(self):
+        self.assertBranchIndexed(f"commentToPk: {self.tweet.pk}")
+
+    def test_timeline(self):
+        self.assertBranchIndexed("timeline: true")
+
+    def test_timeline_without_comments(self):
+        self.assertBranchIndexed("timeline: true, excludeComment: true")
+
+
+class TweetQueryCountTest(GraphQLTestCase):
+    """
+    The tweet queries and mutations of the frontend must run a fixed number
+    of SQL queries, whatever the size of the page.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = cls.create_user("viewer")
+        authors = [cls.create_user(f"author{i}", private=i % 3 == 0) for i in range(6)]
+        cls.viewer.following.add(*authors[:4])
+        authors[0].following.add(cls.viewer)
+        cls.author = authors[1]
+        for i in range(60):
+            author = authors[i % len(authors)]
+            tweet = Tweet.objects.create(user=author, text=f"tweet {i}")
+            fan_out(tweet)
+        cls.tweet = Tweet.objects.filter(user=cls.author).first()
+        for i in range(12):
+            reply = Tweet.objects.create(
+                user=authors[i % len(authors)], text=f"reply {i}", comment_to=cls.tweet
+            )
+            fan_out(reply)
+        for i, tweet in enumerate(Tweet.objects.all()):
+            tweet.image = f"tweet/{tweet.user_id}/photo{i}.jpg"
+            tweet.save()
+            TweetImageVariant.objects.create(
+                tweet=tweet, width=320, image=f"tweet/{tweet.user_id}/variants/photo{i}.jpg"
+            )
+            if i % 2 == 0:
+                tweet.likes.add(cls.viewer)
+
+    def request(self, query, variables=None):
+        data = self.execute(query, variables, user=self.viewer)
+        return data, len(self.queries)
+
+    def count_page_queries(self, arguments, first):
+        query = TWEET_FIELDS + """
+        query($first: Int) {
+          tweets(first: $first, %s) {
+            pageInfo { endCursor hasNextPage }
+            edges { node { ...TweetFields } }
+          }
+        }
+        """ % arguments
+        data, count = self.request(query, {"first": first})
+        self.assertEqual(len(data["tweets"]["edges"]), first)
+        return count
+
+    def assertPageBudget(self, arguments, budget):
+        small = self.count_page_queries(arguments, 2)
+        large = self.count_page_queries(arguments, 10)
+        self.assertLessEqual(large, small, "the number of queries grows with the page")
+        self.assertLessEqual(small, budget)
+
+    def test_public_feed(self):
+        self.assertPageBudget("", 11)
+
+    def test_timeline(self):
+        self.assertPageBudget("timeline: true", 13)
+
+    def test_profile(self):
+        self.assertPageBudget('username: "author1"', 11)
+
+    def test_replies(self):
+        self.assertPageBudget(f"commentToPk: {self.tweet.pk}", 12)
+
+    def test_tweet(self):
+        query = TWEET_FIELDS + """
+        query($id: Int!) { tweet(id: $id) { ...TweetFields } }
+        """
+        _, count = self.request(query, {"id": self.tweet.pk})
+        self.assertLessEqual(count, 9)
+
+    def test_like(self):
+        query = """
+        mutation($id: Int!) { likeTweet(tweetId: $id) { success isLiked } }
+        """
+        _, count = self.request(query, {"id": self.tweet.pk})
+        self.assertLessEqual(count, 7)
+
+    def test_retweet(self):
+        query = """
+        mutation($id: Int!) { retweet(tweetId: $id) { success isRetweeted } }
+        """
+        _, count = self.request(query, {"id": self.tweet.pk})
+        self.assertLessEqual(count, 7)
+
+    def test_post_reply(self):
+        query = TWEET_FIELDS + """
+        mutation($text: String!, $commentTo: Int) {
+          postTweet(text: $text, commentTo: $commentTo) {
+            success
+            tweet { ...TweetFields }
+          }
+        }
+        """
+        _, count = self.request(query, {"text": "hi", "commentTo": self.tweet.pk})
+        self.assertLessEqual(count, 22)
+
+
+class SearchTweetsTest(GraphQLTestCase):
+    """searchTweets ranks matching tweets the viewer can see."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = cls.create_user("viewer")
+        cls.public = cls.create_user("public")
+        cls.followed = cls.create_user("followed", private=True)
+        cls.private = cls.create_user("private", private=True)
+        cls.viewer.following.add(cls.followed)
+        cls.best = Tweet.objects.create(user=cls.public, text="coffee coffee coffee")
+        cls.good = Tweet.objects.create(
+            user=cls.public, text="morning coffee and a long walk by the river"
+        )
+        cls.followed_tweet = Tweet.objects.create(user=cls.followed, text="coffee time")
+        Tweet.objects.create(user=cls.private, text="secret coffee")
+        Tweet.objects.create(user=cls.public, text="tea")
+
+    def search(self, query, first=10, after=None, user=None):
+        data = self.execute(
+            """
+            query($query: String!, $first: Int, $after: String) {
+              searchTweets(query: $query, first: $first, after: $after) {
+                pageInfo { endCursor hasNextPage }
+                edges { node { pk } }
+              }
+            }
+            """,
+            {"query": query, "first": first, "after": after},
+            user=user,
+        )
+        result = data["searchTweets"]
+        return [edge["node"]["pk"] for edge in result["edges"]], result["pageInfo"]
+
+    def test_ranked_and_visible(self):
+        pks, _ = self.search("Coffee", user=self.viewer)
+        self.assertEqual(pks[0], self.best.pk)
+        self.assertEqual(set(pks), {self.best.pk, self.good.pk, self.followed_tweet.pk})
+        pks, _ = self.search("coffee")
+        self.assertEqual(set(pks), {self.best.pk, self.good.pk})
+
+    @skipIf(connection.vendor == "mysql", "MySQL ranks tweets with any of the words")
+    def test_all_words(self):
+        pks, _ = self.search("coffee walk")
+        self.assertEqual(pks, [self.good.pk])
+        pks, _ = self.search('"); DROP')
+        self.assertEqual(pks, [])
+
+    def test_pages(self):
+        first, page_info = self.search("coffee", first=2, user=self.viewer)
+        self.assertTrue(page_info["hasNextPage"])
+        rest, page_info = self.search(
+            "coffee", after=page_info["endCursor"], user=self.viewer
+        )
+        self.assertFalse(page_info["hasNextPage"])
+        self.assertEqual(len(first + rest), 3)
+        self.assertFalse(set(first) & set(rest))
+
+    @skipIf(connection.vendor == "mysql", "MySQL ranks all the matches")
+    @override_settings(TWEET_SEARCH_MAX_MATCHES=3)
+    def test_recent_matches(self):
+        pks, _ = self.search("coffee", user=self.viewer)
+        self.assertEqual(set(pks), {self.good.pk, self.followed_tweet.pk})
+
+    def test_follows_changes(self):
+        # Signed in, as anonymous responses are cached until a mutation.
+        tweet = Tweet.objects.create(user=self.public, text="espresso")
+        self.assertEqual(self.search("espresso", user=self.viewer)[0], [tweet.pk])
+        tweet.text = "decaf"
+        tweet.save()
+        self.assertEqual(self.search("espresso", user=self.viewer)[0], [])
+        self.assertEqual(self.search("decaf", user=self.viewer)[0], [tweet.pk])
+        tweet.delete()
+        self.assertEqual(self.search("decaf", user=self.viewer)[0], [])
+
+    @mock.patch("tweet.search.connection", mock.Mock(vendor="postgresql"))
+    def test_other_databases(self):
+        pks, _ = self.search("Coffee", user=self.viewer)
+        self.assertEqual(pks, [self.followed_tweet.pk, self.good.pk, self.best.pk])
+        pks, _ = self.search("coffee walk", user=self.viewer)
+        self.assertEqual(pks, [self.good.pk])
+
+
+class PrivateTweetTest(GraphQLTestCase):
+    """The text and image of private accounts are hidden from non-followers."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.private = cls.create_user("private", private=True)
+        cls.follower = cls.create_user("follower")
+        cls.stranger = cls.create_user("stranger")
+        cls.private.followers.add(cls.follower)
+        cls.tweet = Tweet.objects.create(
+            user=cls.private, text="secret", image="tweet/1/photo.jpg"
+        )
+        TweetImageVariant.objects.create(
+            tweet=cls.tweet, width=320, image="tweet/1/variants/photo_320.jpg"
+        )
+
+    def fetch(self, user=None):
+        data = self.execute(
+            "query($id: Int!) { tweet(id: $id) { text image imageVariants { width } } }",
+            {"id": self.tweet.pk},
+            user=user,
+        )
+        return data["tweet"]
+
+    def test_hidden(self):
+        hidden = {"text": "", "image": None, "imageVariants": []}
+        self.assertEqual(self.fetch(self.stranger), hidden)
+        self.assertEqual(self.fetch(), hidden)
+
+    def test_visible(self):
+        for user in (self.follower, self.private):
+            self.assertEqual(
+                self.fetch(user),
+                {
+                    "text": "secret",
+                    "image": "http://testserver/media/tweet/1/photo.jpg",
+                    "imageVariants": [{"width": 320}],
+                },
+            )
+
+
+class TimelineTest(GraphQLTestCase):
+    """
+    Home timelines are copied into on post and follow and pruned on
+    unfollow. Tweets of authors with too many followers are merged in when
+    the timeline is read.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = cls.create_user("author")
+        cls.reader = cls.create_user("reader")
+        cls.stranger = cls.create_user("stranger")
+        cls.celebrity = cls.create_user("celebrity")
+        cls.reader.following.add(cls.author)
+        cls.author.following.add(cls.celebrity)
+        cls.reader.following.add(cls.celebrity)
+        reconcile_follow_counters(User)
+
+    def post_tweet(self, user, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.execute(
+                "mutation($text: String!) { postTweet(text: $text) { success } }",
+                {"text": text},
+                user=user,
+            )
+        return Tweet.objects.get(user=user, text=text)
+
+    def toggle_follow(self, user, other):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.execute(
+                "mutation($id: Int!) { follow(userId: $id) { isFollowed } }",
+                {"id": other.pk},
+                user=user,
+            )
+
+    def timeline(self, user):
+        data = self.execute(
+            "query { tweets(first: 20, timeline: true) { edges { node { text } } } }",
+            user=user,
+        )
+        return [edge["node"]["text"] for edge in data["tweets"]["edges"]]
+
+    def test_fan_out(self):
+        tweet = self.post_tweet(self.author, "hello")
+        self.assertTrue(tweet.fanned_out)
+        self.assertEqual(
+            set(tweet.timeline_entries.values_list("owner__username", flat=True)),
+            {"author", "reader"},
+        )
+        self.assertEqual(self.timeline(self.reader), ["hello"])
+        self.assertEqual(self.timeline(self.author), ["hello"])
+        self.assertEqual(self.timeline(self.stranger), [])
+
+    @override_settings(TIMELINE_BACKFILL_LIMIT=2)
+    def test_backfill_on_follow(self):
+        for text in ("one", "two", "three"):
+            self.post_tweet(self.author, text)
+        self.toggle_follow(self.stranger, self.author)
+        # Only the most recent tweets are copied.
+        self.assertEqual(self.timeline(self.stranger), ["three", "two"])
+        self.post_tweet(self.author, "four")
+        self.assertEqual(self.timeline(self.stranger), ["four", "three", "two"])
+
+    def test_prune_on_unfollow(self):
+        self.post_tweet(self.author, "by author")
+        self.post_tweet(self.reader, "by reader")
+        self.toggle_follow(self.reader, self.author)
+        self.assertEqual(self.timeline(self.reader), ["by reader"])
+        self.assertFalse(
+            TimelineEntry.objects.filter(owner=self.reader, tweet__user=self.author)
+        )
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=1)
+    def test_high_fanout_merged_on_read(self):
+        self.post_tweet(self.author, "early")
+        tweet = self.post_tweet(self.celebrity, "famous")
+        self.post_tweet(self.author, "late")
+        self.assertFalse(tweet.fanned_out)
+        self.assertEqual(
+            list(tweet.timeline_entries.values_list("owner__username", flat=True)),
+            ["celebrity"],
+        )
+        # Merged with the copied tweets, in the order they were posted.
+        self.assertEqual(self.timeline(self.reader), ["late", "famous", "early"])
+        self.assertEqual(self.timeline(self.celebrity), ["famous"])
+        self.assertEqual(self.timeline(self.stranger), [])
+        # Following the author later shows them too, without copying them.
+        self.toggle_follow(self.stranger, self.celebrity)
+        self.assertEqual(self.timeline(self.stranger), ["famous"])
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.stranger))
+
+
+def asgi_application():
+    # Importing twitter.asgi turns GRAPHQL_ASYNC on for the process, it must
+    # not leak into the other tests.
+    with mock.patch.dict(os.environ):
+        from twitter.asgi import application
+    return application
+
+
+def make_photo(width, height):
+    """A JPEG as cameras write them: sideways, with the camera and GPS tags."""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation, rotated 90 degrees
+    exif[0x010F] = "Camera"  # Make
+    exif[0x8825] = {1: "N", 2: (48.0, 51.0, 24.0)}  # GPSInfo
+    output = BytesIO()
+    Image.new("RGB", (width, height), "red").save(output, "JPEG", exif=exif.tobytes())
+    return output.getvalue()
+
+
+class ImageProcessingTest(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(
+            MEDIA_ROOT=media_root, TWEET_IMAGE_WIDTHS=[320, 640], TWEET_IMAGE_QUALITY=80
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = self.create_user("author")
+
+    def assertStripped(self, data, size):
+        image = Image.open(BytesIO(data))
+        self.assertEqual(image.size, size)
+        self.assertEqual(dict(image.getexif()), {})
+        self.assertNotIn("exif", image.info)
+
+    def test_make_variants(self):
+        original, variants = make_variants(make_photo(1000, 500), [320, 640, 1280], 80)
+        # The sideways photo is stood up, the 1280 px variant would enlarge it.
+        self.assertStripped(original, (500, 1000))
+        self.assertEqual([width for width, _ in variants], [320])
+        self.assertStripped(variants[0][1], (320, 640))
+
+    def test_make_variants_narrow(self):
+        original, variants = make_variants(make_photo(200, 100), [320], 80)
+        self.assertEqual(variants, [(100, original)])
+
+    def post_image_tweet(self, name, data):
+        tweet = Tweet(user=self.author, text="photo", image_pending=True)
+        tweet.image.save(name, ContentFile(data))
+        return tweet
+
+    def fetch_image(self, tweet):
+        data = self.execute(
+            "query($id: Int!) { tweet(id: $id) { image imageVariants { width } } }",
+            {"id": tweet.pk},
+        )
+        return data["tweet"]
+
+    def test_process_images(self):
+        tweet = self.post_image_tweet("photo.jpg", make_photo(1000, 500))
+        broken = self.post_image_tweet("broken.jpg", b"not an image")
+        upload, broken_upload = tweet.image.name, broken.image.name
+        self.assertEqual(self.fetch_image(tweet), {"image": None, "imageVariants": []})
+        with ThreadPoolExecutor() as executor, self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            self.assertEqual(process_images(executor, 10), (1, 1))
+        self.assertFalse(tweet.image.storage.exists(upload))
+        tweet.refresh_from_db()
+        self.assertFalse(tweet.image_pending)
+        self.assertNotEqual(tweet.image.name, upload)
+        with tweet.image.open("rb") as image:
+            self.assertStripped(image.read(), (500, 1000))
+        variant = tweet.image_variants.get()
+        self.assertEqual(variant.width, 320)
+        with variant.image.open("rb") as image:
+            self.assertStripped(image.read(), (320, 640))
+        self.assertEqual(
+            self.fetch_image(tweet),
+            {
+                "image": f"http://testserver/media/{tweet.image.name}",
+                "imageVariants": [{"width": 320}],
+            },
+        )
+        broken.refresh_from_db()
+        self.assertFalse(broken.image)
+        self.assertFalse(broken.image_pending)
+        self.assertFalse(tweet.image.storage.exists(broken_upload))
+        with ThreadPoolExecutor() as executor:
+            self.assertEqual(process_images(executor, 10), (0, 0))
+
+    def test_failure_retried(self):
+        tweet = self.post_image_tweet("photo.jpg", make_photo(1000, 500))
+        upload = tweet.image.name
+        with ThreadPoolExecutor() as executor:
+            with mock.patch(
+                "tweet.images.make_variants", side_effect=RuntimeError("Worker died")
+            ), self.assertLogs("tweet.images", "ERROR"):
+                self.assertEqual(process_images(executor, 10), (0, 1))
+            tweet.refresh_from_db()
+            self.assertTrue(tweet.image_pending)
+            self.assertEqual(tweet.image.name, upload)
+            self.assertTrue(tweet.image.storage.exists(upload))
+            # Leased, other workers leave it alone until the lease runs out.
+            self.assertEqual(claim_batch(10), [])
+            Tweet.objects.update(image_leased_until=timezone.now())
+            self.assertEqual(process_images(executor, 10), (1, 0))
+        tweet.refresh_from_db()
+        self.assertFalse(tweet.image_pending)
+
+
+class SubscriptionTest(GraphQLTestMixin, TransactionTestCase):
+    """
+    Subscriptions over WebSocket receive the events published by the
+    mutations, once they commit.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user("author")
+        self.reader = self.create_user("reader")
+        self.private = self.create_user("private", private=True)
+        self.reader.following.add(self.author)
+        self.tweet = Tweet.objects.create(user=self.author, text="first")
+        self.hidden = Tweet.objects.create(user=self.private, text="hidden")
+
+    async def connect(self, user):
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        scope = {
+            "type": "websocket",
+            "path": "/graphql/",
+            "subprotocols": ["graphql-ws"],
+            "headers": [(b"host", b"localhost")],
+        }
+        application = asgi_application()
+        self.socket = asyncio.ensure_future(
+            application(scope, self.inbox.get, self.outbox.put)
+        )
+        await self.inbox.put({"type": "websocket.connect"})
+        self.assertEqual((await self.outbox.get())["type"], "websocket.accept")
+        token = await sync_to_async(get_token)(user)
+        await self.send({"type": "connection_init", "payload": {"authToken": token}})
+        self.assertEqual((await self.receive())["type"], "connection_ack")
+        self.assertEqual((await self.receive())["type"], "ka")
+
+    async def disconnect(self):
+        await self.inbox.put({"type": "websocket.disconnect"})
+        await self.socket
+
+    async def send(self, message):
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps(message)})
+
+    async def receive(self):
+        message = await asyncio.wait_for(self.outbox.get(), 5)
+        return json.loads(message["text"])
+
+    async def subscribe(self, id, query, variables=None):
+        await self.send(
+            {"type": "start", "id": id, "payload": {"query": query, "variables": variables}}
+        )
+        # Messages are handled in order, the subscription listens once a
+        # query sent after it is answered.
+        await self.send({"type": "start", "id": "sync", "payload": {"query": "{ __typename }"}})
+        self.assertEqual((await self.receive())["id"], "sync")
+        self.assertEqual(await self.receive(), {"type": "complete", "id": "sync"})
+
+    async def mutate(self, user, query):
+        await sync_to_async(self.execute, thread_sensitive=False)(query, user=user)
+
+    async def test_timeline_and_counts(self):
+        await self.connect(self.reader)
+        await self.subscribe("1", "subscription { timelineTweet { text user { username } } }")
+        await self.subscribe(
+            "2",
+            "subscription($ids: [Int!]!) { tweetCounts(tweetIds: $ids) "
+            "{ pk likesCount retweetCount isLiked } }",
+            {"ids": [self.tweet.pk, self.hidden.pk]},
+        )
+        await self.mutate(self.author, 'mutation { postTweet(text: "second") { success } }')
+        message = await self.receive()
+        self.assertEqual(message["id"], "1")
+        self.assertEqual(
+            message["payload"]["data"]["timelineTweet"],
+            {"text": "second", "user": {"username": "author"}},
+        )
+
+        like = "mutation { likeTweet(tweetId: %d) { success } }"
+        await self.mutate(self.reader, like % self.tweet.pk)
+        message = await self.receive()
+        self.assertEqual(message["id"], "2")
+        self.assertEqual(
+            message["payload"]["data"]["tweetCounts"],
+            {"pk": self.tweet.pk, "likesCount": 1, "retweetCount": 0, "isLiked": True},
+        )
+        # Tweets the reader can't see are not watched.
+        await self.mutate(self.private, like % self.hidden.pk)
+        await self.send({"type": "stop", "id": "2"})
+        self.assertEqual(await self.receive(), {"type": "complete", "id": "2"})
+        await self.disconnect()
+
+    async def test_follow_requested(self):
+        await self.connect(self.private)
+        await self.subscribe("1", "subscription { followRequested { username isFollowing } }")
+        follow = "mutation { follow(userId: %d) { success } }"
+        await self.mutate(self.reader, follow % self.private.pk)
+        message = await self.receive()
+        self.assertEqual(
+            message["payload"]["data"]["followRequested"],
+            {"username": "reader", "isFollowing": False},
+        )
+        await self.disconnect()
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.db.models import F, Q
+from twitter.pagination import order_by_unique
+
+from .models import TimelineEntry, Tweet
+
+BATCH_SIZE = 1000
+
+
+def is_high_fanout(author):
+    # Read from the database, author may be a cached copy of the user.
+    followers_count = (
+        type(author).objects.filter(pk=author.pk).values_list("followers_count", flat=True)
+    )
+    return followers_count.get() > settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out(tweet):
+    """
+    Copy a new tweet into its author's timeline and, unless the author has
+    too many followers, into the timeline of every follower.
+    """
+    author = tweet.user
+    TimelineEntry.objects.create(
+        owner=author, tweet=tweet, created_at=tweet.created_at
+    )
+    if is_high_fanout(author):
+        Tweet.objects.filter(id=tweet.id).update(fanned_out=False)
+        tweet.fanned_out = False
+        return
+    follower_ids = author.followers.values_list("id", flat=True).iterator(
+        chunk_size=BATCH_SIZE
+    )
+    entries = []
+    for follower_id in follower_ids:
+        entries.append(
+            TimelineEntry(owner_id=follower_id, tweet=tweet, created_at=tweet.created_at)
+        )
+        if len(entries) == BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(entries)
+            entries = []
+    TimelineEntry.objects.bulk_create(entries)
+
+
+def backfill(owner, author):
+    """Copy the recent fanned out tweets of a newly followed author."""
+    backfill_followers(author, [owner.id])
+
+
+def backfill_followers(author, follower_ids):
+    """
+    Copy the recent fanned out tweets of author into the timelines of
+    followers who just started following it, reading the tweets once.
+    """
+    tweets = list(
+        author.tweets.filter(fanned_out=True).values_list("id", "created_at")[
+            : settings.TIMELINE_BACKFILL_LIMIT
+        ]
+    )
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(owner_id=follower_id, tweet_id=tweet_id, created_at=created_at)
+            for follower_id in follower_ids
+            for tweet_id, created_at in tweets
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune(owner, author):
+    """Remove an unfollowed author's tweets from a timeline."""
+    TimelineEntry.objects.filter(owner=owner, tweet__user=author).delete()
+
+
+def home_timeline(queryset, owner):
+    """
+    Tweets in the owner's timeline. Tweets of high fanout authors were never
+    copied into it, so they are merged in here if the owner follows any.
+    """
+    pulled = Q(fanned_out=False, user__in=owner.following.values("id"))
+    if not Tweet.objects.filter(pulled).exists():
+        timeline = queryset.filter(timeline_entries__owner=owner)
+        if timeline.query.order_by:
+            return timeline
+        # Read the entries in the order of their (owner, created_at, tweet)
+        # index rather than sorting the joined tweets. Within one timeline the
+        # tweet id identifies the entry.
+        return order_by_unique(
+            timeline.annotate(
+                timeline_at=F("timeline_entries__created_at"),
+                timeline_tweet_id=F("timeline_entries__tweet_id"),
+            ),
+            "-timeline_at",
+            "-timeline_tweet_id",
+        )
+    entries = TimelineEntry.objects.filter(owner=owner).values("tweet_id")
+    return queryset.filter(Q(id__in=entries) | pulled)
@@ -12,5 +12,20 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'twitter.settings')
+os.environ.setdefault('GRAPHQL_ASYNC', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Needs the apps loaded by get_asgi_application.
+from .websocket import GraphQLWebSocket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Django, with GraphQL over WebSocket on the path of the HTTP endpoint."""
+    if scope["type"] != "websocket":
+        await django_application(scope, receive, send)
+    elif scope["path"] == "/graphql/":
+        await GraphQLWebSocket(scope, receive, send)()
+    else:
+        await receive()
+        await send({"type": "websocket.close"})
@@ -0,0 +1,99 @@
+from collections import namedtuple
+
+from graphene_django.settings import graphene_settings
+from graphql.language import ast
+from graphql.type import GraphQLInterfaceType, GraphQLObjectType, GraphQLUnionType
+from graphql.type.definition import get_named_type
+from graphql.utils.get_operation_ast import get_operation_ast
+
+Complexity = namedtuple("Complexity", ["depth", "cost"])
+
+# Fields that only carry the relay connection structure, they add neither
+# depth nor cost.
+CONNECTION_FIELDS = ("edges", "node")
+
+# Cost of resolving a field once, by "Type.field". Fields returning objects
+# cost 1 and scalars 0 unless listed here.
+FIELD_WEIGHTS = {
+    "Query.searchTweets": 5,
+    "Query.searchUsers": 5,
+}
+
+
+def measure(schema, document_ast, operation_name=None, variables=None):
+    """
+    Depth and estimated cost of the operation of document_ast. The nodes of
+    a connection are counted as many times as the first or last argument
+    asks for, or the relay connection limit when neither is given.
+    """
+    operation = get_operation_ast(document_ast, operation_name)
+    if operation is None:
+        return Complexity(0, 0)
+    if operation.operation == "mutation":
+        root_type = schema.get_mutation_type()
+    elif operation.operation == "subscription":
+        root_type = schema.get_subscription_type()
+    else:
+        root_type = schema.get_query_type()
+    fragments = {
+        definition.name.value: definition
+        for definition in document_ast.definitions
+        if isinstance(definition, ast.FragmentDefinition)
+    }
+    return measure_selections(
+        schema, root_type, operation.selection_set, fragments, variables or {}
+    )
+
+
+def measure_selections(schema, parent_type, selection_set, fragments, variables):
+    depth = cost = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            complexity = measure_field(schema, parent_type, selection, fragments, variables)
+        else:
+            if isinstance(selection, ast.FragmentSpread):
+                selection = fragments[selection.name.value]
+            fragment_type = parent_type
+            if selection.type_condition is not None:
+                fragment_type = schema.get_type(selection.type_condition.name.value)
+            complexity = measure_selections(
+                schema, fragment_type, selection.selection_set, fragments, variables
+            )
+        depth = max(depth, complexity.depth)
+        cost += complexity.cost
+    return Complexity(depth, cost)
+
+
+def measure_field(schema, parent_type, node, fragments, variables):
+    name = node.name.value
+    if name.startswith("__") or isinstance(parent_type, GraphQLUnionType):
+        return Complexity(0, 0)
+    field_type = get_named_type(parent_type.fields[name].type)
+    is_object = isinstance(field_type, (GraphQLObjectType, GraphQLInterfaceType))
+    if name in CONNECTION_FIELDS and is_object:
+        weight = depth = 0
+    else:
+        weight = FIELD_WEIGHTS.get(f"{parent_type.name}.{name}", 1 if is_object else 0)
+        depth = 1
+    if node.selection_set is None:
+        return Complexity(depth, weight)
+
+    children = measure_selections(
+        schema, field_type, node.selection_set, fragments, variables
+    )
+    multiplier = 1
+    if "edges" in getattr(field_type, "fields", {}):
+        limits = []
+        for argument in node.arguments:
+            if argument.name.value in ("first", "last"):
+                value = argument.value
+                if isinstance(value, ast.Variable):
+                    value = variables.get(value.name.value)
+                elif isinstance(value, ast.IntValue):
+                    value = int(value.value)
+                if isinstance(value, int):
+                    limits.append(max(value, 0))
+        multiplier = (
+            min(limits) if limits else graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        )
+    return Complexity(depth + children.depth, weight + multiplier * children.cost)
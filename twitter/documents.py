@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from graphql import GraphQLError, parse, validate
+from graphql.backend.base import GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from rx import Observable
+
+from .complexity import measure
+from .loaders import wait_for_batches
+
+
+def execute_measured(schema, document_ast, **options):
+    """
+    Execute document_ast unless its depth or cost, which depend on the
+    variables of the request, are over the configured limits. Both are
+    reported in the extensions of the result. Under the async view, the
+    loader batches of the request are waited for here.
+    """
+    complexity = measure(
+        schema,
+        document_ast,
+        options.get("operation_name"),
+        options.get("variable_values"),
+    )
+    extensions = {"complexity": complexity._asdict()}
+    if complexity.depth > settings.GRAPHQL_MAX_DEPTH:
+        error = GraphQLError(
+            f"Query depth {complexity.depth} exceeds the limit of "
+            f"{settings.GRAPHQL_MAX_DEPTH}."
+        )
+        return ExecutionResult(errors=[error], invalid=True, extensions=extensions)
+    if complexity.cost > settings.GRAPHQL_MAX_COST:
+        error = GraphQLError(
+            f"Query cost {complexity.cost} exceeds the limit of "
+            f"{settings.GRAPHQL_MAX_COST}."
+        )
+        return ExecutionResult(errors=[error], invalid=True, extensions=extensions)
+    request = options.get("context_value")
+    if getattr(request, "loader_pool", None) is not None:
+        result = wait_for_batches(
+            request, execute(schema, document_ast, return_promise=True, **options)
+        )
+    else:
+        result = execute(schema, document_ast, **options)
+    if isinstance(result, Observable):
+        # A subscription, its results come with every event.
+        return result
+    result.extensions.update(extensions)
+    return result
+
+
+def build_document(schema, query):
+    """
+    Parse and validate a query once. The returned document can be executed
+    any number of times without parsing or validating it again.
+    """
+    document_ast = parse(query)
+    errors = validate(schema, document_ast)
+    if errors:
+
+        def execute_invalid(**options):
+            return ExecutionResult(errors=errors, invalid=True)
+
+        return GraphQLDocument(schema, query, document_ast, execute_invalid)
+    return GraphQLDocument(
+        schema, query, document_ast, partial(execute_measured, schema, document_ast)
+    )
+
+
+class DocumentCache:
+    """
+    Least recently used cache of built documents keyed by their text, so
+    that the few dozen queries the frontend sends are only parsed and
+    validated once per process.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.documents = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, schema, query):
+        with self.lock:
+            document = self.documents.get(query)
+            if document is not None:
+                self.documents.move_to_end(query)
+                self.hits += 1
+                return document
+            self.misses += 1
+        document = build_document(schema, query)
+        with self.lock:
+            self.documents[query] = document
+            while len(self.documents) > self.max_size:
+                self.documents.popitem(last=False)
+        return document
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+document_cache = DocumentCache(settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
@@ -0,0 +1,105 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.db import close_old_connections, connection
+from django.db.models import Count
+from promise import Promise
+from promise.dataloader import DataLoader
+
+
+def get_loader(info, loader_class):
+    """
+    Return the instance of loader_class bound to the current request,
+    creating it the first time it is asked for.
+    """
+    request = info.context
+    loaders = getattr(request, "loaders", None)
+    if loaders is None:
+        loaders = request.loaders = {}
+    if loader_class not in loaders:
+        loaders[loader_class] = loader_class(request)
+    return loaders[loader_class]
+
+
+class RequestLoader(DataLoader):
+    """
+    A loader of the current request. Subclasses implement load_batch, which
+    returns one value per key. Under the async view the batches of a request
+    run at the same time in its loader pool, otherwise they run in place.
+    """
+
+    def __init__(self, request):
+        super().__init__()
+        self.request = request
+
+    def load_batch(self, keys):
+        raise NotImplementedError
+
+    def batch_load_fn(self, keys):
+        return run_batch(self.request, self.load_batch, keys)
+
+    def load_now(self, key):
+        """
+        Load key right away, for resolvers that need the value itself. Keys
+        loaded before are answered from the cache.
+        """
+        cached = self._promise_cache.get(self.get_cache_key(key))
+        if cached is not None and cached.is_fulfilled:
+            return cached.value
+        value = self.load_batch([key])[0]
+        self.prime(key, value)
+        return value
+
+
+def run_in_thread(fn, keys):
+    try:
+        return fn(keys)
+    finally:
+        close_old_connections()
+
+
+def run_batch(request, fn, keys):
+    """
+    Run fn(keys) in the loader pool of the request, returning a promise that
+    wait_for_batches resolves. Inside a transaction the batch must see its
+    uncommitted rows, so it runs on the connection of the request.
+    """
+    pool = getattr(request, "loader_pool", None)
+    if pool is None or connection.in_atomic_block:
+        return Promise.resolve(fn(keys))
+    promise = Promise()
+    request.pending_batches.append((pool.submit(run_in_thread, fn, keys), promise))
+    return promise
+
+
+def wait_for_batches(request, promise):
+    """
+    Settle the batches of the request as they finish until promise is
+    settled. Promises are settled in this thread only, the resolvers they
+    call may start new batches.
+    """
+    while promise.is_pending and request.pending_batches:
+        batches = dict(request.pending_batches)
+        request.pending_batches = []
+        done, _ = wait(batches, return_when=FIRST_COMPLETED)
+        request.pending_batches.extend(
+            (future, batch) for future, batch in batches.items() if future not in done
+        )
+        for future in done:
+            try:
+                value = future.result()
+            except Exception as e:
+                batches[future].do_reject(e)
+            else:
+                batches[future].do_resolve(value)
+    return promise.get()
+
+
+def count_by(queryset, field, keys):
+    """Count the rows of queryset grouped by field, one number per key."""
+    counts = dict(
+        queryset.filter(**{f"{field}__in": keys})
+        .order_by()
+        .values_list(field)
+        .annotate(count=Count("pk"))
+    )
+    return [counts.get(key, 0) for key in keys]
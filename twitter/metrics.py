@@ -0,0 +1,151 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from graphql.language import ast
+from promise import Promise
+
+from .documents import document_cache
+
+# Labels past this many per metric are recorded as "other", operation names
+# come from clients.
+MAX_LABELS = 500
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FIELD_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """A Prometheus histogram with a single label."""
+
+    def __init__(self, name, help, label, buckets):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self.lock:
+            if label not in self.series and len(self.series) >= MAX_LABELS:
+                label = "other"
+            series = self.series.get(label)
+            if series is None:
+                series = self.series[label] = [[0] * len(self.buckets), 0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = sorted(
+                (label, list(counts), total, count)
+                for label, (counts, total, count) in self.series.items()
+            )
+        for label, counts, total, count in series:
+            label = label.replace("\\", "\\\\").replace('"', '\\"')
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(
+                    f'{self.name}_bucket{{{self.label}="{label}",le="{bound}"}} {bucket_count}'
+                )
+            lines.append(f'{self.name}_bucket{{{self.label}="{label}",le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{{self.label}="{label}"}} {count}')
+        return "\n".join(lines)
+
+
+operation_duration = Histogram(
+    "graphql_operation_duration_seconds",
+    "Time to execute a GraphQL operation.",
+    "operation",
+    LATENCY_BUCKETS,
+)
+operation_queries = Histogram(
+    "graphql_operation_sql_queries",
+    "SQL statements run by a GraphQL operation.",
+    "operation",
+    QUERY_COUNT_BUCKETS,
+)
+operation_sql_duration = Histogram(
+    "graphql_operation_sql_duration_seconds",
+    "Time a GraphQL operation spent in the database.",
+    "operation",
+    LATENCY_BUCKETS,
+)
+field_duration = Histogram(
+    "graphql_field_duration_seconds",
+    "Time to resolve a field, until its promise resolves for batched fields.",
+    "field",
+    FIELD_LATENCY_BUCKETS,
+)
+HISTOGRAMS = [operation_duration, operation_queries, operation_sql_duration, field_duration]
+
+
+@contextmanager
+def record_operation(operation):
+    """Time the block and count the SQL it runs as one operation."""
+    stats = {"queries": 0, "duration": 0}
+
+    def count_queries(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats["queries"] += 1
+            stats["duration"] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(count_queries):
+            yield
+    finally:
+        operation_duration.observe(operation, time.perf_counter() - start)
+        operation_queries.observe(operation, stats["queries"])
+        operation_sql_duration.observe(operation, stats["duration"])
+
+
+class MetricsMiddleware:
+    """Graphene middleware recording how long each field takes to resolve."""
+
+    def resolve(self, next, root, info, **args):
+        field = f"{info.parent_type.name}.{info.field_name}"
+        start = time.perf_counter()
+        result = next(root, info, **args)
+        if isinstance(result, Promise):
+
+            def observe(value):
+                field_duration.observe(field, time.perf_counter() - start)
+                return value
+
+            return result.then(observe)
+        field_duration.observe(field, time.perf_counter() - start)
+        return result
+
+
+def get_operation_label(document, operation_name):
+    if operation_name:
+        return operation_name
+    if document is None:
+        return "invalid"
+    for definition in document.document_ast.definitions:
+        if isinstance(definition, ast.OperationDefinition):
+            return definition.name.value if definition.name else "anonymous"
+    return "invalid"
+
+
+def render():
+    """Every metric of this process in the Prometheus text format."""
+    sections = [histogram.render() for histogram in HISTOGRAMS]
+    for name, value in (("hits", document_cache.hits), ("misses", document_cache.misses)):
+        sections.append(
+            f"# HELP graphql_document_cache_{name}_total Document cache {name}.\n"
+            f"# TYPE graphql_document_cache_{name}_total counter\n"
+            f"graphql_document_cache_{name}_total {value}"
+        )
+    return "\n".join(sections) + "\n"
@@ -0,0 +1,25 @@
+import asyncio
+
+from django.utils.decorators import sync_and_async_middleware
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+@sync_and_async_middleware
+def whitenoise_middleware(get_response):
+    """
+    WhiteNoise that also runs as async middleware. Under ASGI Django runs
+    synchronous middleware, and every view below it, in a single thread.
+    """
+    whitenoise = WhiteNoiseMiddleware(get_response)
+    if not asyncio.iscoroutinefunction(get_response):
+        return whitenoise
+
+    async def middleware(request):
+        # Looking up a static file doesn't touch the database, it doesn't
+        # need a thread.
+        response = whitenoise.process_request(request)
+        if response is None:
+            response = await get_response(request)
+        return response
+
+    return middleware
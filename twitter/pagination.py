@@ -0,0 +1,149 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from graphene.relay import PageInfo
+from graphene_django.filter.fields import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql import GraphQLError
+
+CURSOR_PREFIX = "keyset:"
+
+
+def order_by_unique(queryset, *ordering):
+    """
+    Order queryset by ordering, whose last field already identifies the
+    row, such as the row id of a through table. get_ordering keeps it as
+    is instead of appending the primary key, until the queryset is ordered
+    differently.
+    """
+    queryset = queryset.order_by(*ordering)
+    queryset.query.unique_ordering = ordering
+    return queryset
+
+
+def get_ordering(queryset):
+    """
+    The ordering of queryset as field names, with the primary key appended
+    so that every row has a unique position, unless it is already ordered
+    by its primary key or was ordered with order_by_unique.
+    """
+    if queryset.query.order_by:
+        ordering = list(queryset.query.order_by)
+    elif queryset.query.default_ordering:
+        ordering = list(queryset.model._meta.ordering)
+    else:
+        ordering = []
+    if not all(isinstance(field, str) and "__" not in field for field in ordering):
+        return None
+    unique = getattr(queryset.query, "unique_ordering", None) == tuple(ordering)
+    names = [field.lstrip("-") for field in ordering]
+    if not unique and not any(name in ("pk", "id") for name in names):
+        descending = bool(ordering) and ordering[-1].startswith("-")
+        ordering.append("-pk" if descending else "pk")
+    return ordering
+
+
+def encode_cursor(node, ordering):
+    values = []
+    for field in ordering:
+        value = getattr(node, field.lstrip("-"))
+        values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+    return b64encode((CURSOR_PREFIX + json.dumps(values)).encode()).decode()
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        decoded = b64decode(cursor.encode()).decode()
+        values = json.loads(decoded[len(CURSOR_PREFIX) :])
+    except ValueError:
+        raise GraphQLError(f"Invalid cursor {cursor}")
+    if (
+        not decoded.startswith(CURSOR_PREFIX)
+        or not isinstance(values, list)
+        or len(values) != len(ordering)
+    ):
+        raise GraphQLError(f"Invalid cursor {cursor}")
+    return values
+
+
+def seek(ordering, values, forward=True):
+    """
+    Filter for the rows after (or before) the row at values, i.e. the
+    expanded form of (a, b, c) < (x, y, z) that databases can answer with
+    an index range scan.
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") == forward else "gt"
+        equal = {ordering[j].lstrip("-"): values[j] for j in range(i)}
+        condition |= Q(**equal, **{f"{name}__{lookup}": values[i]})
+    return condition
+
+
+class KeysetConnectionField(DjangoFilterConnectionField):
+    """
+    A DjangoFilterConnectionField whose cursors hold the ordering values of
+    the row instead of its offset, so every page is a LIMIT query seeking
+    from the previous cursor no matter how deep it is. Querysets whose
+    ordering can't be read from the row fall back to offset cursors.
+    """
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        iterable = maybe_queryset(iterable)
+        ordering = get_ordering(iterable) if isinstance(iterable, QuerySet) else None
+        if ordering is None:
+            return super().resolve_connection(connection, args, iterable, max_limit)
+
+        first = args.get("first")
+        last = args.get("last")
+        after = args.get("after")
+        before = args.get("before")
+        offset = args.get("offset") or 0
+        if first is None and last is None:
+            first = max_limit
+
+        queryset = iterable.order_by(*ordering)
+        if after:
+            queryset = queryset.filter(seek(ordering, decode_cursor(after, ordering)))
+        if before:
+            queryset = queryset.filter(
+                seek(ordering, decode_cursor(before, ordering), forward=False)
+            )
+
+        if first is None and last is None:
+            nodes = list(queryset[offset:])
+            has_previous_page = bool(after or offset)
+            has_next_page = False
+        elif first is not None:
+            nodes = list(queryset[offset : offset + first + 1])
+            has_next_page = len(nodes) > first
+            nodes = nodes[:first]
+            has_previous_page = bool(after or offset)
+            if last is not None:
+                has_previous_page = has_previous_page or len(nodes) > last
+                nodes = nodes[-last:] if last else []
+        else:
+            nodes = list(queryset.reverse()[offset : offset + last + 1])
+            has_previous_page = len(nodes) > last
+            nodes = nodes[:last][::-1]
+            has_next_page = bool(before or offset)
+
+        edges = [
+            connection.Edge(node=node, cursor=encode_cursor(node, ordering))
+            for node in nodes
+        ]
+        result = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
+        result.iterable = iterable
+        return result
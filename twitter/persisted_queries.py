@@ -0,0 +1,91 @@
+import json
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+
+from django.conf import settings
+from graphql.backend.base import GraphQLBackend
+
+from .documents import build_document, document_cache
+
+
+def hash_query(query):
+    return sha256(query.encode()).hexdigest()
+
+
+class PersistedQueryRegistry:
+    """
+    Parsed and validated documents by the sha256 hash of their text. The
+    documents of the manifest are kept forever, the ones registered by
+    clients at runtime (automatic persisted queries) only up to max_size.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.manifest = {}
+        self.registered = OrderedDict()
+        self.by_text = {}
+        self.manifest_loaded = False
+        self.lock = threading.Lock()
+
+    def load_manifest(self, schema, path):
+        """
+        Load a JSON manifest, either an object of hash to query or a list of
+        queries, as produced by the frontend build.
+        """
+        with open(path) as manifest:
+            queries = json.load(manifest)
+        if isinstance(queries, dict):
+            queries = queries.values()
+        for query in queries:
+            document = build_document(schema, query)
+            self.manifest[hash_query(query)] = document
+            self.by_text[query] = document
+
+    def ensure_manifest(self, schema):
+        if self.manifest_loaded:
+            return
+        with self.lock:
+            if not self.manifest_loaded and settings.GRAPHQL_PERSISTED_QUERIES_MANIFEST:
+                self.load_manifest(schema, settings.GRAPHQL_PERSISTED_QUERIES_MANIFEST)
+            self.manifest_loaded = True
+
+    def get(self, query_hash):
+        return self.manifest.get(query_hash) or self.registered.get(query_hash)
+
+    def get_by_text(self, query):
+        return self.by_text.get(query)
+
+    def register(self, schema, query_hash, query):
+        if hash_query(query) != query_hash:
+            raise ValueError("provided sha does not match query")
+        document = self.get(query_hash)
+        if document is not None:
+            return document
+        document = build_document(schema, query)
+        with self.lock:
+            self.registered[query_hash] = document
+            self.by_text[query] = document
+            while len(self.registered) > self.max_size:
+                _, evicted = self.registered.popitem(last=False)
+                self.by_text.pop(evicted.document_string, None)
+        return document
+
+
+registry = PersistedQueryRegistry(settings.GRAPHQL_PERSISTED_QUERIES_MAX_REGISTERED)
+
+
+class PersistedQueryBackend(GraphQLBackend):
+    """
+    Serves persisted documents, and other documents through the document
+    cache, without parsing or validating them again.
+    """
+
+    def document_from_string(self, schema, document_string):
+        document = registry.get_by_text(document_string)
+        if document is not None:
+            return document
+        return document_cache.get(schema, document_string)
+
+
+backend = PersistedQueryBackend()
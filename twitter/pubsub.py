@@ -0,0 +1,180 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from rx import Observable
+from rx.concurrency import ThreadPoolScheduler
+
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    """
+    Publish/subscribe between the threads of one process. Events go to
+    groups named by a kind and a key, such as ("timeline", user_id). Events
+    of other processes reach it through the receivers of the layer.
+    """
+
+    def __init__(self):
+        self.groups = defaultdict(dict)
+        self.lock = threading.Lock()
+
+    def subscribe(self, kind, key):
+        """Observable of the events published to the group."""
+
+        def on_subscribe(observer):
+            with self.lock:
+                self.groups[kind].setdefault(key, set()).add(observer)
+
+            def dispose():
+                with self.lock:
+                    observers = self.groups[kind].get(key)
+                    if observers is not None:
+                        observers.discard(observer)
+                        if not observers:
+                            del self.groups[kind][key]
+
+            return dispose
+
+        return Observable.create(on_subscribe)
+
+    def listening(self, kind):
+        """Keys of the groups of kind that have subscribers."""
+        with self.lock:
+            return set(self.groups[kind])
+
+    def publish(self, kind, key, event):
+        with self.lock:
+            observers = list(self.groups[kind].get(key, ()))
+        for observer in observers:
+            observer.on_next(event)
+
+
+broker = Broker()
+
+# Functions turning the events sent by any process into publishes to the
+# broker of this one, by event name. See send_on_commit.
+receivers = {}
+
+
+def receiver(name):
+    """Register the decorated function as the receiver of the events name."""
+
+    def register(function):
+        receivers[name] = function
+        return function
+
+    return register
+
+
+class LocalLayer:
+    """Delivers events to the receivers of the process that sent them."""
+
+    def send(self, name, args):
+        receivers[name](*args)
+
+    def listen(self):
+        pass
+
+
+class RedisLayer:
+    """
+    Delivers events to the receivers of every process listening on a Redis
+    pub/sub channel, so the subscriptions of any ASGI worker get the events
+    of the mutations of any process.
+    """
+
+    def __init__(self, url, channel="graphql-events"):
+        # Only needed with this layer.
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.errors = redis.RedisError
+        self.channel = channel
+        self.listener = None
+        self.lock = threading.Lock()
+
+    def send(self, name, args):
+        # Sent once the mutation committed, delivery is best effort and must
+        # not fail the mutation.
+        try:
+            self.client.publish(self.channel, json.dumps([name, args]))
+        except self.errors:
+            logger.exception("Couldn't send %s to the %s channel", name, self.channel)
+
+    def listen(self):
+        """Start receiving the events of all processes, once per process."""
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.run, daemon=True)
+                self.listener.start()
+
+    def run(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self.receive(message["data"])
+            except Exception:
+                # Events sent while reconnecting are lost, as with any
+                # Redis pub/sub subscriber.
+                logger.exception("Lost the %s channel, reconnecting", self.channel)
+                time.sleep(1)
+
+    def receive(self, data):
+        name, args = json.loads(data)
+        try:
+            receivers[name](*args)
+        except Exception:
+            logger.exception("Receiver of %s failed", name)
+        finally:
+            close_old_connections()
+
+
+def get_layer():
+    if settings.GRAPHQL_PUBSUB_REDIS_URL:
+        return RedisLayer(settings.GRAPHQL_PUBSUB_REDIS_URL)
+    return LocalLayer()
+
+
+layer = get_layer()
+
+
+def send_on_commit(name, *args):
+    """
+    Once the current transaction commits, if it does, run the receiver of
+    name with args in every process serving subscriptions. The args go
+    through JSON: ids rather than model instances.
+    """
+    transaction.on_commit(partial(layer.send, name, list(args)))
+
+# Subscribers resolve their events here rather than in the thread that
+# published them, which is usually handling a mutation.
+scheduler = ThreadPoolScheduler(settings.GRAPHQL_SUBSCRIPTION_WORKERS)
+
+
+def subscribe(info, kind, keys):
+    """
+    Observable of the events published to the groups (kind, key) of keys,
+    for a subscription resolver. The loaders of the context are reset for
+    every event, the values they cached are out of date by then, so the
+    context must belong to this subscription alone.
+    """
+    context = info.context
+    layer.listen()
+
+    def reset_loaders(event):
+        context.loaders = {}
+
+    return (
+        Observable.merge([broker.subscribe(kind, key) for key in keys])
+        .observe_on(scheduler)
+        .do_action(reset_loaders)
+    )
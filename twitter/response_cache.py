@@ -0,0 +1,56 @@
+import json
+from hashlib import sha256
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from graphql_jwt.utils import get_http_authorization
+
+VERSION_KEY = "graphql-response:version"
+
+
+def get_version():
+    return cache.get_or_set(VERSION_KEY, lambda: uuid4().hex, timeout=None)
+
+
+def bump_version():
+    cache.set(VERSION_KEY, uuid4().hex, timeout=None)
+
+
+def invalidate_responses():
+    """
+    Drop every cached response once the current transaction commits, so no
+    request can cache what was read before the change.
+    """
+    transaction.on_commit(bump_version)
+
+
+def is_anonymous(request):
+    return not request.user.is_authenticated and not get_http_authorization(request)
+
+
+def get_cache_key(request, query, variables, operation_name):
+    """
+    Key of the response to an anonymous request. The query is hashed as
+    sent, normalizing it would have to parse its string literals; media
+    urls depend on the host so it is part of the key.
+    """
+    key = json.dumps(
+        [
+            query,
+            variables or {},
+            operation_name,
+            request.get_host(),
+        ],
+        sort_keys=True,
+    )
+    return f"graphql-response:{get_version()}:{sha256(key.encode()).hexdigest()}"
+
+
+def get_cached_response(key):
+    return cache.get(key)
+
+
+def cache_response(key, data, extensions):
+    cache.set(key, (data, extensions), settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT)
@@ -1,16 +1,54 @@
 import graphene
 from graphql_auth import mutations
-from tweet.schema import TweetMutation, TweetQuery
-from users.schema import (AcceptFollow, FollowQuery, MeQuery, UserMutation,
-                          UserQuery)
+from graphql_jwt.refresh_token.utils import get_refresh_token_model
+from graphql_jwt.settings import jwt_settings
+from tweet.schema import TweetMutation, TweetQuery, TweetSubscription
+from users.schema import (AcceptFollow, FollowQuery, FollowSubscription,
+                          MeQuery, UserMutation, UserQuery)
+from users.tokens import invalidate_user_tokens
+
+from .response_cache import invalidate_responses
+
+
+class Register(mutations.Register):
+    @classmethod
+    def mutate(cls, root, info, **input):
+        result = super().mutate(root, info, **input)
+        invalidate_responses()
+        return result
+
+
+class UpdateAccount(mutations.UpdateAccount):
+    @classmethod
+    def mutate(cls, root, info, **input):
+        result = super().mutate(root, info, **input)
+        invalidate_responses()
+        return result
+
+
+class RevokeToken(mutations.RevokeToken):
+    @classmethod
+    def mutate(cls, root, info, **input):
+        result = super().mutate(root, info, **input)
+        token = input.get("refresh_token") or info.context.COOKIES.get(
+            jwt_settings.JWT_REFRESH_TOKEN_COOKIE_NAME
+        )
+        user_ids = (
+            get_refresh_token_model()
+            .objects.filter(token=token, revoked__isnull=False)
+            .values_list("user_id", flat=True)
+        )
+        for user_id in user_ids:
+            invalidate_user_tokens(user_id)
+        return result
 
 
 class AuthMutation(graphene.ObjectType):
-    register = mutations.Register.Field()
-    update_account = mutations.UpdateAccount.Field()
+    register = Register.Field()
+    update_account = UpdateAccount.Field()
     token_auth = mutations.ObtainJSONWebToken.Field()
     refresh_token = mutations.RefreshToken.Field()
-    revoke_token = mutations.RevokeToken.Field()
+    revoke_token = RevokeToken.Field()
 
 
 class Query(UserQuery, MeQuery, TweetQuery, FollowQuery, graphene.ObjectType):
@@ -23,4 +61,8 @@ class Mutation(
     pass
 
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+class Subscription(TweetSubscription, FollowSubscription, graphene.ObjectType):
+    pass
+
+
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
@@ -65,7 +65,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "twitter.middleware.whitenoise_middleware",
 ]
 
 CORS_ORIGIN_WHITELIST = ["http://localhost:3000"]
@@ -106,6 +106,10 @@ if PRODUCTION:
             "HOST": os.environ.get("DB_HOST", "localhost"),
             "PORT": os.environ.get("DB_PORT", "3306"),
             "OPTIONS": json.loads(os.environ.get("DB_OPTIONS", '{"charset": "utf8mb4"}')),
+            # Seconds a connection is kept open to serve later requests of
+            # its thread, instead of connecting for each one. 0 closes it
+            # after every request.
+            "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
         },
     }
 else:
@@ -120,6 +124,22 @@ else:
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/ref/settings/#caches
+# The local memory cache is per process, so invalidations only reach the
+# process that made them. Use a shared backend, e.g. the file based one,
+# when running several workers.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
+
 # GraphQL
 
 
@@ -127,11 +147,51 @@ GRAPHENE = {
     "SCHEMA": "twitter.schema.schema",
     "MIDDLEWARE": [
         "graphql_jwt.middleware.JSONWebTokenMiddleware",
+        "twitter.metrics.MetricsMiddleware",
     ],
 }
 
+# /metrics is served to these addresses, or to requests sending
+# "Authorization: Bearer <METRICS_TOKEN>" when a token is set.
+INTERNAL_IPS = os.environ.get("INTERNAL_IPS", "127.0.0.1").split(",")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# JSON file of the queries the frontend sends, loaded as persisted queries.
+GRAPHQL_PERSISTED_QUERIES_MANIFEST = os.environ.get("GRAPHQL_PERSISTED_QUERIES_MANIFEST")
+# Reject every query that is not in the manifest.
+GRAPHQL_PERSISTED_QUERIES_ONLY = os.environ.get(
+    "GRAPHQL_PERSISTED_QUERIES_ONLY", ""
+).lower() in ("true", "t", "1")
+# How many queries clients may register at runtime, per process.
+GRAPHQL_PERSISTED_QUERIES_MAX_REGISTERED = int(
+    os.environ.get("GRAPHQL_PERSISTED_QUERIES_MAX_REGISTERED", 1000)
+)
+
+# How long responses to anonymous queries are cached, in seconds.
+GRAPHQL_RESPONSE_CACHE_TIMEOUT = int(os.environ.get("GRAPHQL_RESPONSE_CACHE_TIMEOUT", 60))
+# Queries nested deeper or estimated to cost more are rejected, the cost of
+# a connection is multiplied by the nodes it asks for.
+GRAPHQL_MAX_DEPTH = int(os.environ.get("GRAPHQL_MAX_DEPTH", 10))
+GRAPHQL_MAX_COST = int(os.environ.get("GRAPHQL_MAX_COST", 5000))
+# How many parsed and validated queries are kept, per process.
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(os.environ.get("GRAPHQL_DOCUMENT_CACHE_SIZE", 256))
+# Serve GraphQL from an async view, twitter/asgi.py turns it on. Each
+# process runs up to GRAPHQL_ASYNC_WORKERS requests at a time, and the loader
+# batches of a request at the same time in a pool of GRAPHQL_LOADER_WORKERS
+# threads shared by the process. Every thread holds its own connection,
+# kept open for DB_CONN_MAX_AGE seconds.
+GRAPHQL_ASYNC = os.environ.get("GRAPHQL_ASYNC", "").lower() in ("true", "t", "1")
+GRAPHQL_ASYNC_WORKERS = int(os.environ.get("GRAPHQL_ASYNC_WORKERS", 8))
+GRAPHQL_LOADER_WORKERS = int(os.environ.get("GRAPHQL_LOADER_WORKERS", 8))
+# Threads resolving the events of subscriptions, per process.
+GRAPHQL_SUBSCRIPTION_WORKERS = int(os.environ.get("GRAPHQL_SUBSCRIPTION_WORKERS", 4))
+# Redis URL of the pub/sub channel carrying the events of subscriptions
+# between processes. Without it, subscriptions only get the events of the
+# mutations served by their own process.
+GRAPHQL_PUBSUB_REDIS_URL = os.environ.get("GRAPHQL_PUBSUB_REDIS_URL")
+
 AUTHENTICATION_BACKENDS = [
-    "graphql_auth.backends.GraphQLAuthBackend",
+    "users.backends.CachedJSONWebTokenBackend",
     "django.contrib.auth.backends.ModelBackend",
 ]
 
@@ -149,6 +209,10 @@ GRAPHQL_JWT = {
     "JWT_COOKIE_SAMESITE": "None"
 }
 
+# How long the user of a verified token is cached, in seconds. Saving the
+# user or revoking one of their refresh tokens drops it earlier.
+JWT_USER_CACHE_TIMEOUT = int(os.environ.get("JWT_USER_CACHE_TIMEOUT", 60))
+
 GRAPHQL_AUTH = {
     "UPDATE_MUTATION_FIELDS": ["email", "username", "display_name", "bio"],
     "REGISTER_MUTATION_FIELDS": ["email", "username", "display_name"],
@@ -168,6 +232,36 @@ GRAPHQL_AUTH = {
 }
 
 
+# Home timeline
+
+# Authors with more followers than this are not copied into follower
+# timelines on post; their tweets are merged in when the timeline is read.
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.environ.get("TIMELINE_FANOUT_MAX_FOLLOWERS", 10000))
+# How many recent tweets of an author are copied in when someone follows them.
+TIMELINE_BACKFILL_LIMIT = int(os.environ.get("TIMELINE_BACKFILL_LIMIT", 200))
+
+# How many of the most recent tweets matching a search are ranked, on SQLite.
+TWEET_SEARCH_MAX_MATCHES = int(os.environ.get("TWEET_SEARCH_MAX_MATCHES", 1000))
+# How many users matching a searchUsers prefix, for each of the username
+# and the display name, are ranked from the key indexes. Prefixes matching
+# more users are searched from the most followed users instead.
+USER_SEARCH_MAX_MATCHES = int(os.environ.get("USER_SEARCH_MAX_MATCHES", 100))
+# How many accounts are kept in the "who to follow" suggestions of a user,
+# and how many of the most followed accounts are suggested to users who
+# have none.
+FOLLOW_SUGGESTIONS_PER_USER = int(os.environ.get("FOLLOW_SUGGESTIONS_PER_USER", 50))
+
+
+# Tweet images
+
+# Uploaded tweet images are re-encoded at these widths by the
+# process_tweet_images command.
+TWEET_IMAGE_WIDTHS = [
+    int(width) for width in os.environ.get("TWEET_IMAGE_WIDTHS", "320,640,1280").split(",")
+]
+TWEET_IMAGE_QUALITY = int(os.environ.get("TWEET_IMAGE_QUALITY", 80))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -219,6 +313,9 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "users.User"
 
 
+EMAIL_BACKEND = os.environ.get(
+    "EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend"
+)
 EMAIL_HOST = os.environ.get("EMAIL_HOST")
 EMAIL_PORT = os.environ.get("EMAIL_PORT")
 EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER")
@@ -226,6 +323,11 @@ EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
 EMAIL_USE_SSL = os.environ.get("EMAIL_USE_SSL", "").lower() in ("true", "1", "t")
 DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL")
 
+# Queued emails are retried with exponential backoff starting at this many
+# seconds, and given up after EMAIL_OUTBOX_MAX_ATTEMPTS failed sends.
+EMAIL_OUTBOX_RETRY_DELAY = int(os.environ.get("EMAIL_OUTBOX_RETRY_DELAY", 60))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 8))
+
 # AWS_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID")
 # AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
 # AWS_STORAGE_BUCKET_NAME = os.environ.get("AWS_STORAGE_BUCKET_NAME")
@@ -0,0 +1,58 @@
+import json
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from graphql_jwt.shortcuts import get_token
+from users.models import User
+
+
+class GraphQLTestMixin:
+    """
+    Helpers of the tests that send GraphQL requests. The cache is cleared
+    before each test: tokens issued in the same second for the same
+    username are identical, and would find the cached user of an earlier
+    test, whose rows were rolled back.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    @staticmethod
+    def create_user(username, **fields):
+        return User.objects.create_user(
+            email=f"{username}@example.com", password="secret", username=username, **fields
+        )
+
+    def post(self, query, variables=None, user=None, token=None):
+        """
+        Send query to /graphql/, signed in as user or with token when given,
+        and return the JSON response. The SQL queries it ran are kept in
+        self.queries.
+        """
+        headers = {}
+        if user is not None:
+            token = get_token(user)
+        if token is not None:
+            headers["HTTP_AUTHORIZATION"] = f"JWT {token}"
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/graphql/",
+                json.dumps({"query": query, "variables": variables or {}}),
+                content_type="application/json",
+                **headers,
+            )
+        self.queries = queries.captured_queries
+        return response.json()
+
+    def execute(self, query, variables=None, user=None, token=None):
+        """The data of query, which must run without errors."""
+        response = self.post(query, variables, user=user, token=token)
+        self.assertNotIn("errors", response)
+        return response["data"]
+
+
+class GraphQLTestCase(GraphQLTestMixin, TestCase):
+    pass
@@ -0,0 +1,480 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock, skipIf
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from tweet.models import Tweet
+from users.loaders import UserLoader
+from users.models import User
+
+from . import loaders
+from .documents import DocumentCache
+from .loaders import get_loader, run_batch, wait_for_batches
+from .middleware import whitenoise_middleware
+from .metrics import field_duration, operation_duration, operation_queries
+from .pagination import get_ordering, order_by_unique
+from .persisted_queries import hash_query, registry
+from .pubsub import RedisLayer
+from .response_cache import get_cache_key
+from .schema import schema
+from .testing import GraphQLTestCase, GraphQLTestMixin
+from .views import GraphQLView, async_view
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+TWEETS_QUERY = "query { tweets(first: 5) { edges { node { text } } } }"
+
+
+class ResponseCacheTest(GraphQLTestCase):
+    """Anonymous queries are answered from the cache until a mutation."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = cls.create_user("author")
+        Tweet.objects.create(user=cls.author, text="first")
+
+    def texts(self, data):
+        return [edge["node"]["text"] for edge in data["tweets"]["edges"]]
+
+    def test_hit(self):
+        first = self.execute(TWEETS_QUERY)
+        self.assertTrue(self.queries)
+        self.assertEqual(self.execute(TWEETS_QUERY), first)
+        self.assertEqual(self.queries, [])
+
+    def test_mutation_invalidates(self):
+        self.assertEqual(self.texts(self.execute(TWEETS_QUERY)), ["first"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.execute(
+                'mutation { postTweet(text: "second") { success } }', user=self.author
+            )
+        self.assertEqual(self.texts(self.execute(TWEETS_QUERY)), ["second", "first"])
+
+    def test_authenticated_requests_bypass(self):
+        self.execute(TWEETS_QUERY, user=self.author)
+        self.execute(TWEETS_QUERY, user=self.author)
+        self.assertTrue(self.queries)
+        # Nor do they fill the cache for anonymous visitors.
+        self.execute(TWEETS_QUERY)
+        self.assertTrue(self.queries)
+
+    def test_key_keeps_string_literals(self):
+        request = RequestFactory().post("/graphql/")
+        self.assertNotEqual(
+            get_cache_key(request, '{ user(username: "a  b") { pk } }', None, None),
+            get_cache_key(request, '{ user(username: "a b") { pk } }', None, None),
+        )
+
+
+class DocumentCacheTest(SimpleTestCase):
+    queries = [f"query {{ user(username: \"{name}\") {{ pk }} }}" for name in "abc"]
+
+    def test_hits_and_misses(self):
+        documents = DocumentCache(2)
+        first = documents.get(schema, self.queries[0])
+        self.assertEqual((documents.hits, documents.misses), (0, 1))
+        self.assertIs(documents.get(schema, self.queries[0]), first)
+        self.assertEqual((documents.hits, documents.misses), (1, 1))
+        documents.clear()
+        self.assertEqual((documents.hits, documents.misses), (0, 0))
+        self.assertIsNot(documents.get(schema, self.queries[0]), first)
+
+    def test_least_recently_used_evicted(self):
+        documents = DocumentCache(2)
+        a, b, c = self.queries
+        documents.get(schema, a)
+        documents.get(schema, b)
+        documents.get(schema, a)
+        documents.get(schema, c)
+        self.assertEqual(list(documents.documents), [a, c])
+        documents.get(schema, b)
+        self.assertEqual(list(documents.documents), [c, b])
+        self.assertEqual((documents.hits, documents.misses), (1, 4))
+
+    def test_invalid_query(self):
+        documents = DocumentCache(2)
+        document = documents.get(schema, "query { nothing }")
+        self.assertTrue(document.execute().invalid)
+        self.assertIs(documents.get(schema, "query { nothing }"), document)
+
+
+class PersistedQueryTest(GraphQLTestCase):
+    """Queries sent by the sha256 hash of their text."""
+
+    other_query = "query { tweets(first: 1) { edges { node { pk } } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        Tweet.objects.create(user=cls.create_user("author"), text="first")
+
+    def setUp(self):
+        super().setUp()
+        # The registry lives as long as the process, start each test empty.
+        patcher = mock.patch.multiple(
+            registry,
+            manifest={},
+            registered=OrderedDict(),
+            by_text={},
+            manifest_loaded=False,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_persisted(self, query_hash, query=None):
+        persisted_query = {"version": 1, "sha256Hash": query_hash}
+        data = {"extensions": {"persistedQuery": persisted_query}}
+        if query is not None:
+            data["query"] = query
+        return self.client.post(
+            "/graphql/", json.dumps(data), content_type="application/json"
+        )
+
+    def texts(self, data):
+        return [edge["node"]["text"] for edge in data["tweets"]["edges"]]
+
+    def assertRejected(self, response, status_code, message):
+        self.assertEqual(response.status_code, status_code)
+        self.assertEqual(
+            [error["message"] for error in response.json()["errors"]], [message]
+        )
+
+    def test_register_then_hash_only(self):
+        query_hash = hash_query(TWEETS_QUERY)
+        response = self.post_persisted(query_hash)
+        self.assertRejected(response, 200, "PersistedQueryNotFound")
+        registered = self.post_persisted(query_hash, TWEETS_QUERY).json()
+        self.assertEqual(self.texts(registered["data"]), ["first"])
+        cache.clear()
+        response = self.post_persisted(query_hash).json()
+        self.assertEqual(response["data"], registered["data"])
+
+    def test_mismatched_hash(self):
+        query_hash = hash_query(self.other_query)
+        self.assertRejected(
+            self.post_persisted(query_hash, TWEETS_QUERY),
+            400,
+            "provided sha does not match query",
+        )
+        self.assertIsNone(registry.get(query_hash))
+        self.assertIsNone(registry.get(hash_query(TWEETS_QUERY)))
+
+    def test_persisted_only(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        manifest = os.path.join(directory, "manifest.json")
+        with open(manifest, "w") as output:
+            json.dump({hash_query(TWEETS_QUERY): TWEETS_QUERY}, output)
+        with self.settings(
+            GRAPHQL_PERSISTED_QUERIES_MANIFEST=manifest,
+            GRAPHQL_PERSISTED_QUERIES_ONLY=True,
+        ):
+            self.assertEqual(self.texts(self.execute(TWEETS_QUERY)), ["first"])
+            cache.clear()
+            response = self.post_persisted(hash_query(TWEETS_QUERY)).json()
+            self.assertEqual(self.texts(response["data"]), ["first"])
+            response = self.client.post(
+                "/graphql/",
+                json.dumps({"query": self.other_query}),
+                content_type="application/json",
+            )
+            self.assertRejected(response, 400, "PersistedQueryNotAllowed")
+            other_hash = hash_query(self.other_query)
+            response = self.post_persisted(other_hash, self.other_query)
+            self.assertRejected(response, 400, "PersistedQueryNotAllowed")
+            self.assertIsNone(registry.get(other_hash))
+
+
+class QueryComplexityTest(GraphQLTestCase):
+    """Queries nested too deep or asking for too much are not executed."""
+
+    # Depth 3, tweets, their user and its username. Cost 1 for the tweets
+    # and 1 for the user of each of the $first tweets.
+    query = """
+    query($first: Int) {
+      tweets(first: $first) { edges { node { text user { username } } } }
+    }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Tweet.objects.create(user=cls.create_user("author"), text="first")
+
+    def test_reported(self):
+        response = self.post(self.query, {"first": 5})
+        self.assertNotIn("errors", response)
+        self.assertEqual(response["extensions"]["complexity"], {"depth": 3, "cost": 6})
+
+    @override_settings(GRAPHQL_MAX_DEPTH=2)
+    def test_too_deep(self):
+        response = self.post(self.query, {"first": 5})
+        self.assertEqual(
+            [error["message"] for error in response["errors"]],
+            ["Query depth 3 exceeds the limit of 2."],
+        )
+        self.assertIsNone(response.get("data"))
+        self.assertEqual(response["extensions"]["complexity"], {"depth": 3, "cost": 6})
+        self.assertEqual(self.queries, [])
+
+    @override_settings(GRAPHQL_MAX_COST=5)
+    def test_too_costly(self):
+        response = self.post(self.query, {"first": 5})
+        self.assertEqual(
+            [error["message"] for error in response["errors"]],
+            ["Query cost 6 exceeds the limit of 5."],
+        )
+        self.assertEqual(self.queries, [])
+        # The cost depends on the variables of each request.
+        response = self.post(self.query, {"first": 4})
+        self.assertNotIn("errors", response)
+        self.assertEqual(response["extensions"]["complexity"], {"depth": 3, "cost": 5})
+
+
+class MetricsTest(GraphQLTestCase):
+    """Operations and fields are timed and served to Prometheus at /metrics."""
+
+    query = "query MetricsTweets { tweets(first: 1) { edges { node { text } } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        Tweet.objects.create(user=cls.create_user("author"), text="first")
+
+    def count(self, histogram, label):
+        series = histogram.series.get(label)
+        return series[2] if series else 0
+
+    def test_recorded(self):
+        observed = [
+            (operation_duration, "MetricsTweets"),
+            (operation_queries, "MetricsTweets"),
+            (field_duration, "Query.tweets"),
+            (field_duration, "TweetNode.text"),
+        ]
+        before = [self.count(histogram, label) for histogram, label in observed]
+        self.execute(self.query)
+        after = [self.count(histogram, label) for histogram, label in observed]
+        self.assertEqual(after, [count + 1 for count in before])
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        operation = 'operation="MetricsTweets"'
+        field = 'field="TweetNode.text"'
+        for line in (
+            "# TYPE graphql_operation_duration_seconds histogram",
+            f"graphql_operation_duration_seconds_count{{{operation}}} {after[0]}",
+            f'graphql_operation_sql_queries_bucket{{{operation},le="+Inf"}} {after[1]}',
+            f"graphql_field_duration_seconds_count{{{field}}} {after[3]}",
+            "# TYPE graphql_document_cache_hits_total counter",
+        ):
+            self.assertIn(line, text.splitlines())
+
+    def test_access(self):
+        self.assertEqual(
+            self.client.get("/metrics", REMOTE_ADDR="10.0.0.1").status_code, 404
+        )
+        with self.settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+            response = self.client.get(
+                "/metrics", REMOTE_ADDR="10.0.0.1", HTTP_AUTHORIZATION="Bearer secret"
+            )
+            self.assertEqual(response.status_code, 200)
+
+
+class OrderingTest(SimpleTestCase):
+    def test_primary_key_appended(self):
+        self.assertEqual(get_ordering(Tweet.objects.all()), ["-created_at", "-pk"])
+        tweets = Tweet.objects.order_by("user_id")
+        self.assertEqual(get_ordering(tweets), ["user_id", "pk"])
+        self.assertEqual(get_ordering(Tweet.objects.order_by("-id")), ["-id"])
+
+    def test_unique_ordering(self):
+        users = order_by_unique(User.objects.filter(is_active=True), "username")
+        self.assertEqual(get_ordering(users.filter(private=False)), ["username"])
+        users = users.order_by("-followers_count")
+        self.assertEqual(get_ordering(users), ["-followers_count", "-pk"])
+
+    def test_unsupported(self):
+        self.assertIsNone(get_ordering(Tweet.objects.order_by("user__username")))
+
+
+class KeysetPaginationTest(GraphQLTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = cls.create_user("author")
+        for i in range(7):
+            Tweet.objects.create(user=author, text=f"tweet {i}")
+        Tweet.objects.update(created_at=timezone.now())
+
+    def test_pages_over_ties(self):
+        # The tweets have the same likes and time, only the primary key
+        # orders them.
+        query = """
+        query($after: String) {
+          tweets(first: 2, after: $after, sort: MOST_LIKED) {
+            pageInfo { endCursor hasNextPage }
+            edges { node { pk } }
+          }
+        }
+        """
+        pks = []
+        after = None
+        while True:
+            tweets = self.execute(query, {"after": after})["tweets"]
+            pks += [edge["node"]["pk"] for edge in tweets["edges"]]
+            if not tweets["pageInfo"]["hasNextPage"]:
+                break
+            after = tweets["pageInfo"]["endCursor"]
+        expected = Tweet.objects.order_by("-pk").values_list("pk", flat=True)
+        self.assertEqual(pks, list(expected))
+
+
+class LoaderBatchTest(SimpleTestCase):
+    """Batches run in the loader pool and are settled by wait_for_batches."""
+
+    def setUp(self):
+        pool = ThreadPoolExecutor(2)
+        self.addCleanup(pool.shutdown)
+        self.request = SimpleNamespace(loader_pool=pool, pending_batches=[])
+
+    def load(self, keys):
+        return [(key, threading.current_thread().name) for key in keys]
+
+    def test_in_place_without_pool(self):
+        promise = run_batch(SimpleNamespace(), self.load, [1])
+        self.assertEqual(promise.get(), [(1, threading.current_thread().name)])
+
+    def test_chained_batches(self):
+        # The second batch only starts once the first is settled, the way
+        # resolvers load the fields of loaded objects.
+        promise = run_batch(self.request, self.load, [1, 2]).then(
+            lambda rows: run_batch(self.request, self.load, [rows[-1][0] + 1])
+        )
+        self.assertTrue(promise.is_pending)
+        [(key, thread)] = wait_for_batches(self.request, promise)
+        self.assertEqual(key, 3)
+        self.assertNotEqual(thread, threading.current_thread().name)
+        self.assertEqual(self.request.pending_batches, [])
+
+    def test_failed_batch(self):
+        def fail(keys):
+            raise ValueError(keys)
+
+        promise = run_batch(self.request, fail, [1])
+        with self.assertRaises(ValueError):
+            wait_for_batches(self.request, promise)
+
+
+class LoadNowTest(GraphQLTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = cls.create_user("alice")
+        cls.bob = cls.create_user("bob")
+
+    def test_cached(self):
+        info = SimpleNamespace(context=SimpleNamespace())
+        loader = get_loader(info, UserLoader)
+        with self.assertNumQueries(1):
+            self.assertEqual(loader.load_now(self.alice.pk), self.alice)
+            self.assertEqual(loader.load_now(self.alice.pk), self.alice)
+        with self.assertNumQueries(1):
+            loader.load_many([self.alice.pk, self.bob.pk]).get()
+            self.assertEqual(loader.load_now(self.bob.pk), self.bob)
+
+
+class AsyncMiddlewareTest(SimpleTestCase):
+    def test_async_get_response(self):
+        async def get_response(request):
+            return "response"
+
+        middleware = whitenoise_middleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = RequestFactory().get("/graphql/")
+        self.assertEqual(async_to_sync(middleware)(request), "response")
+
+    def test_sync_get_response(self):
+        middleware = whitenoise_middleware(lambda request: "response")
+        self.assertFalse(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(middleware(RequestFactory().get("/graphql/")), "response")
+
+
+class AsyncViewTest(GraphQLTestMixin, TransactionTestCase):
+    """
+    The async view answers as the synchronous one, with the loader batches
+    run in its pool on their own connections.
+    """
+
+    query = """
+    query {
+      tweets(first: 5) {
+        edges { node { text isLiked imageVariants { width } user { username } } }
+      }
+    }
+    """
+
+    def setUp(self):
+        super().setUp()
+        for name in ("alice", "bob"):
+            author = self.create_user(name)
+            Tweet.objects.create(user=author, text=f"by {name}")
+        self.view = async_view(csrf_exempt(GraphQLView.as_view()))
+
+    def post_async(self, query):
+        request = RequestFactory().post(
+            "/graphql/", json.dumps({"query": query}), content_type="application/json"
+        )
+        request.user = AnonymousUser()
+        threads = set()
+        run_in_thread = loaders.run_in_thread
+
+        def record_thread(fn, keys):
+            threads.add(threading.current_thread().name)
+            return run_in_thread(fn, keys)
+
+        with mock.patch.object(loaders, "run_in_thread", record_thread):
+            response = async_to_sync(self.view)(request)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content), threads
+
+    def test_same_response(self):
+        response, threads = self.post_async(self.query)
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith("graphql-loader") for name in threads))
+        cache.clear()
+        self.assertEqual(response["data"], self.execute(self.query))
+
+    def test_batches_in_transaction_run_in_place(self):
+        request = SimpleNamespace(loader_pool=mock.Mock(), pending_batches=[])
+        with transaction.atomic():
+            promise = run_batch(request, lambda keys: keys, [1])
+        self.assertEqual(promise.get(), [1])
+        request.loader_pool.submit.assert_not_called()
+
+
+@skipIf(redis is None, "redis is not installed")
+class RedisLayerTest(SimpleTestCase):
+    def test_send_failure_dropped(self):
+        # Nothing listens on port 1.
+        layer = RedisLayer("redis://localhost:1/0")
+        with self.assertLogs("twitter.pubsub", "ERROR"):
+            layer.send("tweet_posted", [1, 2])
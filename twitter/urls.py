@@ -18,10 +18,16 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_file_upload.django import FileUploadGraphQLView
 from graphql_jwt.decorators import jwt_cookie
 
+from .views import GraphQLView, async_view, metrics
+
+graphql_view = jwt_cookie(csrf_exempt(GraphQLView.as_view(graphiql=True)))
+if settings.GRAPHQL_ASYNC:
+    graphql_view = async_view(graphql_view)
+
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("graphql/", jwt_cookie(csrf_exempt(FileUploadGraphQLView.as_view(graphiql=True)))),
+    path("graphql/", graphql_view),
+    path("metrics", metrics),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
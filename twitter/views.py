@@ -0,0 +1,178 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from graphene_django.views import HttpError
+from graphene_file_upload.django import FileUploadGraphQLView
+from graphql.execution import ExecutionResult
+
+from .metrics import get_operation_label, record_operation, render
+from .persisted_queries import backend, hash_query, registry
+from .response_cache import (cache_response, get_cache_key,
+                             get_cached_response, is_anonymous)
+
+
+class GraphQLView(FileUploadGraphQLView):
+    """
+    The GraphQL endpoint. Besides full query strings it accepts the sha256
+    hash of a persisted query, following the automatic persisted queries
+    protocol of Apollo:
+
+        {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "..."}}}
+
+    A hash sent with its query registers it, a hash alone runs the query
+    registered for it. With GRAPHQL_PERSISTED_QUERIES_ONLY, only the
+    queries of the manifest are accepted. Other queries are parsed and
+    validated once and then served from the document cache.
+
+    Responses to anonymous queries are the same for every visitor, they are
+    cached until a mutation changes what they show.
+    """
+
+    def get_backend(self, request):
+        return backend
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        if not query:
+            return super().execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+        document = self.get_document(request, query)
+        with record_operation(get_operation_label(document, operation_name)):
+            return self.execute_cached_request(
+                request, data, query, variables, operation_name, show_graphiql, document
+            )
+
+    def execute_cached_request(
+        self, request, data, query, variables, operation_name, show_graphiql, document
+    ):
+        key = None
+        if (
+            document is not None
+            and document.get_operation_type(operation_name) == "query"
+            and is_anonymous(request)
+        ):
+            key = get_cache_key(request, query, variables, operation_name)
+            cached = get_cached_response(key)
+            if cached is not None:
+                request.graphql_extensions = cached[1]
+                return ExecutionResult(data=cached[0], extensions=cached[1])
+
+        result = super().execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        request.graphql_extensions = getattr(result, "extensions", None)
+        if key and result and not result.errors and not result.invalid:
+            cache_response(key, result.data, result.extensions)
+        return result
+
+    def get_document(self, request, query):
+        try:
+            return self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            return None
+
+    def json_encode(self, request, d, pretty=False):
+        if getattr(request, "graphql_extensions", None):
+            d["extensions"] = request.graphql_extensions
+        return super().json_encode(request, d, pretty)
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        registry.ensure_manifest(self.schema)
+        persisted_query = self.get_persisted_query(request, data)
+
+        if persisted_query is None:
+            if (
+                query
+                and settings.GRAPHQL_PERSISTED_QUERIES_ONLY
+                and registry.get_by_text(query) is None
+            ):
+                raise HttpError(HttpResponseBadRequest(), "PersistedQueryNotAllowed")
+            return query, variables, operation_name, id
+
+        query_hash = persisted_query.get("sha256Hash")
+        if query and hash_query(query) != query_hash:
+            raise HttpError(HttpResponseBadRequest(), "provided sha does not match query")
+        document = registry.get(query_hash)
+        if document is not None:
+            return document.document_string, variables, operation_name, id
+        if not query:
+            raise HttpError(HttpResponse(), "PersistedQueryNotFound")
+        if settings.GRAPHQL_PERSISTED_QUERIES_ONLY:
+            raise HttpError(HttpResponseBadRequest(), "PersistedQueryNotAllowed")
+        try:
+            registry.register(self.schema, query_hash, query)
+        except Exception:
+            # Invalid documents are not registered, executing the query
+            # reports the syntax error.
+            pass
+        return query, variables, operation_name, id
+
+    @staticmethod
+    def get_persisted_query(request, data):
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        if not isinstance(extensions, dict):
+            return None
+        persisted_query = extensions.get("persistedQuery")
+        return persisted_query if isinstance(persisted_query, dict) else None
+
+
+def metrics(request):
+    """
+    Metrics of this process in the Prometheus text format. Only served to
+    INTERNAL_IPS, or to requests bearing METRICS_TOKEN when it is set.
+    """
+    if settings.METRICS_TOKEN:
+        allowed = request.META.get("HTTP_AUTHORIZATION") == f"Bearer {settings.METRICS_TOKEN}"
+    else:
+        allowed = request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+    if not allowed:
+        raise Http404
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4")
+
+
+request_pool = ThreadPoolExecutor(
+    settings.GRAPHQL_ASYNC_WORKERS, thread_name_prefix="graphql-request"
+)
+loader_pool = ThreadPoolExecutor(
+    settings.GRAPHQL_LOADER_WORKERS, thread_name_prefix="graphql-loader"
+)
+
+
+def run_view(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """
+    Serve a synchronous GraphQL view from the event loop. The view runs in
+    request_pool, the ORM has no async queries, and its loader batches run
+    at the same time in loader_pool.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.loader_pool = loader_pool
+        request.pending_batches = []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            request_pool, partial(run_view, view, request, *args, **kwargs)
+        )
+
+    return wrapper
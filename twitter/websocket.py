@@ -0,0 +1,214 @@
+import asyncio
+import copy
+import io
+import json
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from graphene_django.settings import graphene_settings
+from graphql.execution import ExecutionResult
+from graphql_jwt.settings import jwt_settings
+from promise import Promise
+from rx import Observable
+from users.tokens import get_user_by_token
+
+from .persisted_queries import backend, registry
+from .views import GraphQLView, request_pool
+
+PROTOCOL = "graphql-ws"
+# Seconds between the keep alive messages of a connection.
+KEEP_ALIVE_INTERVAL = 20
+
+
+def run_closing(fn, *args):
+    """Run fn in a thread of request_pool, which keeps no connection open."""
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+def authenticate(request, payload):
+    """
+    The user of the token in the connection_init payload, sent as authToken
+    or as an Authorization header, or else of the JWT cookie.
+    """
+    token = payload.get("authToken")
+    authorization = payload.get("Authorization") or payload.get("authorization")
+    if token is None and authorization:
+        prefix, _, token = authorization.partition(" ")
+        if prefix != jwt_settings.JWT_AUTH_HEADER_PREFIX:
+            token = None
+    if token is None:
+        token = request.COOKIES.get(jwt_settings.JWT_COOKIE_NAME)
+    if not token:
+        return AnonymousUser()
+    return get_user_by_token(token, request) or AnonymousUser()
+
+
+class GraphQLWebSocket:
+    """
+    Serves GraphQL over a WebSocket with the subscriptions-transport-ws
+    protocol of Apollo. Subscriptions send a result for every event
+    published to them, queries and mutations a single one.
+
+    Resolvers get a request built from the WebSocket handshake, with the user
+    authenticated by the connection_init message.
+    """
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.operations = {}
+
+    async def __call__(self):
+        message = await self.receive()
+        if message["type"] != "websocket.connect":
+            return
+        if PROTOCOL not in self.scope.get("subprotocols", ()):
+            await self.send({"type": "websocket.close", "code": 1002})
+            return
+        self.loop = asyncio.get_running_loop()
+        self.outbox = asyncio.Queue()
+        self.request = ASGIRequest(
+            {
+                **self.scope,
+                "method": "GET",
+                "scheme": "https" if self.scope.get("scheme") == "wss" else "http",
+            },
+            io.BytesIO(),
+        )
+        self.request.user = AnonymousUser()
+        await self.send({"type": "websocket.accept", "subprotocol": PROTOCOL})
+        sender = asyncio.ensure_future(self.send_messages())
+        try:
+            while True:
+                message = await self.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                await self.handle(message.get("text") or message.get("bytes"))
+        finally:
+            for disposable in self.operations.values():
+                disposable.dispose()
+            sender.cancel()
+
+    async def send_messages(self):
+        while True:
+            try:
+                message = await asyncio.wait_for(self.outbox.get(), KEEP_ALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                message = {"type": "ka"}
+            if message is None:
+                await self.send({"type": "websocket.close", "code": 1000})
+                return
+            await self.send({"type": "websocket.send", "text": json.dumps(message)})
+
+    def post(self, type, id=None, payload=None):
+        """Queue a message to the client, from any thread."""
+        message = {"type": type}
+        if id is not None:
+            message["id"] = id
+        if payload is not None:
+            message["payload"] = payload
+        self.loop.call_soon_threadsafe(self.outbox.put_nowait, message)
+
+    def close(self):
+        """Close the connection once the queued messages are sent."""
+        self.loop.call_soon_threadsafe(self.outbox.put_nowait, None)
+
+    async def run(self, fn, *args):
+        return await self.loop.run_in_executor(request_pool, partial(run_closing, fn, *args))
+
+    async def handle(self, text):
+        try:
+            message = json.loads(text)
+            type = message["type"]
+        except (TypeError, ValueError, KeyError):
+            self.post("error", payload={"message": "Messages must be JSON with a type."})
+            return
+        id = message.get("id")
+        payload = message.get("payload") or {}
+
+        if type == "connection_init":
+            try:
+                self.request.user = await self.run(authenticate, self.request, payload)
+            except Exception as e:
+                self.post("connection_error", payload={"message": str(e)})
+                self.close()
+                return
+            self.post("connection_ack")
+            self.post("ka")
+        elif type == "start":
+            self.stop(id)
+            disposable = await self.run(self.start, id, payload)
+            if disposable is not None:
+                self.operations[id] = disposable
+        elif type == "stop":
+            self.stop(id)
+            self.post("complete", id)
+        elif type == "connection_terminate":
+            self.close()
+        else:
+            self.post("error", id, {"message": f"Unknown message type {type}."})
+
+    def start(self, id, payload):
+        """
+        Execute the operation of a start message. Subscriptions return what
+        disposes of them, the others are answered right away.
+        """
+        query = payload.get("query")
+        if (
+            query
+            and settings.GRAPHQL_PERSISTED_QUERIES_ONLY
+            and registry.get_by_text(query) is None
+        ):
+            self.post("error", id, {"message": "PersistedQueryNotAllowed"})
+            return None
+        try:
+            document = backend.document_from_string(graphene_settings.SCHEMA, query)
+        except Exception as e:
+            self.post("error", id, {"message": str(e)})
+            return None
+        # Each operation gets its own context: subscriptions reset their
+        # loaders on every event, while others of the connection resolve.
+        context = copy.copy(self.request)
+        context.loaders = {}
+        result = document.execute(
+            context_value=context,
+            variable_values=payload.get("variables"),
+            operation_name=payload.get("operationName"),
+            allow_subscriptions=True,
+        )
+        if not isinstance(result, Observable):
+            self.send_result(id, result)
+            self.post("complete", id)
+            return None
+        return result.subscribe(
+            on_next=partial(self.send_result, id),
+            on_error=lambda error: self.post("error", id, {"message": str(error)}),
+            on_completed=partial(self.post, "complete", id),
+        )
+
+    def send_result(self, id, result: ExecutionResult):
+        # Fields resolved by loaders are left as promises by the execution
+        # of subscriptions, their batches ran in this thread.
+        data = result.data
+        if data:
+            data = {
+                name: value.get() if isinstance(value, Promise) else value
+                for name, value in data.items()
+            }
+        payload = {"data": data}
+        if result.errors:
+            payload["errors"] = [GraphQLView.format_error(e) for e in result.errors]
+        close_old_connections()
+        self.post("data", id, payload)
+
+    def stop(self, id):
+        disposable = self.operations.pop(id, None)
+        if disposable is not None:
+            disposable.dispose()
@@ -0,0 +1,21 @@
+from graphql_auth.backends import GraphQLAuthBackend
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_credentials
+
+from .tokens import get_user_by_token
+
+
+class CachedJSONWebTokenBackend(GraphQLAuthBackend):
+    """GraphQLAuthBackend, looking users up with the cached get_user_by_token."""
+
+    def authenticate(self, request=None, **kwargs):
+        if request is None or getattr(request, "_jwt_token_auth", False):
+            return None
+
+        token = get_credentials(request, **kwargs)
+        if token is None:
+            return None
+        try:
+            return get_user_by_token(token, request)
+        except JSONWebTokenError:
+            return None
@@ -0,0 +1,57 @@
+from django.db import transaction
+from django.db.models import F
+from twitter.loaders import count_by
+
+from .tokens import invalidate_user_tokens
+
+
+def update_follow_counts(user_model, followed_id, follower_ids, delta):
+    """
+    Add delta to the followers count of followed, once per follower, and to
+    the following count of each follower, after they started (delta 1) or
+    stopped (delta -1) following followed.
+    """
+    user_model.objects.filter(pk=followed_id).update(
+        followers_count=F("followers_count") + delta * len(follower_ids)
+    )
+    user_model.objects.filter(pk__in=follower_ids).update(
+        following_count=F("following_count") + delta
+    )
+    # The users of tokens are cached with their counts.
+    for user_id in [followed_id, *follower_ids]:
+        invalidate_user_tokens(user_id)
+
+
+def reconcile_follow_counters(user_model, batch_size=1000):
+    """
+    Recount the followers and following of every user and fix the
+    denormalized counter columns that drifted. Returns the number of users
+    that were corrected.
+    """
+    follows = user_model.following.through.objects
+    fixed = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                user_model.objects.select_for_update()
+                .filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", "followers_count", "following_count")[:batch_size]
+            )
+            if not batch:
+                return fixed
+            ids = [row[0] for row in batch]
+            actual = zip(
+                count_by(follows, "to_user_id", ids),
+                count_by(follows, "from_user_id", ids),
+            )
+            for row, counts in zip(batch, actual):
+                if tuple(row[1:]) != counts:
+                    followers_count, following_count = counts
+                    user_model.objects.filter(pk=row[0]).update(
+                        followers_count=followers_count,
+                        following_count=following_count,
+                    )
+                    fixed += 1
+        last_id = ids[-1]
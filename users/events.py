@@ -0,0 +1,17 @@
+from twitter.pubsub import broker, receiver, send_on_commit
+
+from .models import User
+
+
+def publish_follow_request(user, requester):
+    """Once the transaction commits, tell user that requester asks to follow them."""
+    send_on_commit("follow_requested", user.id, requester.id)
+
+
+@receiver("follow_requested")
+def receive_follow_request(user_id, requester_id):
+    if user_id not in broker.listening("follow_requests"):
+        return
+    requester = User.objects.filter(id=requester_id).first()
+    if requester is not None:
+        broker.publish("follow_requests", user_id, requester)
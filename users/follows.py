@@ -0,0 +1,73 @@
+from django.db import transaction
+from tweet.timeline import backfill_followers
+
+from .counters import update_follow_counts
+from .models import User
+from .suggestions import add_followers
+
+# Most follow requests accepted or declined at once.
+MAX_FOLLOW_REQUESTS = 100
+
+
+def check_request_ids(user_ids):
+    if len(user_ids) > MAX_FOLLOW_REQUESTS:
+        raise Exception(
+            f"At most {MAX_FOLLOW_REQUESTS} follow requests can be handled at once"
+        )
+
+
+def accept_follow_requests(owner, user_ids):
+    """
+    Make the users of user_ids who requested to follow owner its followers,
+    in one transaction whatever their number. Returns the ids of the users
+    whose requests were accepted.
+    """
+    check_request_ids(user_ids)
+    requests = User.follow_requests.through.objects.filter(
+        from_user_id=owner.id, to_user_id__in=user_ids
+    )
+    follows = User.following.through.objects
+    with transaction.atomic():
+        # Locking the requests keeps a concurrent call from accepting them twice.
+        requester_ids = list(
+            requests.select_for_update().order_by("to_user_id").values_list(
+                "to_user_id", flat=True
+            )
+        )
+        if not requester_ids:
+            return []
+        requests.filter(to_user_id__in=requester_ids).delete()
+        following = set(
+            follows.filter(to_user_id=owner.id, from_user_id__in=requester_ids).values_list(
+                "from_user_id", flat=True
+            )
+        )
+        follower_ids = [id for id in requester_ids if id not in following]
+        if follower_ids:
+            follows.bulk_create(
+                follows.model(from_user_id=follower_id, to_user_id=owner.id)
+                for follower_id in follower_ids
+            )
+            update_follow_counts(User, owner.id, follower_ids, 1)
+            backfill_followers(owner, follower_ids)
+            add_followers(owner.id, follower_ids)
+    return requester_ids
+
+
+def decline_follow_requests(owner, user_ids):
+    """
+    Delete the requests of the users of user_ids to follow owner. Returns
+    the ids of the users whose requests were declined.
+    """
+    check_request_ids(user_ids)
+    requests = User.follow_requests.through.objects.filter(
+        from_user_id=owner.id, to_user_id__in=user_ids
+    )
+    with transaction.atomic():
+        requester_ids = list(
+            requests.select_for_update().order_by("to_user_id").values_list(
+                "to_user_id", flat=True
+            )
+        )
+        requests.filter(to_user_id__in=requester_ids).delete()
+    return requester_ids
@@ -0,0 +1,71 @@
+from collections import namedtuple
+
+from twitter.loaders import RequestLoader
+
+from .models import User
+
+Relationship = namedtuple("Relationship", "is_followed is_following is_requested")
+
+
+class UserLoader(RequestLoader):
+    def load_batch(self, keys):
+        users = User.objects.in_bulk(keys)
+        return [users.get(key) for key in keys]
+
+
+class RelationshipLoader(RequestLoader):
+    """
+    Loads how the current user relates to each requested user: whether
+    they follow them, are followed by them, or have a pending request.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.viewer = request.user
+
+    def load_batch(self, keys):
+        follows = User.following.through.objects
+        following = set(
+            follows.filter(from_user_id=self.viewer.id, to_user_id__in=keys)
+            .values_list("to_user_id", flat=True)
+        )
+        followers = set(
+            follows.filter(from_user_id__in=keys, to_user_id=self.viewer.id)
+            .values_list("from_user_id", flat=True)
+        )
+        requested = set(
+            User.follow_requests.through.objects.filter(
+                from_user_id__in=keys, to_user_id=self.viewer.id
+            ).values_list("from_user_id", flat=True)
+        )
+        return [
+            Relationship(key in following, key in followers, key in requested)
+            for key in keys
+        ]
+
+
+class VisibilityLoader(RequestLoader):
+    """
+    Loads whether the current user can see the tweets of each author:
+    public accounts, their own account and private accounts they follow.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.viewer = request.user
+
+    def load_batch(self, keys):
+        private = set(
+            User.objects.filter(id__in=keys, private=True).values_list("id", flat=True)
+        )
+        followed = set()
+        if private and self.viewer.is_authenticated:
+            followed = set(
+                User.following.through.objects.filter(
+                    from_user_id=self.viewer.id, to_user_id__in=private
+                ).values_list("to_user_id", flat=True)
+            )
+        return [
+            key not in private or key == self.viewer.id or key in followed
+            for key in keys
+        ]
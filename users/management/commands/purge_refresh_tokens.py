@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from graphql_jwt.refresh_token.utils import get_refresh_token_model
+from graphql_jwt.settings import jwt_settings
+
+
+class Command(BaseCommand):
+    help = "Deletes the refresh tokens that expired or were revoked"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of tokens deleted per statement",
+        )
+
+    def handle(self, batch_size, *args, **options):
+        expires = timezone.now() - jwt_settings.JWT_REFRESH_EXPIRATION_DELTA
+        tokens = get_refresh_token_model().objects.filter(
+            Q(created__lt=expires) | Q(revoked__isnull=False)
+        )
+        # Deleting by ids keeps every statement, and the locks it takes,
+        # to a batch.
+        total = 0
+        while True:
+            ids = list(tokens.values_list("id", flat=True)[:batch_size])
+            if not ids:
+                break
+            total += tokens.model.objects.filter(id__in=ids).delete()[0]
+        msg = f"Successfully deleted {total} refresh tokens"
+        self.stdout.write(self.style.SUCCESS(msg))
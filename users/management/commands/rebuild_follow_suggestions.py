@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import pluralize
+from users.suggestions import rebuild_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the "who to follow" suggestions of every user'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users rebuilt per transaction",
+        )
+
+    def handle(self, batch_size, *args, **options):
+        rebuilt = rebuild_suggestions(batch_size=batch_size)
+        msg = f"Successfully rebuilt the suggestions of {rebuilt} user{pluralize(rebuilt)}"
+        self.stdout.write(self.style.SUCCESS(msg))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import pluralize
+from users.counters import reconcile_follow_counters
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Recounts followers and following of every user and fixes drifted counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users checked per transaction",
+        )
+
+    def handle(self, batch_size, *args, **options):
+        fixed = reconcile_follow_counters(User, batch_size=batch_size)
+        msg = f"Successfully reconciled {fixed} user{pluralize(fixed)}"
+        self.stdout.write(self.style.SUCCESS(msg))
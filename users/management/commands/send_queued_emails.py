@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from users.outbox import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Sends the emails waiting in the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of emails sent over one connection",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting once it is drained",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait when the outbox is empty, with --loop",
+        )
+
+    def handle(self, batch_size, loop, interval, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_queued_emails(batch_size)
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"Sent {sent}, failed {failed}")
+                continue
+            if not loop:
+                break
+            time.sleep(interval)
+        msg = f"Successfully sent {total_sent} emails, {total_failed} failed"
+        self.stdout.write(self.style.SUCCESS(msg))
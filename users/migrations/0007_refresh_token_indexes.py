@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+# The refresh tokens are a model of graphql_jwt, their indexes for
+# purge_refresh_tokens are added to its table from here.
+INDEXES = [
+    models.Index(fields=["created"], name="refresh_token_created_idx"),
+    models.Index(fields=["revoked"], name="refresh_token_revoked_idx"),
+]
+
+
+def add_indexes(apps, schema_editor):
+    model = apps.get_model("refresh_token", "RefreshToken")
+    for index in INDEXES:
+        schema_editor.add_index(model, index)
+
+
+def remove_indexes(apps, schema_editor):
+    model = apps.get_model("refresh_token", "RefreshToken")
+    for index in INDEXES:
+        schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('refresh_token', '0002_auto_20190130_0900'),
+        ('users', '0006_queued_email'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_indexes, remove_indexes),
+    ]
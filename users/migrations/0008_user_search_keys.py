@@ -0,0 +1,56 @@
+# Generated by Django 3.2.5 on 2026-10-18 11:10
+
+import re
+
+from django.db import migrations, models
+from text_unidecode import unidecode
+
+
+def get_search_key(value):
+    # The search key as of this migration, later changes to the one in
+    # users.models go with a migration of their own.
+    words = re.findall(r"[a-z0-9]+", unidecode(value or "").lower())
+    return " ".join(words)[:150]
+
+
+def fill_search_keys(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    users = User.objects.only("id", "username", "display_name").order_by("id")
+    batch = []
+    for user in users.iterator(chunk_size=1000):
+        user.username_key = get_search_key(user.username)
+        user.display_name_key = get_search_key(user.display_name)
+        batch.append(user)
+        if len(batch) == 1000:
+            User.objects.bulk_update(batch, ["username_key", "display_name_key"])
+            batch = []
+    User.objects.bulk_update(batch, ["username_key", "display_name_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_refresh_token_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='display_name_key',
+            field=models.CharField(blank=True, editable=False, max_length=150, verbose_name='display name search key'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='username_key',
+            field=models.CharField(blank=True, editable=False, max_length=150, verbose_name='username search key'),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['username_key'], name='user_username_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['display_name_key'], name='user_display_name_key_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.5 on 2026-10-18 11:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def count_by(queryset, field, keys):
+    counts = dict(
+        queryset.filter(**{f"{field}__in": keys})
+        .order_by()
+        .values_list(field)
+        .annotate(count=Count("pk"))
+    )
+    return [counts.get(key, 0) for key in keys]
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    follows = User.following.through.objects
+    user_ids = User.objects.order_by("pk").values_list("pk", flat=True)
+    last_id = 0
+    while True:
+        ids = list(user_ids.filter(pk__gt=last_id)[:BATCH_SIZE])
+        if not ids:
+            return
+        counts = zip(
+            count_by(follows, "to_user_id", ids),
+            count_by(follows, "from_user_id", ids),
+        )
+        for user_id, (followers_count, following_count) in zip(ids, counts):
+            if followers_count or following_count:
+                User.objects.filter(pk=user_id).update(
+                    followers_count=followers_count,
+                    following_count=following_count,
+                )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_follow_suggestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Followers count'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Following count'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.5 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_user_follow_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-followers_count', 'username'], name='user_followers_count_idx'),
+        ),
+    ]
@@ -1,11 +1,32 @@
+import re
+
 import graphene
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AbstractUser
 from django.core import validators
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
+from text_unidecode import unidecode
 
 from .managers import CustomUserManager
+from .tokens import invalidate_user_tokens
+
+
+SEARCH_KEY_LENGTH = 150
+
+# Columns only written through F() updates, never from an instance.
+COUNTER_FIELDS = ("followers_count", "following_count")
+
+
+def get_search_key(value):
+    """
+    The form of a username or display name that searches match prefixes
+    of: transliterated to ASCII, lowercase, with words of letters and
+    digits separated by single spaces.
+    """
+    words = re.findall(r"[a-z0-9]+", unidecode(value or "").lower())
+    return " ".join(words)[:SEARCH_KEY_LENGTH]
 
 
 # Create your models here.
@@ -45,6 +66,18 @@ class User(AbstractUser):
     photo = models.TextField(_("Profile photo"), blank=True, null=True)
     private = models.BooleanField(default=False)
     follow_requests = models.ManyToManyField("self", symmetrical=False, blank=True)
+    username_key = models.CharField(
+        _("username search key"), max_length=SEARCH_KEY_LENGTH, blank=True, editable=False
+    )
+    display_name_key = models.CharField(
+        _("display name search key"),
+        max_length=SEARCH_KEY_LENGTH,
+        blank=True,
+        editable=False,
+    )
+    # Denormalized follow counts, see users.counters.
+    followers_count = models.IntegerField(_("Followers count"), default=0, editable=False)
+    following_count = models.IntegerField(_("Following count"), default=0, editable=False)
 
     objects = CustomUserManager()
 
@@ -54,10 +87,110 @@ class User(AbstractUser):
     def get_short_name(self):
         return self.username
 
+    def queue_email(self, subject, message):
+        """
+        Like email_user, but the email is stored in the outbox and sent later
+        by the send_queued_emails command.
+        """
+        return QueuedEmail.objects.create(user=self, subject=subject, message=message)
+
     def set_password(self, raw_password):
         if len(raw_password) < 6:
             raise Exception("Minimum password length is 6")
         self.password = make_password(raw_password)
 
+    def save(self, *args, **kwargs):
+        self.username_key = get_search_key(self.username)
+        self.display_name_key = get_search_key(self.display_name)
+        update_fields = kwargs.get("update_fields")
+        updating = not (args or kwargs.get("force_insert") or self._state.adding)
+        if update_fields is not None and {"username", "display_name"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "username_key", "display_name_key"}
+        elif update_fields is None and updating:
+            # The counters are only written by users.counters, with F()
+            # updates. The instance may be a stale cached copy of the user,
+            # saving it must not write its counts back.
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in COUNTER_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+        # Tokens authenticate a cached copy of the user, a new password or
+        # an updated account must not wait for it to expire.
+        invalidate_user_tokens(self.pk)
+
+    def delete(self, *args, **kwargs):
+        invalidate_user_tokens(self.pk)
+        return super().delete(*args, **kwargs)
+
     def __str__(self):
         return self.username
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["username_key"], name="user_username_key_idx"),
+            models.Index(fields=["display_name_key"], name="user_display_name_key_idx"),
+            models.Index(fields=["-followers_count", "username"], name="user_followers_count_idx"),
+        ]
+
+
+class FollowSuggestion(models.Model):
+    """
+    An account suggested to owner because accounts owner follows follow it,
+    score of them. Kept up to date by users.suggestions.
+    """
+
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="follow_suggestions", db_index=False
+    )
+    suggested = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="suggested_to"
+    )
+    score = models.PositiveIntegerField(_("Score"))
+
+    class Meta:
+        verbose_name = "Follow suggestion"
+        verbose_name_plural = "Follow suggestions"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "suggested"], name="unique_follow_suggestion"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["owner", "-score", "suggested"],
+                name="follow_suggestion_score_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.suggested} to {self.owner}"
+
+
+class QueuedEmail(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="queued_emails"
+    )
+    subject = models.CharField(_("Subject"), max_length=255)
+    message = models.TextField(_("Message"))
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
+    attempts = models.PositiveIntegerField(_("Attempts"), default=0)
+    next_attempt_at = models.DateTimeField(_("Next attempt at"), default=timezone.now)
+    sent_at = models.DateTimeField(_("Sent at"), blank=True, null=True)
+    last_error = models.TextField(_("Last error"), blank=True)
+
+    class Meta:
+        verbose_name = "Queued email"
+        verbose_name_plural = "Queued emails"
+        indexes = [
+            models.Index(
+                fields=["sent_at", "next_attempt_at"], name="queued_email_pending_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.user}"
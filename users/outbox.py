@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import mail
+from django.db import transaction
+from django.utils import timezone
+
+from .models import QueuedEmail
+
+# How long a worker owns the emails it picked before another worker may
+# pick them again, in case it died halfway through the batch.
+LEASE = timedelta(minutes=10)
+
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            QueuedEmail.objects.select_for_update(skip_locked=True)
+            .select_related("user")
+            .filter(
+                sent_at=None,
+                next_attempt_at__lte=now,
+                attempts__lt=settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+            )
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        QueuedEmail.objects.filter(id__in=[email.id for email in batch]).update(
+            next_attempt_at=now + LEASE
+        )
+    return batch
+
+
+def reschedule(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    email.next_attempt_at = timezone.now() + timedelta(
+        seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1)
+    )
+    email.save(update_fields=["attempts", "last_error", "next_attempt_at"])
+
+
+def send_queued_emails(batch_size=100):
+    """
+    Send one batch of due emails over a single connection. Returns the
+    number of emails sent and the number that failed and were rescheduled.
+    """
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+    connection = mail.get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for email in batch:
+            reschedule(email, e)
+        return 0, len(batch)
+    sent = failed = 0
+    try:
+        for email in batch:
+            message = mail.EmailMessage(
+                email.subject, email.message, to=[email.user.email], connection=connection
+            )
+            try:
+                message.send()
+            except Exception as e:
+                reschedule(email, e)
+                failed += 1
+                # The connection may be broken, give the next email a new one.
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+            else:
+                email.attempts += 1
+                email.sent_at = timezone.now()
+                email.save(update_fields=["attempts", "sent_at"])
+                sent += 1
+    finally:
+        connection.close()
+    return sent, failed
@@ -1,10 +1,24 @@
 import graphene
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
 from graphene_django import DjangoObjectType
 from graphene_django.filter.fields import DjangoFilterConnectionField
 from graphql_auth.schema import UserNode
 from graphql_jwt.decorators import login_required
-
-from .models import User
+from tweet.timeline import backfill, prune
+from twitter.loaders import get_loader
+from twitter.pagination import KeysetConnectionField, order_by_unique
+from twitter.pubsub import subscribe
+from twitter.response_cache import invalidate_responses
+
+from .counters import update_follow_counts
+from .events import publish_follow_request
+from .follows import accept_follow_requests, decline_follow_requests
+from .loaders import RelationshipLoader
+from .models import FollowSuggestion, User
+from .search import MOST_FOLLOWED, search_users
+from .suggestions import update_suggestions
 
 # class UserType(DjangoObjectType):
 #     class Meta:
@@ -38,10 +52,10 @@ class UserWithFollowNode(UserNode):
     is_requested = graphene.Boolean()
 
     def resolve_followers_count(self, info):
-        return self.followers.count()
+        return self.followers_count
 
     def resolve_following_count(self, info):
-        return self.following.count()
+        return self.following_count
 
     def resolve_is_self(self, info):
         if not info.context.user.is_authenticated:
@@ -52,69 +66,111 @@ class UserWithFollowNode(UserNode):
         if not info.context.user.is_authenticated:
             return False
         return (
-            User.objects.filter(id=self.pk)
-            .filter(followers__id=info.context.user.id)
-            .first()
-            is not None
+            get_loader(info, RelationshipLoader)
+            .load(self.pk)
+            .then(lambda relationship: relationship.is_followed)
         )
 
     def resolve_is_following(self, info):
         if not info.context.user.is_authenticated:
             return False
         return (
-            User.objects.filter(id=self.pk)
-            .filter(following__id=info.context.user.id)
-            .first()
-            is not None
+            get_loader(info, RelationshipLoader)
+            .load(self.pk)
+            .then(lambda relationship: relationship.is_following)
         )
 
     def resolve_is_requested(self, info):
         if not info.context.user.is_authenticated:
             return False
         return (
-            User.objects.filter(id=self.pk)
-            .filter(follow_requests=info.context.user)
-            .exists()
+            get_loader(info, RelationshipLoader)
+            .load(self.pk)
+            .then(lambda relationship: relationship.is_requested)
         )
 
 
 class UserQuery(graphene.ObjectType):
     user = graphene.Field(UserWithFollowNode, username=graphene.String(required=True))
     users = DjangoFilterConnectionField(UserWithFollowNode)
+    search_users = graphene.List(
+        graphene.NonNull(UserWithFollowNode),
+        prefix=graphene.String(required=True),
+        first=graphene.Int(default_value=10),
+    )
 
     def resolve_user(self, info, username=None):
         return User.objects.filter(username=username).first()
 
+    def resolve_search_users(self, info, prefix, first):
+        return search_users(prefix, first)
+
+
+def order_by_follow(related):
+    """
+    Users of a followers, following or follow requests manager, ordered by
+    their row in its through table, most recent first.
+    """
+    follow_id = related.through.objects.filter(
+        **{
+            related.source_field_name: related.instance,
+            related.target_field_name: OuterRef("pk"),
+        }
+    ).values("id")
+    return order_by_unique(
+        related.annotate(follow_id=Subquery(follow_id)), "-follow_id"
+    )
+
 
 class FollowQuery(graphene.ObjectType):
-    followers = DjangoFilterConnectionField(
+    followers = KeysetConnectionField(
         UserWithFollowNode, uname=graphene.String(required=True)
     )
-    following = DjangoFilterConnectionField(
+    following = KeysetConnectionField(
         UserWithFollowNode, uname=graphene.String(required=True)
     )
     unfollowed = DjangoFilterConnectionField(UserWithFollowNode)
+    pending_follow_requests = KeysetConnectionField(UserWithFollowNode)
 
-    def resolve_followers(self, info, uname):
+    def resolve_followers(self, info, uname, **kwargs):
         user = User.objects.filter(username=uname).first()
         if not user:
             raise Exception("User doesn't exists")
-        return user.followers.all()
+        return order_by_follow(user.followers)
 
-    def resolve_following(self, info, uname):
+    def resolve_following(self, info, uname, **kwargs):
         user = User.objects.filter(username=uname).first()
         if not user:
             raise Exception("User doesn't exists")
-        return user.following.all()
+        return order_by_follow(user.following)
 
-    def resolve_unfollowed(self, info):
-        if not info.context.user.is_authenticated:
+    def resolve_unfollowed(self, info, **kwargs):
+        viewer = info.context.user
+        if not viewer.is_authenticated:
             return User.objects.none()
-        return (
-            User.objects.exclude(followers__id=info.context.user.id)
-            .exclude(id=info.context.user.id)
-            .exclude(private=True)
+        requested = User.objects.filter(follow_requests__id=viewer.id)
+        if FollowSuggestion.objects.filter(owner=viewer).exists():
+            return (
+                User.objects.filter(suggested_to__owner=viewer, private=False)
+                .exclude(id__in=requested.values("id"))
+                .order_by("-suggested_to__score", "suggested_to__suggested")
+            )
+        # Users who follow no one have no friends of friends to suggest, they
+        # are shown the most followed accounts, read from the top of the
+        # followers_count index.
+        popular = list(
+            User.objects.filter(private=False, is_active=True)
+            .exclude(id=viewer.id)
+            .exclude(id__in=viewer.following.values("id"))
+            .exclude(id__in=requested.values("id"))
+            .order_by(*MOST_FOLLOWED)
+            .values_list("id", flat=True)[: settings.FOLLOW_SUGGESTIONS_PER_USER]
         )
+        return User.objects.filter(id__in=popular).order_by(*MOST_FOLLOWED)
+
+    @login_required
+    def resolve_pending_follow_requests(self, info, **kwargs):
+        return order_by_follow(info.context.user.follow_requests)
 
 
 class MeQuery(graphene.ObjectType):
@@ -133,10 +189,10 @@ class FollowCount(graphene.ObjectType):
     following_count = graphene.Int(user_id=graphene.String())
 
     def resolve_followers_count(self, info, user_id):
-        return User.objects.filter(id=user_id).first().followers.count()
+        return User.objects.filter(id=user_id).values_list("followers_count", flat=True).first()
 
     def resolve_following_count(self, info, user_id):
-        return User.objects.filter(id=user_id).first().following.count()
+        return User.objects.filter(id=user_id).values_list("following_count", flat=True).first()
 
 
 class AcceptFollow(graphene.Mutation):
@@ -157,15 +213,56 @@ class AcceptFollow(graphene.Mutation):
         user = user_query.first()
         if not user:
             return None
-        is_follower = info.context.user.followers.filter(id=user_id).exists()
-        is_requested = info.context.user.follow_requests.filter(id=user_id).exists()
-        if is_requested:
-            info.context.user.follow_requests.remove(user)
-            if not is_follower:
-                info.context.user.followers.add(user)
-            return AcceptFollow(success=True)
-        else:
-            return AcceptFollow(success=is_follower)
+        follows = User.following.through.objects
+        requests = User.follow_requests.through.objects.filter(
+            from_user_id=info.context.user.id, to_user_id=user.id
+        )
+        with transaction.atomic():
+            # Locking the request keeps a concurrent call from accepting it
+            # twice, the counters change only if a follow row is inserted.
+            if not requests.select_for_update().exists():
+                is_follower = info.context.user.followers.filter(id=user_id).exists()
+                return AcceptFollow(success=is_follower)
+            requests.delete()
+            _, created = follows.get_or_create(
+                from_user_id=user.id, to_user_id=info.context.user.id
+            )
+            if created:
+                update_follow_counts(User, info.context.user.id, [user.id], 1)
+                backfill(user, info.context.user)
+                update_suggestions(user.id, info.context.user.id, 1)
+                invalidate_responses()
+        return AcceptFollow(success=True)
+
+
+class AcceptFollowRequests(graphene.Mutation):
+    success = graphene.Boolean()
+    user_ids = graphene.List(graphene.NonNull(graphene.Int))
+
+    class Arguments:
+        user_ids = graphene.List(graphene.NonNull(graphene.Int), required=True)
+
+    @staticmethod
+    @login_required
+    def mutate(cls, info, user_ids):
+        accepted = accept_follow_requests(info.context.user, user_ids)
+        if accepted:
+            invalidate_responses()
+        return AcceptFollowRequests(success=True, user_ids=accepted)
+
+
+class DeclineFollowRequests(graphene.Mutation):
+    success = graphene.Boolean()
+    user_ids = graphene.List(graphene.NonNull(graphene.Int))
+
+    class Arguments:
+        user_ids = graphene.List(graphene.NonNull(graphene.Int), required=True)
+
+    @staticmethod
+    @login_required
+    def mutate(cls, info, user_ids):
+        declined = decline_follow_requests(info.context.user, user_ids)
+        return DeclineFollowRequests(success=True, user_ids=declined)
 
 
 class FollowUser(graphene.Mutation):
@@ -190,8 +287,19 @@ class FollowUser(graphene.Mutation):
             return None
         followed = user_query.filter(followers__id=info.context.user.id).exists()
         user: User = user_query.first()
+        follows = User.following.through.objects
         if followed:
-            user.followers.remove(info.context.user)
+            with transaction.atomic():
+                # The delete locks the follow row and counts what it removed,
+                # concurrent unfollows decrement the counters once.
+                unfollowed, _ = follows.filter(
+                    from_user_id=info.context.user.id, to_user_id=user.id
+                ).delete()
+                if unfollowed:
+                    update_follow_counts(User, user.id, [info.context.user.id], -1)
+                    prune(info.context.user, user)
+                    update_suggestions(info.context.user.id, user.id, -1)
+                    invalidate_responses()
         else:
             if user.private:
                 requested = user_query.filter(follow_requests__id=info.context.user.id)
@@ -199,13 +307,25 @@ class FollowUser(graphene.Mutation):
                     user.follow_requests.remove(info.context.user)
                 else:
                     user.follow_requests.add(info.context.user)
+                    publish_follow_request(user, info.context.user)
                 return FollowUser(
                     success=True,
                     is_followed=False,
                     user=user,
                     is_requested=not requested,
                 )
-            user.followers.add(info.context.user)
+            with transaction.atomic():
+                # get_or_create inserts in a savepoint and reads the row a
+                # concurrent follow inserted first instead of counting it twice.
+                _, created = follows.get_or_create(
+                    from_user_id=info.context.user.id, to_user_id=user.id
+                )
+                if created:
+                    update_follow_counts(User, user.id, [info.context.user.id], 1)
+                    backfill(info.context.user, user)
+                    update_suggestions(info.context.user.id, user.id, 1)
+                    invalidate_responses()
+        user.refresh_from_db(fields=["followers_count", "following_count"])
         return FollowUser(
             success=True, is_followed=not followed, user=user, is_requested=False
         )
@@ -214,6 +334,16 @@ class FollowUser(graphene.Mutation):
 class UserMutation(graphene.ObjectType):
     follow = FollowUser.Field()
     accept_follow = AcceptFollow.Field()
+    accept_follow_requests = AcceptFollowRequests.Field()
+    decline_follow_requests = DeclineFollowRequests.Field()
+
+
+class FollowSubscription(graphene.ObjectType):
+    follow_requested = graphene.Field(UserWithFollowNode)
+
+    @login_required
+    def resolve_follow_requested(self, info):
+        return subscribe(info, "follow_requests", [info.context.user.id])
 
 
 # class RegisterMutation(graphene.Mutation):
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db.models import Q
+from twitter.pagination import seek
+
+from .models import User, get_search_key
+
+# Most users a searchUsers query returns.
+MAX_RESULTS = 20
+# Users read at once when scanning from the most followed, and at most in
+# all for one search.
+SCAN_BATCH_SIZE = 500
+SCAN_LIMIT = 5000
+MOST_FOLLOWED = ["-followers_count", "username"]
+
+
+def prefix_range(field, prefix):
+    """
+    Filter for the values of field starting with prefix, as a range an
+    index can be read in on every database, unlike LIKE on SQLite.
+    """
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f"{field}__gte": prefix, f"{field}__lt": upper})
+
+
+def most_followed(key, count):
+    """
+    Ids of the count most followed active users with a search key starting
+    with key, reading users from the most followed in the order of their
+    index. When many users match, the first ones are found after a few
+    batches. Past SCAN_LIMIT users, the ones found by then are returned.
+    """
+    users = User.objects.filter(is_active=True).order_by(*MOST_FOLLOWED)
+    ids = []
+    batch = users
+    scanned = 0
+    while True:
+        rows = list(
+            batch.values_list(
+                "id", "username", "followers_count", "username_key", "display_name_key"
+            )[:SCAN_BATCH_SIZE]
+        )
+        for id, _, _, username_key, display_name_key in rows:
+            if username_key.startswith(key) or display_name_key.startswith(key):
+                ids.append(id)
+                if len(ids) == count:
+                    return ids
+        scanned += len(rows)
+        if len(rows) < SCAN_BATCH_SIZE or scanned >= SCAN_LIMIT:
+            return ids
+        _, username, followers_count, _, _ = rows[-1]
+        batch = users.filter(seek(MOST_FOLLOWED, [followers_count, username]))
+
+
+def search_users(prefix, first=10):
+    """
+    Active users whose username or display name starts with prefix, most
+    followed first. Prefixes matching at most USER_SEARCH_MAX_MATCHES users
+    per key are ranked from the key indexes. Shorter ones match so many
+    users that scanning users from the most followed finds them sooner;
+    when the scan stops short, the matches read from the key indexes make
+    up the rest, best effort.
+    """
+    key = get_search_key(prefix)
+    count = max(0, min(first, MAX_RESULTS))
+    if not key or not count:
+        return []
+    limit = settings.USER_SEARCH_MAX_MATCHES
+    ranks = {}
+    too_many = False
+    for field in ("username_key", "display_name_key"):
+        matches = list(
+            User.objects.filter(prefix_range(field, key), is_active=True)
+            .order_by(field)
+            .values_list("id", "username", "followers_count")[: limit + 1]
+        )
+        too_many = too_many or len(matches) > limit
+        for id, username, followers_count in matches:
+            ranks[id] = (-followers_count, username)
+    ranked = sorted(ranks, key=ranks.get)
+    if too_many:
+        ids = most_followed(key, count)
+        ids += [id for id in ranked if id not in ids][: count - len(ids)]
+    else:
+        ids = ranked[:count]
+    users = User.objects.in_bulk(ids)
+    return [users[id] for id in ids]
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+
+from .models import FollowSuggestion, User
+
+
+def refresh_suggestions(owner_id):
+    """
+    Recompute the suggestions of owner: the public accounts followed by the
+    accounts owner follows, that owner doesn't follow yet, scored by how
+    many of them follow each.
+    """
+    follows = User.following.through.objects
+    followed = follows.filter(from_user_id=owner_id).values("to_user_id")
+    candidates = (
+        follows.filter(from_user_id__in=followed, to_user__private=False)
+        .exclude(to_user_id__in=followed)
+        .exclude(to_user_id=owner_id)
+        .values("to_user_id")
+        .annotate(score=Count("id"))
+        .order_by("-score", "to_user_id")[: settings.FOLLOW_SUGGESTIONS_PER_USER]
+    )
+    FollowSuggestion.objects.filter(owner_id=owner_id).delete()
+    FollowSuggestion.objects.bulk_create(
+        FollowSuggestion(
+            owner_id=owner_id, suggested_id=candidate["to_user_id"], score=candidate["score"]
+        )
+        for candidate in candidates
+    )
+
+
+def update_suggestions(follower_id, followed_id, delta):
+    """
+    After follower started (delta 1) or stopped (delta -1) following
+    followed: recompute the suggestions of follower, and move followed up
+    or down the suggestions of follower's followers that already have it.
+    The ones that don't get it on the next rebuild_suggestions.
+    """
+    refresh_suggestions(follower_id)
+    owners = User.following.through.objects.filter(to_user_id=follower_id).values(
+        "from_user_id"
+    )
+    suggestions = FollowSuggestion.objects.filter(
+        owner_id__in=owners, suggested_id=followed_id
+    )
+    suggestions.update(score=F("score") + delta)
+    if delta < 0:
+        suggestions.filter(score__lte=0).delete()
+
+
+def add_followers(followed_id, follower_ids):
+    """
+    After follower_ids all started following followed: drop followed from
+    their suggestions and move it up the suggestions of their followers, by
+    how many of them each follows. Unlike update_suggestions, the rest of
+    their suggestions is left to the next rebuild_suggestions, so accepting
+    many follow requests doesn't recompute each requester's.
+    """
+    FollowSuggestion.objects.filter(
+        owner_id__in=follower_ids, suggested_id=followed_id
+    ).delete()
+    follows = User.following.through.objects.filter(to_user_id__in=follower_ids)
+    added = (
+        follows.filter(from_user_id=OuterRef("owner_id"))
+        .values("from_user_id")
+        .annotate(added=Count("id"))
+        .values("added")
+    )
+    FollowSuggestion.objects.filter(
+        owner_id__in=follows.values("from_user_id"), suggested_id=followed_id
+    ).update(score=F("score") + Subquery(added))
+
+
+def rebuild_suggestions(batch_size=1000):
+    """
+    Recompute the suggestions of every user who follows someone. Returns
+    the number of users whose suggestions were rebuilt.
+    """
+    follows = User.following.through.objects
+    rebuilt = 0
+    last_id = 0
+    while True:
+        ids = list(
+            User.objects.filter(pk__gt=last_id)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return rebuilt
+        following = set(
+            follows.filter(from_user_id__in=ids).values_list("from_user_id", flat=True)
+        )
+        with transaction.atomic():
+            # Users who follow no one anymore keep no stale suggestions.
+            FollowSuggestion.objects.filter(owner_id__in=ids).exclude(
+                owner_id__in=following
+            ).delete()
+            for owner_id in ids:
+                if owner_id in following:
+                    refresh_suggestions(owner_id)
+                    rebuilt += 1
+        last_id = ids[-1]
@@ -1,3 +1,668 @@
-from django.test import TestCase
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from graphql_jwt.shortcuts import get_token
+from tweet.models import Tweet
+from twitter.testing import GraphQLTestCase
+
+from .counters import reconcile_follow_counters
+from .follows import MAX_FOLLOW_REQUESTS
+from .models import FollowSuggestion, QueuedEmail, User
+from .outbox import LEASE, claim_batch, send_queued_emails
+from .suggestions import rebuild_suggestions
+
+USER_FIELDS = """
+fragment UserFields on UserWithFollowNode {
+  pk
+  username
+  displayName
+  photo
+  bio
+  isSelf
+  isFollowed
+  isFollowing
+  isRequested
+  followersCount
+  followingCount
+}
+"""
+
+
+class UserQueryCountTest(GraphQLTestCase):
+    """
+    The user queries and mutations of the frontend must run a fixed number
+    of SQL queries, whatever the size of the page.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = cls.create_user("viewer")
+        cls.star = cls.create_user("star")
+        cls.private = cls.create_user("private", private=True)
+        users = [cls.create_user(f"user{i}") for i in range(24)]
+        cls.star.followers.add(cls.viewer, *users)
+        cls.star.following.add(*users)
+        cls.viewer.following.add(*users[:12])
+        cls.viewer.followers.add(*users[6:18])
+        cls.viewer.follow_requests.add(*users[18:])
+        reconcile_follow_counters(User)
+        rebuild_suggestions()
+
+    def request(self, query, variables=None):
+        data = self.execute(query, variables, user=self.viewer)
+        return data, len(self.queries)
+
+    def count_page_queries(self, field, arguments, first):
+        query = USER_FIELDS + """
+        query($first: Int) {
+          %s(first: $first%s) {
+            pageInfo { endCursor hasNextPage }
+            edges { node { ...UserFields } }
+          }
+        }
+        """ % (field, arguments)
+        data, count = self.request(query, {"first": first})
+        self.assertEqual(len(data[field]["edges"]), first)
+        return count
+
+    def assertPageBudget(self, field, arguments, budget):
+        small = self.count_page_queries(field, arguments, 2)
+        large = self.count_page_queries(field, arguments, 10)
+        self.assertLessEqual(large, small, "the number of queries grows with the page")
+        self.assertLessEqual(small, budget)
+
+    def test_followers(self):
+        self.assertPageBudget("followers", ', uname: "star"', 9)
+
+    def test_following(self):
+        self.assertPageBudget("following", ', uname: "star"', 9)
+
+    def test_unfollowed(self):
+        self.assertPageBudget("unfollowed", "", 8)
+
+    def test_me(self):
+        _, count = self.request(USER_FIELDS + "query { me { ...UserFields } }")
+        self.assertLessEqual(count, 6)
+
+    def test_profile(self):
+        query = USER_FIELDS + """
+        query($username: String!) { user(username: $username) { ...UserFields } }
+        """
+        _, count = self.request(query, {"username": "star"})
+        self.assertLessEqual(count, 7)
+
+    def test_follow(self):
+        query = USER_FIELDS + """
+        mutation($id: Int!) {
+          follow(userId: $id) { success isFollowed isRequested user { ...UserFields } }
+        }
+        """
+        _, count = self.request(query, {"id": self.star.pk})
+        self.assertLessEqual(count, 19)
+        _, count = self.request(query, {"id": self.private.pk})
+        self.assertLessEqual(count, 11)
+
+    def test_accept_follow(self):
+        query = """
+        mutation($id: Int!) { acceptFollow(userId: $id) { success } }
+        """
+        user = self.viewer.follow_requests.first()
+        _, count = self.request(query, {"id": user.pk})
+        self.assertLessEqual(count, 17)
+
+    def test_pending_follow_requests(self):
+        small = self.count_page_queries("pendingFollowRequests", "", 2)
+        large = self.count_page_queries("pendingFollowRequests", "", 6)
+        self.assertLessEqual(large, small, "the number of queries grows with the page")
+        self.assertLessEqual(small, 5)
+
+    def test_accept_follow_requests(self):
+        query = """
+        mutation($ids: [Int!]!) { acceptFollowRequests(userIds: $ids) { userIds } }
+        """
+        ids = list(self.viewer.follow_requests.values_list("id", flat=True))
+        _, count = self.request(query, {"ids": ids})
+        self.assertLessEqual(count, 12)
+
+
+class RelationshipTest(GraphQLTestCase):
+    """isFollowed, isFollowing and isRequested are how the viewer relates to a user."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = cls.create_user("viewer")
+        followed = cls.create_user("followed")
+        follower = cls.create_user("follower")
+        requested = cls.create_user("requested", private=True)
+        cls.create_user("stranger")
+        cls.viewer.following.add(followed)
+        cls.viewer.followers.add(follower)
+        requested.follow_requests.add(cls.viewer)
+
+    def relationships(self, user=None):
+        data = self.execute(
+            """
+            query {
+              users {
+                edges { node { username isFollowed isFollowing isRequested } }
+              }
+            }
+            """,
+            user=user,
+        )
+        nodes = [edge["node"] for edge in data["users"]["edges"]]
+        return {node.pop("username"): node for node in nodes}
+
+    def test_flags(self):
+        none = {"isFollowed": False, "isFollowing": False, "isRequested": False}
+        self.assertEqual(
+            self.relationships(self.viewer),
+            {
+                "viewer": none,
+                "followed": {**none, "isFollowed": True},
+                "follower": {**none, "isFollowing": True},
+                "requested": {**none, "isRequested": True},
+                "stranger": none,
+            },
+        )
+        self.assertEqual(
+            self.relationships(),
+            dict.fromkeys(
+                ["viewer", "followed", "follower", "requested", "stranger"], none
+            ),
+        )
+
+
+class FollowListTest(GraphQLTestCase):
+    """Followers, following and follow requests list the most recent first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = cls.create_user("viewer")
+        cls.users = [cls.create_user(f"user{i}") for i in range(5)]
+        for user in reversed(cls.users):
+            cls.viewer.following.add(user)
+            cls.viewer.followers.add(user)
+            cls.viewer.follow_requests.add(user)
+        # Follows between the listed users, in the same table.
+        for user in cls.users[1:]:
+            cls.users[0].following.add(user)
+
+    def list_users(self, field, arguments=""):
+        query = """
+        query($after: String) {
+          %s(first: 2, after: $after%s) {
+            pageInfo { endCursor hasNextPage }
+            edges { node { username } }
+          }
+        }
+        """ % (field, arguments)
+        usernames = []
+        after = None
+        while True:
+            page = self.execute(query, {"after": after}, user=self.viewer)[field]
+            usernames += [edge["node"]["username"] for edge in page["edges"]]
+            if not page["pageInfo"]["hasNextPage"]:
+                return usernames
+            after = page["pageInfo"]["endCursor"]
+
+    def test_most_recent_first(self):
+        expected = [user.username for user in self.users]
+        self.assertEqual(self.list_users("following", ', uname: "viewer"'), expected)
+        self.assertEqual(self.list_users("followers", ', uname: "viewer"'), expected)
+        self.assertEqual(self.list_users("pendingFollowRequests"), expected)
+        self.assertEqual(
+            self.list_users("following", ', uname: "user0"'),
+            ["user4", "user3", "user2", "user1", "viewer"],
+        )
+
+
+@override_settings(JWT_USER_CACHE_TIMEOUT=60)
+class TokenCacheTest(GraphQLTestCase):
+    """The user of a token is cached until the user changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user("cached")
+
+    def setUp(self):
+        super().setUp()
+        self.token = get_token(self.user)
+
+    def me(self):
+        data = self.execute("query { me { username displayName } }", token=self.token)
+        return data["me"], len(self.queries)
+
+    def test_repeated_requests_skip_the_user_query(self):
+        _, first = self.me()
+        _, second = self.me()
+        self.assertLess(second, first)
+
+    def test_save_invalidates(self):
+        me, _ = self.me()
+        self.assertEqual(me["displayName"], "")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.display_name = "Renamed"
+            self.user.save()
+        me, _ = self.me()
+        self.assertEqual(me["displayName"], "Renamed")
+
+
+class SearchUsersTest(GraphQLTestCase):
+    """searchUsers matches prefixes of normalized names, most followed first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zoe = cls.create_user("zoe", display_name="Zoë Ávila")
+        cls.zoey = cls.create_user("zoey_fan")
+        cls.avi = cls.create_user("avi", display_name="Avi")
+        fans = [cls.create_user(f"fan{i}") for i in range(3)]
+        cls.zoey.followers.add(*fans)
+        cls.avi.followers.add(fans[0])
+        reconcile_follow_counters(User)
+
+    def search(self, prefix, first=None):
+        variables = {"prefix": prefix}
+        if first is not None:
+            variables["first"] = first
+        data = self.execute(
+            """
+            query($prefix: String!, $first: Int) {
+              searchUsers(prefix: $prefix, first: $first) { username }
+            }
+            """,
+            variables,
+        )
+        return [user["username"] for user in data["searchUsers"]]
+
+    def test_ranked_by_followers(self):
+        self.assertEqual(self.search("ZO"), ["zoey_fan", "zoe"])
+        self.assertEqual(self.search("zo", first=1), ["zoey_fan"])
+
+    def test_display_name(self):
+        self.assertEqual(self.search("Av"), ["avi"])
+        self.assertEqual(self.search("zoe  AVI"), ["zoe"])
+        self.assertEqual(self.search("!"), [])
+
+    def test_update(self):
+        self.zoe.display_name = "Chloé"
+        self.zoe.save(update_fields=["display_name"])
+        self.assertEqual(self.search("chloe"), ["zoe"])
+        self.assertEqual(self.search("zoe a"), [])
+
+    @override_settings(USER_SEARCH_MAX_MATCHES=2)
+    def test_many_matches(self):
+        for i in range(3):
+            self.create_user(f"za{i}")
+        # More matches than are ranked from the key indexes, the most
+        # followed are still found first.
+        with mock.patch("users.search.SCAN_BATCH_SIZE", 2):
+            self.assertEqual(self.search("z", first=3), ["zoey_fan", "za0", "za1"])
+            self.assertEqual(self.search("Zoë"), ["zoey_fan", "zoe"])
+        self.assertEqual(self.search("a", first=1), ["avi"])
+
+    @override_settings(USER_SEARCH_MAX_MATCHES=2)
+    def test_scan_limit(self):
+        # The two most followed users don't match, the scan stops after them
+        # and the matches read from the key indexes make up the results.
+        with mock.patch("users.search.SCAN_BATCH_SIZE", 1), mock.patch(
+            "users.search.SCAN_LIMIT", 2
+        ):
+            self.assertEqual(self.search("fan"), ["fan0", "fan1", "fan2"])
+        descending = connection.ops.quote_name("followers_count") + " DESC"
+        scans = [query for query in self.queries if descending in query["sql"]]
+        self.assertEqual(len(scans), 2)
+
+    def assertIndexed(self, expected_statements):
+        statements = [
+            query["sql"] for query in self.queries if "ORDER BY" in query["sql"]
+        ]
+        self.assertEqual(len(statements), expected_statements)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                if connection.vendor == "mysql":
+                    cursor.execute("EXPLAIN " + sql)
+                    columns = [column[0].lower() for column in cursor.description]
+                    for row in cursor.fetchall():
+                        step = dict(zip(columns, row))
+                        self.assertNotEqual(step["type"], "ALL", sql)
+                        self.assertNotIn("Using filesort", step["extra"] or "", sql)
+                else:
+                    cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                    for row in cursor.fetchall():
+                        self.assertIn("USING INDEX user_", row[-1], sql)
+                        self.assertNotIn("TEMP B-TREE", row[-1], sql)
+
+    def test_indexed(self):
+        self.search("zo")
+        self.assertIndexed(2)
+
+    @override_settings(USER_SEARCH_MAX_MATCHES=1)
+    def test_indexed_scan(self):
+        self.search("zo")
+        # The username key matches two users, both keys are read and the scan
+        # from the most followed finds them in its first batch.
+        self.assertIndexed(3)
+
+
+class FollowSuggestionTest(GraphQLTestCase):
+    """unfollowed suggests the accounts followed by the accounts one follows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol, cls.dave, cls.erin = [
+            cls.create_user(name) for name in ("alice", "bob", "carol", "dave", "erin")
+        ]
+        cls.private = cls.create_user("private", private=True)
+        cls.alice.following.add(cls.bob, cls.carol)
+        cls.bob.following.add(cls.dave, cls.erin, cls.private)
+        cls.carol.following.add(cls.dave)
+        reconcile_follow_counters(User)
+        rebuild_suggestions()
+
+    def unfollowed(self, user):
+        data = self.execute(
+            "query { unfollowed(first: 10) { edges { node { username } } } }", user=user
+        )
+        return [edge["node"]["username"] for edge in data["unfollowed"]["edges"]]
+
+    def follow(self, user, followed):
+        self.execute(
+            "mutation($id: Int!) { follow(userId: $id) { success } }",
+            {"id": followed.pk},
+            user=user,
+        )
+
+    def scores(self, owner):
+        return dict(
+            FollowSuggestion.objects.filter(owner=owner).values_list(
+                "suggested__username", "score"
+            )
+        )
+
+    def test_ranked_by_mutual_follows(self):
+        self.assertEqual(self.unfollowed(self.alice), ["dave", "erin"])
+
+    def test_follow(self):
+        self.follow(self.alice, self.dave)
+        self.assertEqual(self.unfollowed(self.alice), ["erin"])
+        # erin moves up the suggestions of carol's followers.
+        self.follow(self.carol, self.erin)
+        self.assertEqual(self.scores(self.alice), {"erin": 2})
+
+    def test_unfollow(self):
+        # follow unfollows accounts that are followed already.
+        self.follow(self.carol, self.dave)
+        self.assertEqual(self.scores(self.alice), {"dave": 1, "erin": 1})
+        self.assertEqual(self.scores(self.carol), {})
+        self.follow(self.bob, self.erin)
+        self.assertEqual(self.scores(self.alice), {"dave": 1})
+
+    def test_accept_follow(self):
+        self.private.following.add(self.alice)
+        self.private.follow_requests.add(self.erin)
+        self.execute(
+            "mutation($id: Int!) { acceptFollow(userId: $id) { success } }",
+            {"id": self.erin.pk},
+            user=self.private,
+        )
+        self.assertEqual(self.scores(self.erin), {"alice": 1})
+
+    def test_accept_follow_requests(self):
+        # bob follows erin already, only carol moves erin up alice's suggestions.
+        self.erin.follow_requests.add(self.bob, self.carol)
+        self.execute(
+            "mutation($ids: [Int!]!) { acceptFollowRequests(userIds: $ids) { success } }",
+            {"ids": [self.bob.pk, self.carol.pk]},
+            user=self.erin,
+        )
+        self.assertEqual(self.scores(self.alice), {"dave": 2, "erin": 2})
+
+    def test_without_follows(self):
+        # The most followed accounts instead.
+        self.assertEqual(self.unfollowed(self.erin), ["dave", "bob", "carol", "alice"])
+        with self.settings(FOLLOW_SUGGESTIONS_PER_USER=2):
+            self.assertEqual(self.unfollowed(self.dave), ["bob", "carol"])
+
+    def test_without_follows_limit_index(self):
+        self.unfollowed(self.erin)
+        limit = "LIMIT %d" % settings.FOLLOW_SUGGESTIONS_PER_USER
+        statements = [query["sql"] for query in self.queries if limit in query["sql"]]
+        self.assertEqual(len(statements), 1)
+
+    def test_requested(self):
+        # A request made while private stays pending once the account is public.
+        self.private.follow_requests.add(self.alice, self.erin)
+        User.objects.filter(pk=self.private.pk).update(private=False)
+        self.assertEqual(self.unfollowed(self.alice), ["dave", "erin"])
+        self.assertNotIn("private", self.unfollowed(self.erin))
+        self.assertIn("private", self.unfollowed(self.dave))
+
+
+class FollowCounterTest(GraphQLTestCase):
+    """followersCount and followingCount are kept on the users as they follow."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = cls.create_user("alice")
+        cls.bob = cls.create_user("bob")
+        cls.private = cls.create_user("private", private=True)
+
+    def follow(self, user, followed):
+        with self.captureOnCommitCallbacks(execute=True):
+            data = self.execute(
+                """
+                mutation($id: Int!) {
+                  follow(userId: $id) { user { followersCount followingCount } }
+                }
+                """,
+                {"id": followed.pk},
+                user=user,
+            )
+        return data["follow"]["user"]
+
+    def counts(self, user):
+        user.refresh_from_db()
+        return user.followers_count, user.following_count
+
+    def test_follow(self):
+        self.assertEqual(
+            self.follow(self.alice, self.bob), {"followersCount": 1, "followingCount": 0}
+        )
+        self.assertEqual(self.counts(self.alice), (0, 1))
+        data = self.execute("query { me { followersCount followingCount } }", user=self.alice)
+        self.assertEqual(data["me"], {"followersCount": 0, "followingCount": 1})
+
+    def test_unfollow(self):
+        self.follow(self.alice, self.bob)
+        self.assertEqual(
+            self.follow(self.alice, self.bob), {"followersCount": 0, "followingCount": 0}
+        )
+        self.assertEqual(self.counts(self.alice), (0, 0))
+
+    def test_follow_request(self):
+        self.follow(self.alice, self.private)
+        self.assertEqual(self.counts(self.private), (0, 0))
+        self.execute(
+            "mutation($id: Int!) { acceptFollow(userId: $id) { success } }",
+            {"id": self.alice.pk},
+            user=self.private,
+        )
+        self.assertEqual(self.counts(self.private), (1, 0))
+        self.assertEqual(self.counts(self.alice), (0, 1))
+
+    def test_stale_save_keeps_counts(self):
+        stale = User.objects.get(pk=self.bob.pk)
+        self.follow(self.alice, self.bob)
+        stale.display_name = "Bob"
+        stale.save()
+        self.assertEqual(self.counts(self.bob), (1, 0))
+        self.assertEqual(self.bob.display_name, "Bob")
+
+    def test_reconcile(self):
+        self.bob.followers.add(self.alice, self.private)
+        self.assertEqual(reconcile_follow_counters(User), 3)
+        self.assertEqual(self.counts(self.bob), (2, 0))
+        self.assertEqual(self.counts(self.alice), (0, 1))
+        self.assertEqual(reconcile_follow_counters(User), 0)
+
+
+class FollowRequestsTest(GraphQLTestCase):
+    """Private accounts list, accept and decline their follow requests in bulk."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.private = cls.create_user("private", private=True)
+        cls.requesters = [cls.create_user(f"fan{i}") for i in range(4)]
+        cls.private.follow_requests.add(*cls.requesters)
+        cls.tweet = Tweet.objects.create(user=cls.private, text="Hello")
+
+    def pending(self, first=10, after=None):
+        data = self.execute(
+            """
+            query($first: Int, $after: String) {
+              pendingFollowRequests(first: $first, after: $after) {
+                pageInfo { endCursor hasNextPage }
+                edges { node { username } }
+              }
+            }
+            """,
+            {"first": first, "after": after},
+            user=self.private,
+        )["pendingFollowRequests"]
+        usernames = [edge["node"]["username"] for edge in data["edges"]]
+        return usernames, data["pageInfo"]
+
+    def handle(self, mutation, users):
+        data = self.execute(
+            "mutation($ids: [Int!]!) { %s(userIds: $ids) { success userIds } }" % mutation,
+            {"ids": [user.pk for user in users]},
+            user=self.private,
+        )
+        return data[mutation]["userIds"]
+
+    def test_pending_most_recent_first(self):
+        usernames, page_info = self.pending(first=3)
+        self.assertEqual(usernames, ["fan3", "fan2", "fan1"])
+        usernames, _ = self.pending(first=3, after=page_info["endCursor"])
+        self.assertEqual(usernames, ["fan0"])
+
+    def test_accept(self):
+        fan0, fan1, fan2, _ = self.requesters
+        self.private.followers.add(fan1)
+        accepted = self.handle("acceptFollowRequests", [fan0, fan1, self.private])
+        self.assertEqual(accepted, [fan0.pk, fan1.pk])
+        self.assertEqual(set(self.private.followers.all()), {fan0, fan1})
+        self.assertEqual(self.pending()[0], ["fan3", "fan2"])
+        self.private.refresh_from_db()
+        fan0.refresh_from_db()
+        self.assertEqual(self.private.followers_count, 1)
+        self.assertEqual(fan0.following_count, 1)
+        self.assertTrue(fan0.timeline_entries.filter(tweet=self.tweet).exists())
+        self.assertFalse(fan2.timeline_entries.exists())
+
+    def test_decline(self):
+        fan0, fan1, _, _ = self.requesters
+        self.assertEqual(self.handle("declineFollowRequests", [fan1, fan0]), [fan0.pk, fan1.pk])
+        self.assertEqual(self.pending()[0], ["fan3", "fan2"])
+        self.assertFalse(self.private.followers.exists())
+        self.assertEqual(self.handle("declineFollowRequests", [fan0]), [])
+
+    def test_too_many(self):
+        response = self.post(
+            "mutation($ids: [Int!]!) { acceptFollowRequests(userIds: $ids) { success } }",
+            {"ids": list(range(1, MAX_FOLLOW_REQUESTS + 2))},
+            user=self.private,
+        )
+        self.assertIn("errors", response)
+        self.assertEqual(len(self.pending()[0]), 4)
+
+
+@override_settings(EMAIL_OUTBOX_RETRY_DELAY=60, EMAIL_OUTBOX_MAX_ATTEMPTS=3)
+class OutboxTest(GraphQLTestCase):
+    """Queued emails are sent by send_queued_emails, on the locmem backend."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = cls.create_user("alice")
+        cls.alice.queue_email("Welcome", "Hello alice")
+        cls.alice.queue_email("Reminder", "Hello again")
+
+    def failing_send(self):
+        return mock.patch.object(
+            mail.EmailMessage, "send", side_effect=SMTPException("Server down")
+        )
+
+    def make_due(self):
+        QueuedEmail.objects.update(next_attempt_at=timezone.now())
+
+    def test_send(self):
+        self.assertEqual(send_queued_emails(), (2, 0))
+        self.assertEqual(
+            [(message.subject, message.to) for message in mail.outbox],
+            [("Welcome", ["alice@example.com"]), ("Reminder", ["alice@example.com"])],
+        )
+        for email in QueuedEmail.objects.all():
+            self.assertIsNotNone(email.sent_at)
+            self.assertEqual(email.attempts, 1)
+        self.make_due()
+        self.assertEqual(send_queued_emails(), (0, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_claim_leases(self):
+        before = timezone.now()
+        [claimed] = claim_batch(1)
+        leased = QueuedEmail.objects.filter(next_attempt_at__gte=before + LEASE)
+        self.assertEqual(list(leased), [claimed])
+        # Another worker only finds the email that wasn't claimed.
+        [email] = claim_batch(10)
+        self.assertNotEqual(email, claimed)
+        self.assertEqual(claim_batch(10), [])
+        self.assertEqual(mail.outbox, [])
+
+    def test_retry_with_backoff(self):
+        for attempt, delay in ((1, 60), (2, 120)):
+            before = timezone.now()
+            with self.failing_send():
+                self.assertEqual(send_queued_emails(), (0, 2))
+            for email in QueuedEmail.objects.all():
+                self.assertEqual(email.attempts, attempt)
+                self.assertEqual(email.last_error, "Server down")
+                self.assertIsNone(email.sent_at)
+                backoff = timedelta(seconds=delay)
+                self.assertGreaterEqual(email.next_attempt_at, before + backoff)
+                self.assertLessEqual(email.next_attempt_at, timezone.now() + backoff)
+            # Not due yet.
+            self.assertEqual(send_queued_emails(), (0, 0))
+            self.make_due()
+        self.assertEqual(send_queued_emails(), (2, 0))
+        attempts = QueuedEmail.objects.values_list("attempts", flat=True)
+        self.assertEqual(set(attempts), {3})
+
+    def test_connection_failure(self):
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.open",
+            side_effect=SMTPException("Connection refused"),
+        ):
+            self.assertEqual(send_queued_emails(), (0, 2))
+        self.assertEqual(
+            set(QueuedEmail.objects.values_list("attempts", "last_error")),
+            {(1, "Connection refused")},
+        )
+
+    def test_given_up(self):
+        for _ in range(3):
+            with self.failing_send():
+                self.assertEqual(send_queued_emails(), (0, 2))
+            self.make_due()
+        self.assertEqual(send_queued_emails(), (0, 0))
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(
+            set(QueuedEmail.objects.values_list("attempts", "sent_at")), {(3, None)}
+        )
@@ -0,0 +1,51 @@
+import time
+from hashlib import sha256
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from graphql_jwt.utils import get_payload, get_user_by_payload
+
+
+def get_generation_key(user_id):
+    return f"jwt-user:generation:{user_id}"
+
+
+def get_user_by_token(token, request=None):
+    """
+    The user of a JWT, like graphql_jwt.shortcuts.get_user_by_token, but the
+    user of a verified token is cached for JWT_USER_CACHE_TIMEOUT seconds,
+    or until the token expires, so most requests neither decode the token
+    nor load the user.
+    """
+    key = f"jwt-user:{sha256(token.encode()).hexdigest()}"
+    cached = cache.get(key)
+    if cached is not None:
+        user, generation = cached
+        if cache.get(get_generation_key(user.pk)) == generation:
+            return user
+
+    payload = get_payload(token, request)
+    user = get_user_by_payload(payload)
+    if user is None:
+        return None
+    timeout = settings.JWT_USER_CACHE_TIMEOUT
+    if "exp" in payload:
+        timeout = min(timeout, int(payload["exp"] - time.time()))
+    if timeout > 0:
+        generation = cache.get_or_set(
+            get_generation_key(user.pk), lambda: uuid4().hex, timeout=None
+        )
+        cache.set(key, (user, generation), timeout)
+    return user
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Drop the cached tokens of a user once the current transaction commits,
+    so no request can cache what was read before the change.
+    """
+    transaction.on_commit(
+        lambda: cache.set(get_generation_key(user_id), uuid4().hex, timeout=None)
+    )